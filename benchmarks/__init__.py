@@ -0,0 +1,2 @@
+# Offline benchmarks for the video pipeline and the detection state machine.
+# Run with ``python -m benchmarks --help``.
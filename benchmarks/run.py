@@ -0,0 +1,367 @@
+import argparse
+import json
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from carepattern.core import batching, detect, events, jobs, models, profiles, zones
+from carepattern.core.motion import MotionGate
+from carepattern.core.tracker import KeypointTracker
+from carepattern.core.video import _process_video_file
+
+from .synthetic import Script, ScriptedPoseModel, draw_frame, write_video
+
+# Benchmark runner. Results are written as JSON; with --baseline every metric
+# is compared against an earlier result file and the run fails (exit code 1)
+# when one regressed by more than --threshold.
+
+MODEL_PATH = "scripted-pose"
+
+# metric path -> True when higher is better
+_DIRECTIONS = {
+    "fps": True,
+    "latency_seconds": False,
+    "peak_rss_mb": False,
+}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def bench_pipeline(script: Script, work_dir: Path, render_mode: str, queue_size: int) -> Dict[str, Any]:
+    """End to end ``_process_video_file`` on the synthetic video."""
+    folder = work_dir / f"pipeline_{render_mode}"
+    folder.mkdir()
+    raw = write_video(script, folder / "raw.mp4")
+    job_id = jobs.create_job()
+    profile = profiles.get()
+    options = {"queue_size": queue_size, "render_mode": render_mode, "profile": profile}
+    # warm the pool entry the job will use, so model set-up isn't part of its latency
+    models.release(models.acquire(MODEL_PATH, **profiles.inference_settings(profile)))
+
+    t0 = time.perf_counter()
+    _process_video_file(str(raw), str(folder / "overlay.mp4"), str(folder / "skeleton.mp4"), job_id,
+                        model_path=MODEL_PATH, options=options)
+    latency = time.perf_counter() - t0
+
+    job = jobs.get_job(job_id)
+    if job["status"] != "done":
+        raise RuntimeError(f"pipeline job failed: {job.get('error') or job['status']}")
+    stages = {name: {"fps": s["fps"], "busy_seconds": s["busy_seconds"]} for name, s in (job.get("stages") or {}).items()}
+    return {
+        "frames": script.frames,
+        "latency_seconds": round(latency, 3),
+        "fps": round(script.frames / latency, 2),
+        "stages": stages,
+        "events": len(events.read_events(folder) or []),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def bench_detect(script: Script, work_dir: Path, repeat: int) -> Dict[str, Any]:
+    """``detect.process_tracks`` alone, over the scripted keypoints."""
+    prediction = work_dir / "detect" / "prediction.txt"
+    prediction.parent.mkdir()
+    frames = script.frames * repeat
+    t0 = time.perf_counter()
+    for r in range(repeat):
+        job_id = f"bench-detect-{r}"
+        for f in range(script.frames):
+            ids, _, kps = script.frame(f)
+            detect.process_tracks(ids, kps, f, prediction, script.fps, job_id)
+        events.close_writer(prediction)
+        detect.forget_job(job_id)
+    elapsed = time.perf_counter() - t0
+    return {
+        "frames": frames,
+        "latency_seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def bench_stride(script: Script, work_dir: Path, stride: int) -> Dict[str, Any]:
+    """
+    Transitions of ``detect.process_tracks`` on every ``stride``-th frame
+    against a full-rate run. A transition may be ``stride - 1`` frames off,
+    one that directly follows another (sitting down, then lying) up to twice that.
+    """
+    transitions = {}
+    for s in (1, stride):
+        prediction = work_dir / f"stride_{s}" / "prediction.txt"
+        prediction.parent.mkdir()
+        job_id = f"bench-stride-{s}"
+        for f in range(0, script.frames, s):
+            ids, _, kps = script.frame(f)
+            detect.process_tracks(ids, kps, f, prediction, script.fps, job_id, s)
+        events.close_writer(prediction)
+        detect.forget_job(job_id)
+        transitions[s] = _transitions(prediction)
+
+    result = {"stride": stride}
+    result.update(_compare_transitions(transitions[1], transitions[stride]))
+    result["tolerance_frames"] = 2 * (stride - 1)
+    return result
+
+
+def _transitions(prediction: Path) -> Dict[int, List[Tuple[str, int]]]:
+    per_track: Dict[int, List[Tuple[str, int]]] = {}
+    for e in events.read_events(prediction.parent) or []:
+        per_track.setdefault(e["track_id"], []).append((e["to"], e["frame"]))
+    return per_track
+
+
+def _compare_transitions(full: Dict[int, List[Tuple[str, int]]], other: Dict[int, List[Tuple[str, int]]]) -> Dict[str, Any]:
+    offsets, unmatched = [], 0
+    for tid, seq in full.items():
+        seq_other = other.get(tid, [])
+        unmatched += abs(len(seq) - len(seq_other))
+        for (to, frame), (to_o, frame_o) in zip(seq, seq_other):
+            if to != to_o:
+                unmatched += 1
+            else:
+                offsets.append(abs(frame - frame_o))
+    return {
+        "transitions": sum(len(t) for t in full.values()),
+        "unmatched": unmatched,
+        "max_offset_frames": max(offsets, default=0),
+    }
+
+
+def bench_motion(script: Script, still: Script, work_dir: Path, max_skip_seconds: float = 2.0) -> Dict[str, Any]:
+    """
+    Motion gating: skip rate and gate cost per frame on ``still`` (the script
+    drawn without keypoint jitter, like a still room on camera), and the
+    transitions with carried-forward keypoints against those of every frame.
+    """
+    gate = MotionGate(max_skip=int(max_skip_seconds * script.fps))
+    transitions = {}
+    gate_seconds = 0.0
+    for mode in ("full", "gated"):
+        prediction = work_dir / f"motion_{mode}" / "prediction.txt"
+        prediction.parent.mkdir()
+        job_id = f"bench-motion-{mode}"
+        carried = None
+        for f in range(script.frames):
+            ids, _, kps = script.frame(f)
+            if mode == "gated":
+                frame = draw_frame(still, f)
+                t0 = time.perf_counter()
+                analyse = gate.should_analyse(frame)
+                gate_seconds += time.perf_counter() - t0
+                if analyse or carried is None:
+                    carried = (ids, kps)
+                ids, kps = carried
+            detect.process_tracks(ids, kps, f, prediction, script.fps, job_id)
+        events.close_writer(prediction)
+        detect.forget_job(job_id)
+        transitions[mode] = _transitions(prediction)
+    result = gate.as_dict()
+    result["gate_ms"] = round(gate_seconds * 1000 / max(1, script.frames), 3)
+    result.update(_compare_transitions(transitions["full"], transitions["gated"]))
+    return result
+
+
+def bench_zones(script: Script, work_dir: Path) -> Dict[str, Any]:
+    """
+    Zone checks on the scripted persons: every person has a bed zone over the
+    lower part of their column, so sitting down and lying enter it and
+    standing up leaves it. Reports the cost per frame, the zone events next to
+    the posture transitions, and the share of the frame the ROI crop keeps.
+    """
+    persons = len(script.ids)
+    zone_map = {}
+    for p in range(persons):
+        x1, x2 = (p + 0.5) / (persons + 1), (p + 1.5) / (persons + 1)
+        zone_map[f"bed_{p + 1}"] = [(x1, 0.7), (x2, 0.7), (x2, 1.0), (x1, 1.0)]
+    prediction = work_dir / "zones" / "prediction.txt"
+    prediction.parent.mkdir()
+    monitor = zones.ZoneMonitor(zones.ZoneIndex(zone_map, script.width, script.height), prediction, script.fps)
+    job_id = "bench-zones"
+    zone_seconds = 0.0
+    for f in range(script.frames):
+        ids, boxes, kps = script.frame(f)
+        detect.process_tracks(ids, kps, f, prediction, script.fps, job_id)
+        t0 = time.perf_counter()
+        monitor.update(ids, boxes, kps, f)
+        zone_seconds += time.perf_counter() - t0
+    events.close_writer(prediction)
+    detect.forget_job(job_id)
+    found = events.read_events(prediction.parent) or []
+    x1, y1, x2, y2 = zones.roi_box(zone_map, script.width, script.height) or (0, 0, script.width, script.height)
+    return {
+        "zones": len(zone_map),
+        "zone_ms": round(zone_seconds * 1000 / max(1, script.frames), 3),
+        "enter_events": monitor.entered,
+        "exit_events": monitor.exited,
+        "posture_transitions": sum(1 for e in found if "zone" not in e),
+        "roi_share": round((x2 - x1) * (y2 - y1) / (script.width * script.height), 3),
+    }
+
+
+def _ultralytics_boxes(boxes: np.ndarray, script: Script):
+    import torch
+    from ultralytics.engine.results import Boxes
+
+    data = np.column_stack([boxes[:, :5], np.zeros(len(boxes))]) if len(boxes) else np.zeros((0, 6))
+    return Boxes(torch.as_tensor(data, dtype=torch.float32), (script.height, script.width)).cpu().numpy()
+
+
+def bench_tracker(script: Script, drop_rate: float, seed: int = 0) -> Dict[str, Any]:
+    """
+    The in-house KeypointTracker against the ultralytics tracker model.track
+    uses, on the scripted detections (shuffled, some dropped): identity
+    switches against the script's person IDs and time per frame.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for f in range(script.frames):
+        ids, boxes, kps = script.frame(f)
+        keep = rng.permutation(len(ids))
+        keep = keep[rng.random(len(keep)) >= drop_rate]
+        frames.append((ids[keep], boxes[keep], kps[keep]))
+
+    def run_one(update) -> Dict[str, Any]:
+        last: Dict[int, int] = {}
+        switches = 0
+        t0 = time.perf_counter()
+        for f, (ids, boxes, kps) in enumerate(frames):
+            for row in update(f, boxes, kps):
+                truth, tid = int(ids[int(row[-1])]), int(row[4])
+                if truth in last and last[truth] != tid:
+                    switches += 1
+                last[truth] = tid
+        elapsed = time.perf_counter() - t0
+        return {"id_switches": switches, "frame_ms": round(elapsed * 1000 / len(frames), 3),
+                "fps": round(len(frames) / elapsed, 2)}
+
+    keypoint_tracker = KeypointTracker()
+    results = {"persons": len(script.ids), "drop_rate": drop_rate,
+               "keypoint": run_one(lambda f, b, k: keypoint_tracker.update(b[:, :4], b[:, 4], k))}
+    try:
+        reference = batching._make_tracker("ultralytics")
+    except (ImportError, TypeError) as e:
+        # missing ultralytics, or a release whose tracker constructor changed:
+        # report it rather than losing the other scenarios
+        results["ultralytics"] = {"skipped": f"{type(e).__name__}: {e}"}
+        return results
+    blank = np.zeros((script.height, script.width, 3), dtype=np.uint8)
+    results["ultralytics"] = run_one(lambda f, b, k: reference.update(_ultralytics_boxes(b, script), blank))
+    return results
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            out.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and key in _DIRECTIONS:
+            out[path] = value
+    return out
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Tuple[str, float, float]]:
+    """Metrics that regressed by more than ``threshold`` (fraction) against ``baseline``."""
+    base = _flatten(baseline.get("results", {}))
+    regressions = []
+    for path, value in _flatten(current.get("results", {})).items():
+        old = base.get(path)
+        if not old:
+            continue
+        higher_is_better = _DIRECTIONS[path.rsplit(".", 1)[-1]]
+        change = (value - old) / old
+        if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+            regressions.append((path, old, value))
+    return regressions
+
+
+def run(frames: int, width: int, height: int, persons: int, fps: float, inference_ms: float,
+        render_mode: str, queue_size: int, detect_repeat: int, scenarios: List[str], stride: int = 3,
+        tracker_persons: int = 20, drop_rate: float = 0.05) -> Dict[str, Any]:
+    script = Script(frames, persons, width, height, fps)
+    models.set_factory(lambda path: ScriptedPoseModel(script, latency=inference_ms / 1000.0))
+    # measure the job itself, not event flushing in between
+    events.configure(flush_events=256, flush_seconds=5.0)
+    work_dir = Path(tempfile.mkdtemp(prefix="carepattern_bench_"))
+    results: Dict[str, Any] = {}
+    try:
+        if "detect" in scenarios:
+            results["detect"] = bench_detect(script, work_dir, detect_repeat)
+        if "stride" in scenarios:
+            results["stride"] = bench_stride(script, work_dir, stride)
+        if "motion" in scenarios:
+            still = Script(frames, persons, width, height, fps, noise=0.0)
+            results["motion"] = bench_motion(script, still, work_dir)
+        if "tracker" in scenarios:
+            # postures blend over half a second: no tracker follows a person that jumps across the frame
+            crowd = Script(frames, tracker_persons, width, height, fps, transition_seconds=0.5)
+            results["tracker"] = bench_tracker(crowd, drop_rate)
+        if "zones" in scenarios:
+            results["zones"] = bench_zones(script, work_dir)
+        if "pipeline" in scenarios:
+            results["pipeline"] = bench_pipeline(script, work_dir, render_mode, queue_size)
+    finally:
+        models.set_factory(None)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "frames": frames, "width": width, "height": height, "persons": persons, "fps": fps,
+            "inference_ms": inference_ms, "render_mode": render_mode, "queue_size": queue_size,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Offline benchmarks with synthetic videos and a scripted pose model.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--persons", type=int, default=3)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--inference-ms", type=float, default=0.0, help="simulated inference time per frame")
+    parser.add_argument("--render-mode", choices=("eager", "lazy"), default="eager")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--detect-repeat", type=int, default=5, help="passes over the script for the detect scenario")
+    parser.add_argument("--stride", type=int, default=3, help="frame stride compared against full rate (stride scenario)")
+    parser.add_argument("--tracker-persons", type=int, default=20, help="persons in the tracker scenario")
+    parser.add_argument("--drop-rate", type=float, default=0.05, help="share of detections dropped in the tracker scenario")
+    parser.add_argument("--scenario", action="append", choices=("pipeline", "detect", "stride", "motion", "tracker", "zones"),
+                        help="scenarios to run (default: all)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed regression as a fraction (default 0.15)")
+    args = parser.parse_args(argv)
+
+    result = run(args.frames, args.width, args.height, args.persons, args.fps, args.inference_ms,
+                 args.render_mode, args.queue_size, args.detect_repeat,
+                 args.scenario or ["pipeline", "detect", "stride", "motion", "tracker", "zones"], max(1, args.stride),
+                 args.tracker_persons, args.drop_rate)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for path, old, new in regressions:
+            print(f"REGRESSION {path}: {old} -> {new}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
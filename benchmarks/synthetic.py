@@ -0,0 +1,146 @@
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+# Synthetic workload: scripted keypoint trajectories (standing, sitting down,
+# standing up, lying down), a video that draws them, and a stub pose model
+# that replays the script instead of running inference.
+
+# COCO keypoint order
+NOSE, L_SHOULDER, R_SHOULDER, L_HIP, R_HIP, L_KNEE, R_KNEE, L_ANKLE, R_ANKLE = 0, 5, 6, 11, 12, 13, 14, 15, 16
+SKELETON = [(5, 6), (5, 11), (6, 12), (11, 12), (11, 13), (12, 14), (13, 15), (14, 16), (5, 7), (7, 9), (6, 8), (8, 10)]
+
+# posture cycle of every person: (posture, share of the cycle)
+CYCLE = [("standing", 0.25), ("sitting", 0.25), ("standing", 0.2), ("lying", 0.2), ("standing", 0.1)]
+
+
+def _pose(posture: str, cx: float, base: float, scale: float) -> np.ndarray:
+    """(17, 3) keypoints of one posture; ``base`` is the floor line, ``scale`` the standing height."""
+    kp = np.zeros((17, 3), dtype=np.float32)
+    kp[:, 2] = 0.9
+    if posture == "lying":
+        # horizontal: head left, feet right, all at the same height
+        y = base - 0.08 * scale
+        xs = {NOSE: -0.45, L_SHOULDER: -0.3, R_SHOULDER: -0.3, 7: -0.15, 8: -0.15, 9: 0.0, 10: 0.0,
+              L_HIP: 0.05, R_HIP: 0.05, L_KNEE: 0.25, R_KNEE: 0.25, L_ANKLE: 0.45, R_ANKLE: 0.45}
+        for i in range(17):
+            kp[i, 0] = cx + xs.get(i, -0.45) * scale
+            kp[i, 1] = y + (0.03 * scale if i in (R_SHOULDER, R_HIP, R_KNEE, R_ANKLE) else 0.0)
+        return kp
+    if posture == "sitting":
+        ys = {NOSE: 0.55, L_SHOULDER: 0.45, R_SHOULDER: 0.45, 7: 0.32, 8: 0.32, 9: 0.22, 10: 0.22,
+              L_HIP: 0.2, R_HIP: 0.2, L_KNEE: 0.2, R_KNEE: 0.2, L_ANKLE: 0.0, R_ANKLE: 0.0}
+        dx = {L_KNEE: 0.2, R_KNEE: 0.2, L_ANKLE: 0.2, R_ANKLE: 0.2}
+    else:
+        ys = {NOSE: 0.95, L_SHOULDER: 0.8, R_SHOULDER: 0.8, 7: 0.62, 8: 0.62, 9: 0.45, 10: 0.45,
+              L_HIP: 0.5, R_HIP: 0.5, L_KNEE: 0.25, R_KNEE: 0.25, L_ANKLE: 0.0, R_ANKLE: 0.0}
+        dx = {}
+    for i in range(17):
+        side = -1 if i % 2 else 1
+        kp[i, 0] = cx + side * 0.08 * scale + dx.get(i, 0.0) * scale
+        kp[i, 1] = base - ys.get(i, 0.95) * scale
+    return kp
+
+
+class Script:
+    """
+    Keypoints of ``persons`` people over ``frames`` frames; frame ``i`` is
+    ``frame(i)``. Postures change at once, or blend over ``transition_seconds``;
+    ``noise`` is the keypoint jitter in pixels (as from a pose model).
+    """
+
+    def __init__(self, frames: int, persons: int, width: int, height: int, fps: float = 30.0,
+                 cycle_seconds: float = 8.0, seed: int = 0, transition_seconds: float = 0.0, noise: float = 1.5):
+        rng = np.random.default_rng(seed)
+        self.frames = frames
+        self.width = width
+        self.height = height
+        self.fps = fps
+        # absolute size: the detection thresholds are in pixels
+        scale = max(0.8 * height, 420.0)
+        base = height - 0.05 * height
+        cycle = max(1, int(cycle_seconds * fps))
+        bounds = np.cumsum([0] + [int(share * cycle) for _, share in CYCLE])
+        blend = int(transition_seconds * fps)
+
+        self.ids = np.arange(1, persons + 1, dtype=np.int64)
+        self.keypoints = np.zeros((frames, persons, 17, 3), dtype=np.float32)
+        for p in range(persons):
+            cx = width * (p + 1) / (persons + 1)
+            offset = int(rng.integers(0, cycle))
+            for f in range(frames):
+                t = (f + offset) % cycle
+                phase = min(int(np.searchsorted(bounds, t, side="right")) - 1, len(CYCLE) - 1)
+                pose = _pose(CYCLE[phase][0], cx, base, scale)
+                since = t - bounds[phase]
+                if since < blend:
+                    previous = _pose(CYCLE[phase - 1][0], cx, base, scale)
+                    alpha = (since + 1) / (blend + 1)
+                    pose = previous + (pose - previous) * alpha
+                self.keypoints[f, p] = pose
+            self.keypoints[:, p, :, :2] += rng.normal(0, noise, size=(frames, 17, 2)).astype(np.float32)
+
+        xy = self.keypoints[..., :2]
+        self.boxes = np.zeros((frames, persons, 6), dtype=np.float32)
+        self.boxes[..., :2] = xy.min(axis=2) - 10
+        self.boxes[..., 2:4] = xy.max(axis=2) + 10
+        self.boxes[..., 4] = 0.9
+
+    def frame(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        i = min(i, self.frames - 1)
+        return self.ids, self.boxes[i], self.keypoints[i]
+
+
+def draw_frame(script: Script, f: int) -> np.ndarray:
+    """Frame ``f`` of the script as stick figures."""
+    frame = np.full((script.height, script.width, 3), 60, dtype=np.uint8)
+    for kp in script.keypoints[f]:
+        pts = kp[:, :2].astype(np.int32)
+        for a, b in SKELETON:
+            cv2.line(frame, tuple(int(v) for v in pts[a]), tuple(int(v) for v in pts[b]), (220, 220, 220), 4)
+        cv2.circle(frame, tuple(int(v) for v in pts[NOSE]), 12, (220, 220, 220), -1)
+    return frame
+
+
+def write_video(script: Script, path: Path) -> Path:
+    """Draw the script as stick figures into an MP4 file."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), script.fps, (script.width, script.height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot write {path}")
+    try:
+        for f in range(script.frames):
+            writer.write(draw_frame(script, f))
+    finally:
+        writer.release()
+    return path
+
+
+class ScriptedPoseModel:
+    """
+    Stand-in for the YOLO pose model: ``track()`` returns the script's next
+    frame as ultralytics Results, optionally after ``latency`` seconds to
+    simulate inference. The frame counter restarts when the tracker is reset,
+    which the model pool does after warm-up and after every job.
+    """
+
+    def __init__(self, script: Script, latency: float = 0.0):
+        self.script = script
+        self.latency = latency
+        self.index = 0
+        self.predictor = SimpleNamespace(trackers=[self])
+
+    def reset(self) -> None:
+        self.index = 0
+
+    def track(self, frame, persist: bool = True, classes: List[int] = None, verbose: bool = False, **kwargs):
+        from carepattern.core.render import build_results
+
+        ids, boxes, kps = self.script.frame(self.index)
+        self.index += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [build_results(frame, ids, boxes, kps, {0: "person"})]
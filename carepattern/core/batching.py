@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import models
+from .tracker import KeypointTracker, track_results
+
+# Cross-job micro-batching. Jobs that run in this process send their frames
+# to one InferenceService per (model, inference settings); the service
+# collects them into batches of at most ``max_batch`` frames, waiting at most
+# ``max_wait_ms`` for a batch to fill, and runs a single ``predict`` per batch.
+# Tracking stays per job: every job has its own ultralytics tracker, updated
+# in frame order with that job's detections, exactly as ``model.track`` does
+# it (or the in-house KeypointTracker), so track IDs are as stable as before
+# and never mix between jobs.
+
+_config = {
+    "max_batch": 8,
+    "max_wait_ms": 5.0,
+    "tracker_config": "botsort.yaml",  # ultralytics tracker; the one model.track uses by default
+}
+
+_lock = threading.Lock()
+_services: Dict[Tuple, "InferenceService"] = {}
+
+
+def configure(max_batch: Optional[int] = None, max_wait_ms: Optional[float] = None,
+              tracker_config: Optional[str] = None) -> None:
+    if max_batch is not None:
+        _config["max_batch"] = max(1, int(max_batch))
+    if max_wait_ms is not None:
+        _config["max_wait_ms"] = max(0.0, float(max_wait_ms))
+    if tracker_config:
+        _config["tracker_config"] = tracker_config
+
+
+class InferenceService:
+    """Batches frames of all connected jobs; runs while at least one job is connected."""
+
+    def __init__(self, model_path: str, settings: Dict[str, Any]):
+        self.model_path = model_path
+        self.settings = dict(settings)
+        self.cond = threading.Condition()
+        self.pending: List[Tuple[Any, Future]] = []
+        self.clients = 0
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.batches = 0
+        self.frames = 0
+        self.largest = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self) -> bool:
+        with self.cond:
+            if self.closed:
+                return False
+            self.clients += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="inference-batch", daemon=True)
+                self._thread.start()
+            return True
+
+    def unregister(self) -> None:
+        with self.cond:
+            self.clients -= 1
+            self.cond.notify_all()
+
+    def submit(self, frame) -> Future:
+        future: Future = Future()
+        with self.cond:
+            if self.closed:
+                future.set_exception(self.error or RuntimeError(f"Inferentie service is gestopt: {self.model_path}"))
+                return future
+            self.pending.append((frame, future))
+            self.cond.notify_all()
+        return future
+
+    def _next_batch(self) -> Optional[List[Tuple[Any, Future]]]:
+        max_batch = _config["max_batch"]
+        with self.cond:
+            while not self.pending:
+                if not self.clients:
+                    self.closed = True
+                    return None
+                self.cond.wait()
+            deadline = time.monotonic() + _config["max_wait_ms"] / 1000.0
+            while len(self.pending) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = self.pending[:max_batch]
+            del self.pending[:max_batch]
+            return batch
+
+    def _run(self) -> None:
+        model = None
+        try:
+            model = models.acquire(self.model_path, tracking=False, **self.settings)
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                try:
+                    results = model.predict([frame for frame, _ in batch], classes=[0], verbose=False, **self.settings)
+                    if len(results) != len(batch):
+                        raise RuntimeError(f"{len(results)} resultaten voor {len(batch)} frames")
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                with self.cond:
+                    self.batches += 1
+                    self.frames += len(batch)
+                    self.largest = max(self.largest, len(batch))
+        except Exception as e:
+            # e.g. the model failed to load: fail whatever is waiting, later submits included
+            with self.cond:
+                self.closed = True
+                self.error = e
+                failed, self.pending = self.pending, []
+            for _, future in failed:
+                future.set_exception(e)
+        finally:
+            if model is not None:
+                models.release(model)
+            with _lock:
+                key = models._make_key(self.model_path, self.settings)
+                if _services.get(key) is self:
+                    del _services[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "model": self.model_path,
+                "settings": dict(self.settings),
+                "clients": self.clients,
+                "queued": len(self.pending),
+                "batches": self.batches,
+                "frames": self.frames,
+                "mean_batch": round(self.frames / self.batches, 2) if self.batches else None,
+                "largest_batch": self.largest,
+            }
+
+
+def _make_tracker(kind: str = "ultralytics"):
+    """A fresh KeypointTracker, or an ultralytics tracker as ``model.track`` creates it."""
+    if kind == "keypoint":
+        return KeypointTracker()
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    config_name = _config["tracker_config"]
+    try:
+        from ultralytics.utils import YAML
+        cfg = YAML.load(check_yaml(config_name))
+    except ImportError:
+        from ultralytics.utils import yaml_load
+        cfg = yaml_load(check_yaml(config_name))
+    cfg = IterableSimpleNamespace(**cfg)
+    # like ultralytics.trackers.track.on_predict_start: only ``args``; older
+    # releases default frame_rate to 30, 8.4 no longer accepts it
+    return TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+
+class BatchClient:
+    """
+    One job's connection to the service. ``submit`` queues a frame for
+    inference (frames may be submitted ahead); ``track`` takes the results in
+    frame order and runs them through the job's own tracker.
+    """
+
+    def __init__(self, service: InferenceService, tracker):
+        self.service = service
+        self.tracker = tracker
+
+    def submit(self, frame) -> Future:
+        return self.service.submit(frame)
+
+    def track(self, frame, pending: Future):
+        """Results of a submitted frame, like ``model.track(frame, persist=True)`` returns them."""
+        return [track_results(self.tracker, pending.result(), frame)]
+
+    def close(self) -> None:
+        if self.service is not None:
+            self.service.unregister()
+            self.service = None
+
+
+def connect(model_path: str, tracker: str = "ultralytics", **settings) -> BatchClient:
+    """
+    Join (or start) the inference service of ``model_path``/``settings``; pair
+    with ``close``. ``tracker`` is ``ultralytics`` or ``keypoint``.
+    """
+    tracker = _make_tracker(tracker)
+    key = models._make_key(model_path, settings)
+    with _lock:
+        service = _services.get(key)
+        if service is None or not service.register():
+            service = InferenceService(str(model_path), settings)
+            service.register()
+            _services[key] = service
+    return BatchClient(service, tracker)
+
+
+def get_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        services = list(_services.values())
+    return [s.stats() for s in services]
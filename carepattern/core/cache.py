@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from .events import EVENTS_FILENAME
+from .keypoints import ARCHIVE_DIRNAME
+
+# Content-addressed result cache. Uploads are hashed while they are saved; the
+# results of a finished job are stored under a key of the content hash, the
+# model and the detection settings, so an identical upload (under any name)
+# is finished by hard-linking the cached files into its folder. Entries are
+# evicted least-recently-viewed first once the cache exceeds its size limit.
+#
+#   <cache dir>/<key>/     overlay.mp4, skeleton.mp4, prediction.txt,
+#                          events.jsonl, keypoints/, entry.json
+
+ARTIFACTS = ("overlay.mp4", "skeleton.mp4", "prediction.txt", EVENTS_FILENAME, ARCHIVE_DIRNAME)
+ENTRY_FILENAME = "entry.json"
+
+_CHUNK_SIZE = 1 << 20
+
+_lock = threading.Lock()
+_config: Dict[str, Any] = {
+    "root": None,        # cache directory; None disables the cache
+    "max_bytes": 10 << 30,
+}
+
+
+def configure(root: Optional[str] = None, max_bytes: Optional[int] = None) -> None:
+    if root is not None:
+        _config["root"] = Path(root)
+        _config["root"].mkdir(parents=True, exist_ok=True)
+    if max_bytes is not None:
+        _config["max_bytes"] = int(max_bytes)
+
+
+def enabled() -> bool:
+    return _config["root"] is not None
+
+
+def get_root() -> Optional[Path]:
+    return _config["root"]
+
+
+def save_hashed(stream: BinaryIO, path: str) -> str:
+    """Write ``stream`` to ``path`` and return the sha256 of its content."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            chunk = stream.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash: str, model_path: str, thresholds: Tuple, **settings: Any) -> str:
+    """Key of the results of ``content_hash`` analysed with this model and these settings."""
+    payload = json.dumps({
+        "content": content_hash,
+        "model": str(model_path),
+        "thresholds": list(thresholds),
+        "settings": settings,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry(key: str) -> Optional[Path]:
+    if not enabled() or not key:
+        return None
+    return _config["root"] / key
+
+
+def _link(src: Path, dst: Path) -> None:
+    if src.is_dir():
+        dst.mkdir(parents=True, exist_ok=True)
+        for child in src.iterdir():
+            _link(child, dst / child.name)
+        return
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. cache and uploads on different file systems
+        shutil.copy2(src, dst)
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(_size(child) for child in path.iterdir())
+    return path.stat().st_size
+
+
+def clear_artifacts(folder: Path) -> None:
+    """Remove the results of a previous upload with the same name."""
+    folder = Path(folder)
+    for name in ARTIFACTS:
+        p = folder / name
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+
+
+def lookup(key: str, folder: Path) -> bool:
+    """Link the cached results of ``key`` into ``folder``; False on a miss."""
+    entry = _entry(key)
+    if entry is None or not (entry / ENTRY_FILENAME).exists():
+        return False
+    folder = Path(folder)
+    try:
+        clear_artifacts(folder)
+        for name in ARTIFACTS:
+            if (entry / name).exists():
+                _link(entry / name, folder / name)
+    except OSError as e:
+        # evicted while linking; analyse normally
+        print(f"Error reading result cache entry {key}: {e}")
+        clear_artifacts(folder)
+        return False
+    touch(key)
+    return True
+
+
+def store(key: str, folder: Path) -> None:
+    """Add the results in ``folder`` to the cache and evict old entries."""
+    entry = _entry(key)
+    if entry is None:
+        return
+    folder = Path(folder)
+    tmp = _config["root"] / f".{key}.{uuid.uuid4().hex}"
+    try:
+        tmp.mkdir()
+        for name in ARTIFACTS:
+            if (folder / name).exists():
+                _link(folder / name, tmp / name)
+        with open(tmp / ENTRY_FILENAME, "w") as f:
+            json.dump({"key": key, "size": _size(tmp), "created": time.time()}, f)
+        with _lock:
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(keep=key)
+
+
+def touch(key: str) -> None:
+    """Mark an entry as viewed."""
+    entry = _entry(key)
+    if entry is None:
+        return
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+
+
+def _entries() -> List[Tuple[float, int, Path]]:
+    out = []
+    for entry in _config["root"].iterdir():
+        if entry.name.startswith("."):
+            continue
+        try:
+            with open(entry / ENTRY_FILENAME) as f:
+                size = int(json.load(f).get("size", 0))
+            out.append((entry.stat().st_mtime, size, entry))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def evict(keep: Optional[str] = None) -> List[str]:
+    """Remove least-recently-viewed entries until the cache fits its size limit."""
+    if not enabled():
+        return []
+    removed = []
+    with _lock:
+        entries = sorted(_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= _config["max_bytes"]:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed.append(entry.name)
+    return removed
+
+
+def get_stats() -> Dict[str, Any]:
+    if not enabled():
+        return {"enabled": False}
+    with _lock:
+        entries = _entries()
+    return {
+        "enabled": True,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": _config["max_bytes"],
+    }
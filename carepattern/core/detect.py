@@ -1,16 +1,54 @@
-from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 from collections import defaultdict
 import math
 
-job_persons: Dict[str, Dict[int, "Person"]] = defaultdict(dict)
+import numpy as np
+
+from . import events
 
 # thresholds
 KNEE_ANGLE_THRESHOLD_DEG = 150.0
 HIP_KNEE_VERTICAL_THRESHOLD = 75.0
 SHOULDER_HIP_VERTICAL_THRESHOLD = 50.0
 
+# Tracks not seen for this many frames are dropped from the job state. The
+# tracker never reuses an ID, so as long as this exceeds the tracker's own
+# lost-track buffer the transitions are unchanged. 0 disables eviction.
+TRACK_IDLE_FRAMES = 300
+
+
+class Thresholds(NamedTuple):
+    """Detection thresholds; the defaults mirror the module constants."""
+    knee_angle_deg: float = KNEE_ANGLE_THRESHOLD_DEG
+    hip_knee_vertical: float = HIP_KNEE_VERTICAL_THRESHOLD
+    shoulder_hip_vertical: float = SHOULDER_HIP_VERTICAL_THRESHOLD
+    sit_confirm_seconds: float = 0.4
+    min_confirm_frames: int = 3
+    cooldown_seconds: float = 2.0
+
+    # With a frame stride only every ``stride``-th frame is analysed; the
+    # counts below are then in analysed frames, rounded up so a posture must
+    # hold for at least as long as in a full-rate run.
+
+    def threshold_frames(self, fps: float, stride: int = 1) -> int:
+        frames = max(self.min_confirm_frames, int(fps * self.sit_confirm_seconds))
+        return -(-frames // stride)
+
+    def cooldown_frames(self, fps: float, stride: int = 1) -> int:
+        return -(-int(fps * self.cooldown_seconds) // stride)
+
+
+def default_thresholds() -> Thresholds:
+    # read at call time so changes to the module constants take effect
+    return Thresholds(KNEE_ANGLE_THRESHOLD_DEG, HIP_KNEE_VERTICAL_THRESHOLD, SHOULDER_HIP_VERTICAL_THRESHOLD)
+
+
+def configure(track_idle_frames: Optional[int] = None) -> None:
+    global TRACK_IDLE_FRAMES
+    if track_idle_frames is not None:
+        TRACK_IDLE_FRAMES = max(0, int(track_idle_frames))
+
 
 def format_timestamp(frame_number: int, fps: float) -> str:
     total_seconds = frame_number / fps
@@ -74,35 +112,218 @@ def compute_knee_angle(keypoints) -> Optional[float]:
     return None
 
 
-def posture_from_keypoints(keypoints) -> Tuple[float, float, float, Optional[float], bool, bool]:
+def posture_from_keypoints(keypoints, thresholds: Optional[Thresholds] = None) -> Tuple[float, float, float, Optional[float], bool, bool]:
     """
     Returns:
       hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying
     """
+    t = thresholds or default_thresholds()
     hip_y = (_y_of(keypoints, 11) + _y_of(keypoints, 12)) / 2
     knee_y = (_y_of(keypoints, 13) + _y_of(keypoints, 14)) / 2
     shoulder_y = (_y_of(keypoints, 5) + _y_of(keypoints, 6)) / 2
 
     knee_angle_deg = compute_knee_angle(keypoints)
-    is_knee_bent = (knee_angle_deg is not None) and (knee_angle_deg < KNEE_ANGLE_THRESHOLD_DEG)
+    is_knee_bent = (knee_angle_deg is not None) and (knee_angle_deg < t.knee_angle_deg)
 
-    is_sitting = ((abs(hip_y - knee_y) < HIP_KNEE_VERTICAL_THRESHOLD and hip_y != 0 and knee_y != 0)
+    is_sitting = ((abs(hip_y - knee_y) < t.hip_knee_vertical and hip_y != 0 and knee_y != 0)
                   or is_knee_bent)
-    is_lying = (abs(shoulder_y - hip_y) < SHOULDER_HIP_VERTICAL_THRESHOLD and shoulder_y != 0 and hip_y != 0)
+    is_lying = (abs(shoulder_y - hip_y) < t.shoulder_hip_vertical and shoulder_y != 0 and hip_y != 0)
 
     return hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying
 
 
-@dataclass
+class PostureBatch(NamedTuple):
+    """Per-person posture arrays; ``knee_angle`` is NaN where ``compute_knee_angle`` returns None."""
+    hip_y: np.ndarray
+    knee_y: np.ndarray
+    shoulder_y: np.ndarray
+    knee_angle: np.ndarray
+    is_sitting: np.ndarray
+    is_lying: np.ndarray
+
+    def row(self, i) -> Tuple[float, float, float, Optional[float], bool, bool]:
+        """The ``posture_from_keypoints`` tuple for person ``i``."""
+        angle = float(self.knee_angle[i])
+        return (float(self.hip_y[i]), float(self.knee_y[i]), float(self.shoulder_y[i]),
+                None if math.isnan(angle) else angle, bool(self.is_sitting[i]), bool(self.is_lying[i]))
+
+
+def _keypoint_array(keypoints) -> np.ndarray:
+    if hasattr(keypoints, "cpu"):
+        keypoints = keypoints.cpu().numpy()
+    kp = np.asarray(keypoints, dtype=np.float64)
+    if kp.ndim < 2:
+        kp = kp.reshape(-1, 17, 3)
+    # Missing keypoints/coordinates read as 0.0, like _xy_of/_y_of.
+    missing_k = max(0, 17 - kp.shape[-2])
+    missing_c = max(0, 2 - kp.shape[-1])
+    if missing_k or missing_c:
+        pad = [(0, 0)] * (kp.ndim - 2) + [(0, missing_k), (0, missing_c)]
+        kp = np.pad(kp, pad)
+    return kp
+
+
+def posture_batch(keypoints, thresholds: Optional[Thresholds] = None) -> PostureBatch:
+    """
+    Vectorized ``posture_from_keypoints`` for a keypoint tensor of shape
+    (N, 17, C) for one frame or (F, N, 17, C) for many frames.
+    """
+    t = thresholds or default_thresholds()
+    kp = _keypoint_array(keypoints)
+    x = kp[..., 0]
+    y = kp[..., 1]
+
+    hip_y = (y[..., 11] + y[..., 12]) / 2
+    knee_y = (y[..., 13] + y[..., 14]) / 2
+    shoulder_y = (y[..., 5] + y[..., 6]) / 2
+
+    hip_x = (x[..., 11] + x[..., 12]) / 2
+    knee_x = (x[..., 13] + x[..., 14]) / 2
+    ankle_x = (x[..., 15] + x[..., 16]) / 2
+    ankle_y = (y[..., 15] + y[..., 16]) / 2
+
+    # vectors: hip->knee and ankle->knee
+    v1x = hip_x - knee_x
+    v1y = hip_y - knee_y
+    v2x = ankle_x - knee_x
+    v2y = ankle_y - knee_y
+    n1 = np.hypot(v1x, v1y)
+    n2 = np.hypot(v2x, v2y)
+    valid = (n1 > 0) & (n2 > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosang = np.clip((v1x * v2x + v1y * v2y) / (n1 * n2), -1.0, 1.0)
+    knee_angle = np.where(valid, np.degrees(np.arccos(np.where(valid, cosang, 1.0))), np.nan)
+
+    is_knee_bent = valid & (knee_angle < t.knee_angle_deg)
+    is_sitting = ((np.abs(hip_y - knee_y) < t.hip_knee_vertical) & (hip_y != 0) & (knee_y != 0)) | is_knee_bent
+    is_lying = (np.abs(shoulder_y - hip_y) < t.shoulder_hip_vertical) & (shoulder_y != 0) & (hip_y != 0)
+
+    return PostureBatch(hip_y, knee_y, shoulder_y, knee_angle, is_sitting, is_lying)
+
+
+class PersonTable:
+    """
+    Per-job person state. Cooldown timers and last-seen frames live in NumPy
+    arrays (one row per track) so the per-frame cooldown decrement and the
+    idle-track scan are single vectorized operations.
+    """
+
+    def __init__(self, capacity: int = 16, idle_frames: Optional[int] = None, thresholds: Optional[Thresholds] = None):
+        self.idle_frames = TRACK_IDLE_FRAMES if idle_frames is None else idle_frames
+        self.thresholds = thresholds
+        self.sitting_timer = np.zeros(capacity, dtype=np.int32)
+        self.lying_timer = np.zeros(capacity, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=bool)
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._persons: Dict[int, "Person"] = {}
+
+    def _alloc(self) -> int:
+        if not self._free:
+            old = len(self.used)
+            new = old * 2
+            for name in ("sitting_timer", "lying_timer", "last_seen", "used"):
+                arr = getattr(self, name)
+                grown = np.zeros(new, dtype=arr.dtype)
+                grown[:old] = arr
+                setattr(self, name, grown)
+            self._free = list(range(new - 1, old - 1, -1))
+        row = self._free.pop()
+        self.used[row] = True
+        self.sitting_timer[row] = 0
+        self.lying_timer[row] = 0
+        return row
+
+    def _release(self, row: int) -> None:
+        self.used[row] = False
+        self.sitting_timer[row] = 0
+        self.lying_timer[row] = 0
+        self._free.append(row)
+
+    def get(self, tid: int) -> Optional["Person"]:
+        return self._persons.get(tid)
+
+    def create(self, tid: int, **state) -> "Person":
+        person = Person(tid, table=self, **state)
+        self._persons[tid] = person
+        return person
+
+    def values(self):
+        return self._persons.values()
+
+    def __len__(self) -> int:
+        return len(self._persons)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._persons)
+
+    def __contains__(self, tid) -> bool:
+        return tid in self._persons
+
+    def tick(self) -> None:
+        # decrement all active cooldowns at once; free rows are zero
+        np.subtract(self.sitting_timer, 1, out=self.sitting_timer, where=self.sitting_timer > 0)
+        np.subtract(self.lying_timer, 1, out=self.lying_timer, where=self.lying_timer > 0)
+
+    def touch(self, person: "Person", frame_number: int) -> None:
+        self.last_seen[person._row] = frame_number
+
+    def evict_idle(self, frame_number: int) -> List[int]:
+        """Drop tracks not seen for more than ``idle_frames`` frames; returns their IDs."""
+        if not self.idle_frames:
+            return []
+        rows = np.flatnonzero(self.used & (frame_number - self.last_seen > self.idle_frames))
+        if not len(rows):
+            return []
+        rows = set(rows.tolist())
+        evicted = [tid for tid, p in self._persons.items() if p._row in rows]
+        for tid in evicted:
+            self._release(self._persons.pop(tid)._row)
+        return evicted
+
+
+job_persons: Dict[str, PersonTable] = defaultdict(PersonTable)
+
+
 class Person:
-    tid: int
-    state: str = "standing"
-    sitting_frames: int = 0
-    frames_not_sitting: int = 0
-    sitting_count: int = 0
-    lying_count: int = 0
-    active_sitting_timer: int = 0
-    active_lying_timer: int = 0
+    __slots__ = ("tid", "state", "sitting_frames", "frames_not_sitting", "sitting_count", "lying_count", "_table", "_row")
+
+    def __init__(self, tid: int, state: str = "standing", sitting_frames: int = 0, frames_not_sitting: int = 0,
+                 sitting_count: int = 0, lying_count: int = 0, active_sitting_timer: int = 0,
+                 active_lying_timer: int = 0, table: Optional[PersonTable] = None):
+        self.tid = tid
+        self.state = state
+        self.sitting_frames = sitting_frames
+        self.frames_not_sitting = frames_not_sitting
+        self.sitting_count = sitting_count
+        self.lying_count = lying_count
+        # a person created on its own gets a private one-row table
+        self._table = table if table is not None else PersonTable(capacity=1, idle_frames=0)
+        self._row = self._table._alloc()
+        self.active_sitting_timer = active_sitting_timer
+        self.active_lying_timer = active_lying_timer
+
+    @property
+    def active_sitting_timer(self) -> int:
+        return int(self._table.sitting_timer[self._row])
+
+    @active_sitting_timer.setter
+    def active_sitting_timer(self, value: int) -> None:
+        self._table.sitting_timer[self._row] = value
+
+    @property
+    def active_lying_timer(self) -> int:
+        return int(self._table.lying_timer[self._row])
+
+    @active_lying_timer.setter
+    def active_lying_timer(self, value: int) -> None:
+        self._table.lying_timer[self._row] = value
+
+    def __repr__(self) -> str:
+        return (f"Person(tid={self.tid}, state={self.state!r}, sitting_frames={self.sitting_frames}, "
+                f"frames_not_sitting={self.frames_not_sitting}, sitting_count={self.sitting_count}, "
+                f"lying_count={self.lying_count}, active_sitting_timer={self.active_sitting_timer}, "
+                f"active_lying_timer={self.active_lying_timer})")
 
     def tick(self):
         if self.active_sitting_timer > 0:
@@ -110,19 +331,29 @@ class Person:
         if self.active_lying_timer > 0:
             self.active_lying_timer -= 1
 
-    def _log_transition(self, old_state: str, new_state: str, frame_number: int, output_path: Path, fps: float, extra: str = ""):
-        ts = format_timestamp(frame_number, fps)
-        msg = f"{ts} | Person {self.tid} | {old_state} -> {new_state}"
-        if extra:
-            msg += f" | {extra}"
-        with open(output_path, "a") as f:
-            f.write(msg + "\n")
-
-    def update(self, keypoints, frame_number: int, output_path: Path, fps: float):
-        hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying = posture_from_keypoints(keypoints)
-
-        threshold_frames = max(3, int(fps * 0.4))
-        cooldown_frames = int(fps * 2)
+    def _log_transition(self, old_state: str, new_state: str, frame_number: int, output_path: Path, fps: float, extra: str = "",
+                        knee_angle: Optional[float] = None):
+        events.get_writer(output_path).write({
+            "frame": frame_number,
+            "time": format_timestamp(frame_number, fps),
+            "track_id": self.tid,
+            "from": old_state,
+            "to": new_state,
+            "knee_angle": None if knee_angle is None else round(knee_angle, 1),
+            "sitting_count": self.sitting_count,
+            "lying_count": self.lying_count,
+            "note": extra,
+        })
+
+    def update(self, keypoints, frame_number: int, output_path: Path, fps: float, posture: Optional[tuple] = None,
+               stride: int = 1):
+        t = self._table.thresholds or default_thresholds()
+        if posture is None:
+            posture = posture_from_keypoints(keypoints, t)
+        hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying = posture
+
+        threshold_frames = t.threshold_frames(fps, stride)
+        cooldown_frames = t.cooldown_frames(fps, stride)
 
         # update frame counters
         if is_sitting:
@@ -146,7 +377,7 @@ class Person:
                 extra = f"Sat down, count:{self.sitting_count}"
                 if knee_angle_deg is not None:
                     extra += f", knee_angle:{knee_angle_deg:.1f}"
-                self._log_transition(old_state, "sitting", frame_number, output_path, fps, extra)
+                self._log_transition(old_state, "sitting", frame_number, output_path, fps, extra, knee_angle_deg)
                 self.state = "sitting"
 
         elif self.state == "sitting":
@@ -154,7 +385,7 @@ class Person:
                 # sitting -> lying (instant)
                 self.lying_count += 1
                 self.active_lying_timer = cooldown_frames
-                self._log_transition(old_state, "lying", frame_number, output_path, fps, f"Lying down, count:{self.lying_count}")
+                self._log_transition(old_state, "lying", frame_number, output_path, fps, f"Lying down, count:{self.lying_count}", knee_angle_deg)
                 self.state = "lying"
                 # reset sitting trackers
                 self.sitting_frames = 0
@@ -163,7 +394,7 @@ class Person:
                 # require a short consecutive not-sitting to consider stood up
                 if not is_sitting and self.frames_not_sitting >= threshold_frames:
                     # sitting -> standing
-                    self._log_transition(old_state, "standing", frame_number, output_path, fps, "Stood up")
+                    self._log_transition(old_state, "standing", frame_number, output_path, fps, "Stood up", knee_angle_deg)
                     self.state = "standing"
                     self.sitting_frames = 0
                     self.frames_not_sitting = 0
@@ -178,7 +409,7 @@ class Person:
                 # increment sitting count because coming to sitting is considered a sit event
                 self.sitting_count += 1
                 self.active_sitting_timer = cooldown_frames
-                self._log_transition(old_state, "sitting", frame_number, output_path, fps, f"Sat up from lying, count:{self.sitting_count}")
+                self._log_transition(old_state, "sitting", frame_number, output_path, fps, f"Sat up from lying, count:{self.sitting_count}", knee_angle_deg)
                 self.state = "sitting"
                 # reset counters
                 self.sitting_frames = threshold_frames  # treat as already sitting for continuity
@@ -188,25 +419,50 @@ class Person:
         return
 
 
-def process_datapoints(datapoints, frame_number: int, output_path: Path, fps: float, job_id: str):
+def start_job(job_id: str, thresholds: Optional[Thresholds] = None) -> None:
+    """Start a fresh person table for ``job_id``, optionally with custom thresholds."""
+    job_persons[job_id] = PersonTable(thresholds=thresholds)
+
+
+def forget_job(job_id: str) -> None:
+    """Drop the tracker state of a finished or evicted job."""
+    job_persons.pop(job_id, None)
+
+
+def process_datapoints(datapoints, frame_number: int, output_path: Path, fps: float, job_id: str, stride: int = 1):
     # quick sanity
     if datapoints[0].keypoints is None or datapoints[0].boxes is None or datapoints[0].boxes.id is None:
         return
 
+    process_tracks(datapoints[0].boxes.id, datapoints[0].keypoints.data, frame_number, output_path, fps, job_id, stride)
+
+
+def process_tracks(track_ids, keypoints_seq, frame_number: int, output_path: Path, fps: float, job_id: str,
+                   stride: int = 1):
+    """
+    Update the per-job state machines for one frame of tracked persons.
+    ``track_ids`` and ``keypoints_seq`` are aligned per person, keypoints as (17, 2+) rows.
+    ``frame_number`` and ``fps`` are those of the video; with a ``stride`` only
+    every ``stride``-th frame is passed in.
+    """
     persons = job_persons[job_id]
 
     # tick all known persons for this job to decrement cooldowns
-    for p in persons.values():
-        p.tick()
+    persons.tick()
 
     # compute detection thresholds once per frame
-    threshold_frames = max(3, int(fps * 0.4))
+    t = persons.thresholds or default_thresholds()
+    threshold_frames = t.threshold_frames(fps, stride)
+
+    # posture for every person in the frame in one vectorized pass
+    postures = posture_batch(keypoints_seq, t)
 
-    for keypoints, tid_raw in zip(datapoints[0].keypoints.data, datapoints[0].boxes.id):
+    for i, (keypoints, tid_raw) in enumerate(zip(keypoints_seq, track_ids)):
         tid = int(tid_raw)
+        posture = postures.row(i)
         person = persons.get(tid)
         if person is None:
-            hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying = posture_from_keypoints(keypoints)
+            hip_y, knee_y, shoulder_y, knee_angle_deg, is_sitting, is_lying = posture
 
             # choose initial state from first detection to avoid logging a spurious transition
             if is_lying:
@@ -219,7 +475,9 @@ def process_datapoints(datapoints, frame_number: int, output_path: Path, fps: fl
                 init_state = "standing"
                 init_sitting_frames = 0
 
-            person = Person(tid=tid, state=init_state, sitting_frames=init_sitting_frames)
-            persons[tid] = person
+            person = persons.create(tid, state=init_state, sitting_frames=init_sitting_frames)
+
+        persons.touch(person, frame_number)
+        person.update(keypoints, frame_number, output_path, fps, posture=posture, stride=stride)
 
-        person.update(keypoints, frame_number, output_path, fps)
\ No newline at end of file
+    persons.evict_idle(frame_number)
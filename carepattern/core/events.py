@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Buffered per-job event sink. State transitions are collected in memory and
+# written in batches, both as the legacy prediction.txt lines and as
+# structured JSON lines in events.jsonl next to it. A background thread
+# flushes buffers that have waited ``flush_seconds``, also when no further
+# event arrives (a long quiet stretch of video).
+
+EVENTS_FILENAME = "events.jsonl"
+
+_lock = threading.Lock()
+_writers: Dict[str, "EventWriter"] = {}
+_flusher: Optional[threading.Thread] = None
+
+_config = {
+    "flush_events": 256,     # flush after this many buffered events
+    "flush_seconds": 5.0,    # ... or when the oldest buffered event is this old
+}
+
+
+def configure(flush_events: Optional[int] = None, flush_seconds: Optional[float] = None) -> None:
+    if flush_events is not None:
+        _config["flush_events"] = max(1, int(flush_events))
+    if flush_seconds is not None:
+        _config["flush_seconds"] = float(flush_seconds)
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Legacy prediction.txt line for an event."""
+    msg = f"{event['time']} | Person {event['track_id']} | {event['from']} -> {event['to']}"
+    if event.get("note"):
+        msg += f" | {event['note']}"
+    return msg
+
+
+class EventWriter:
+    def __init__(self, prediction_path: Path):
+        self.prediction_path = Path(prediction_path)
+        self.events_path = self.prediction_path.with_name(EVENTS_FILENAME)
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._first_at: Optional[float] = None
+
+    def write(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if not self._buffer:
+                self._first_at = time.monotonic()
+            self._buffer.append(event)
+            due = (len(self._buffer) >= _config["flush_events"]
+                   or time.monotonic() - self._first_at >= _config["flush_seconds"])
+        if due:
+            self.flush()
+
+    def flush_due(self) -> None:
+        """Flush when the oldest buffered event has waited ``flush_seconds``."""
+        with self._lock:
+            due = bool(self._buffer) and time.monotonic() - self._first_at >= _config["flush_seconds"]
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            if not buffer:
+                return
+            self.prediction_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.prediction_path, "a") as f:
+                f.write("".join(format_event(e) + "\n" for e in buffer))
+            with open(self.events_path, "a") as f:
+                f.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in buffer))
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(min(1.0, max(0.05, _config["flush_seconds"] / 2)))
+        with _lock:
+            writers = list(_writers.values())
+        for writer in writers:
+            try:
+                writer.flush_due()
+            except Exception as e:
+                print(f"Error flushing events of {writer.prediction_path}: {e}")
+
+
+def get_writer(prediction_path: Path) -> EventWriter:
+    global _flusher
+    key = str(prediction_path)
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="event-flush", daemon=True)
+            _flusher.start()
+        writer = _writers.get(key)
+        if writer is None:
+            writer = EventWriter(prediction_path)
+            _writers[key] = writer
+        return writer
+
+
+def close_writer(prediction_path: Path) -> None:
+    """Flush and forget the writer for a job; call at job end."""
+    with _lock:
+        writer = _writers.pop(str(prediction_path), None)
+    if writer is not None:
+        writer.flush()
+
+
+def read_events(folder: Path) -> Optional[List[Dict[str, Any]]]:
+    """Events of an upload folder, or None if it has no events.jsonl."""
+    path = Path(folder) / EVENTS_FILENAME
+    if not path.exists():
+        return None
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                # partially written last line of a running job
+                continue
+    return out
@@ -0,0 +1,374 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .tracker import iou_matrix
+
+# CPU inference backend: the PyTorch weights converted once to ONNX Runtime
+# or OpenVINO, optionally quantized to INT8 with calibration frames taken
+# from local videos. Exports are kept in a cache directory under a name made
+# of the hash of the source weights, the input size, the backend and the
+# precision, so a changed .pt file or another imgsz gets its own export and
+# every process (worker processes included) reuses the one on disk. The
+# model pool (carepattern.core.models) loads the export in place of the .pt
+# file; when an export fails the job falls back to the PyTorch weights.
+# Exports are FP32 or INT8: a profile's ``half`` only applies to the PyTorch
+# weights (FP16 gains nothing on the CPU), so it is not part of the export
+# name; predicting on an export with half=True runs it in FP32.
+#
+# The backends need the packages in requirements-export.txt.
+#
+# ``python -m carepattern.core.export compare`` runs both on frames of a
+# video and reports the speed and the keypoint difference.
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+_config = {
+    "backend": "pytorch",
+    "cache_dir": "model_exports",
+    "int8": False,              # INT8 quantization, calibrated on local frames
+    "calibration_dir": None,    # videos/images to take calibration frames from
+    "calibration_frames": 300,
+}
+
+_lock = threading.Lock()
+_key_locks: Dict[str, threading.Lock] = {}
+_resolved: Dict[Tuple, str] = {}
+_hashes: Dict[Tuple, str] = {}
+
+
+def configure(backend: Optional[str] = None, cache_dir: Optional[str] = None, int8: Optional[bool] = None,
+              calibration_dir: Optional[str] = None, calibration_frames: Optional[int] = None) -> None:
+    with _lock:
+        if backend is not None:
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown model backend: {backend}")
+            _config["backend"] = backend
+        if cache_dir is not None:
+            _config["cache_dir"] = str(cache_dir)
+        if int8 is not None:
+            _config["int8"] = bool(int8)
+        if calibration_dir is not None:
+            _config["calibration_dir"] = str(calibration_dir) or None
+        if calibration_frames is not None:
+            _config["calibration_frames"] = max(1, int(calibration_frames))
+        _resolved.clear()
+
+
+def get_config() -> Dict[str, Any]:
+    """The settings as plain values, to configure worker processes the same way."""
+    with _lock:
+        return dict(_config)
+
+
+def weights_hash(path: Path) -> str:
+    """SHA-256 of a weights file; remembered per path, size and mtime."""
+    path = Path(path).resolve()
+    st = path.stat()
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        cached = _hashes.get(key)
+    if cached:
+        return cached
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _lock:
+        _hashes[key] = digest
+    return digest
+
+
+def export_name(digest: str, imgsz: int, backend: str, int8: bool = False) -> str:
+    name = f"{digest[:16]}-{int(imgsz)}-{'int8' if int8 else 'fp32'}"
+    # ultralytics recognises OpenVINO exports by the directory suffix
+    return f"{name}.onnx" if backend == "onnx" else f"{name}_openvino_model"
+
+
+def _weights_file(model_path: str) -> Path:
+    """The .pt file of ``model_path``; ultralytics downloads official weights that aren't on disk yet."""
+    path = Path(model_path)
+    if path.is_file():
+        return path
+    from ultralytics import YOLO
+    return Path(YOLO(str(model_path)).ckpt_path)
+
+
+def _imgsz(settings_imgsz: Any) -> int:
+    if isinstance(settings_imgsz, (tuple, list)):
+        return int(max(settings_imgsz))
+    return int(settings_imgsz or 640)
+
+
+def sample_frames(source: Path, out_dir: Path, count: int) -> int:
+    """
+    Write up to ``count`` frames from the videos and images under ``source``
+    to ``out_dir`` as JPEG, spread evenly over all videos; returns how many.
+    """
+    source = Path(source)
+    files = sorted(p for p in source.rglob("*") if p.is_file())
+    images = [p for p in files if p.suffix.lower() in IMAGE_EXTENSIONS]
+    videos = [p for p in files if p.suffix.lower() in VIDEO_EXTENSIONS]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for p in images[:count]:
+        shutil.copyfile(p, out_dir / f"{written:05d}{p.suffix.lower()}")
+        written += 1
+    for v, video in enumerate(videos):
+        # an even share of the remaining frames per video
+        share = -(-(count - written) // (len(videos) - v)) if written < count else 0
+        if share <= 0:
+            break
+        cap = cv2.VideoCapture(str(video))
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            if total <= 0:
+                continue
+            for index in np.linspace(0, total - 1, num=min(share, total)).astype(int):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+                ret, frame = cap.read()
+                if ret:
+                    cv2.imwrite(str(out_dir / f"{written:05d}.jpg"), frame)
+                    written += 1
+        finally:
+            cap.release()
+    return written
+
+
+def _calibration_data(work_dir: Path) -> Path:
+    """Dataset YAML over sampled local frames, the form ultralytics calibrates INT8 exports with."""
+    source = _config["calibration_dir"]
+    if not source or not Path(source).is_dir():
+        raise RuntimeError("INT8 export needs calibration frames: set the calibration directory")
+    found = sample_frames(Path(source), work_dir / "images", _config["calibration_frames"])
+    if not found:
+        raise RuntimeError(f"No calibration frames found in {source}")
+    data = work_dir / "calibration.yaml"
+    data.write_text(f"path: {work_dir}\ntrain: images\nval: images\nnames:\n  0: person\nkpt_shape: [17, 3]\n")
+    return data
+
+
+def _export(weights: Path, imgsz: int, backend: str, int8: bool, target: Path) -> None:
+    from ultralytics import YOLO
+    from ultralytics.cfg import DEFAULT_CFG_DICT
+
+    work_dir = Path(tempfile.mkdtemp(prefix="export_", dir=target.parent))
+    try:
+        # ultralytics writes the export next to the weights
+        local = work_dir / "model.pt"
+        shutil.copyfile(weights, local)
+        # dynamic input: batched predict calls and rectangular letterboxing, as with the .pt model
+        args = {"format": backend, "imgsz": imgsz, "dynamic": True}
+        if int8:
+            args["data"] = str(_calibration_data(work_dir))
+            args["fraction"] = 1.0
+            # ``quantize=8`` replaced ``int8=True`` in newer ultralytics releases
+            args.update({"quantize": 8} if "quantize" in DEFAULT_CFG_DICT else {"int8": True})
+        exported = Path(YOLO(str(local)).export(verbose=False, **args))
+        # rename into place; a process that finished the same export first wins
+        try:
+            os.rename(exported, target)
+        except OSError:
+            if not target.exists():
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def exported_path(model_path: str, imgsz: int = 640, backend: Optional[str] = None,
+                  int8: Optional[bool] = None) -> Path:
+    """Path of the ``backend`` export of ``model_path``, exporting it when it isn't in the cache yet."""
+    backend = backend or _config["backend"]
+    int8 = _config["int8"] if int8 is None else int8
+    if backend not in BACKENDS or backend == "pytorch":
+        raise ValueError(f"Not an export backend: {backend}")
+    weights = _weights_file(model_path)
+    cache_dir = Path(_config["cache_dir"])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target = cache_dir / export_name(weights_hash(weights), imgsz, backend, int8)
+    with _lock:
+        key_lock = _key_locks.setdefault(str(target), threading.Lock())
+    with key_lock:
+        if not target.exists():
+            t0 = time.perf_counter()
+            _export(weights, imgsz, backend, int8, target)
+            print(f"Exported {model_path} to {target} in {time.perf_counter() - t0:.1f}s")
+    return target
+
+
+def resolve(model_path: str, imgsz: Any = None) -> str:
+    """
+    What the model pool should load for ``model_path``: the cached export
+    for the configured backend, or ``model_path`` itself for the PyTorch
+    backend, for models that aren't .pt files and when the export fails.
+    """
+    backend, int8 = _config["backend"], _config["int8"]
+    if backend == "pytorch" or Path(str(model_path)).suffix != ".pt":
+        return str(model_path)
+    size = _imgsz(imgsz)
+    key = (str(model_path), size, backend, int8)
+    with _lock:
+        cached = _resolved.get(key)
+    if cached:
+        return cached
+    try:
+        path = str(exported_path(model_path, size, backend, int8))
+    except Exception as e:
+        print(f"Error exporting model {model_path} to {backend}, using the PyTorch weights: {e}")
+        path = str(model_path)
+    with _lock:
+        _resolved[key] = path
+    return path
+
+
+def _match(a: np.ndarray, b: np.ndarray, min_iou: float = 0.5) -> List[Tuple[int, int]]:
+    """Greedy pairs of boxes (xyxy rows) of two detection sets by IoU."""
+    if not len(a) or not len(b):
+        return []
+    iou = iou_matrix(a, b)
+    pairs = []
+    while True:
+        i, j = np.unravel_index(int(np.argmax(iou)), iou.shape)
+        if iou[i, j] < min_iou:
+            return pairs
+        pairs.append((int(i), int(j)))
+        iou[i, :] = -1
+        iou[:, j] = -1
+
+
+def _read_frames(video: Path, count: int) -> List[np.ndarray]:
+    cap = cv2.VideoCapture(str(video))
+    frames = []
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        indices = set(np.linspace(0, max(total - 1, 0), num=count).astype(int).tolist()) if total > count else None
+        index = 0
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if indices is None or index in indices:
+                frames.append(frame)
+            index += 1
+    finally:
+        cap.release()
+    if not frames:
+        raise RuntimeError(f"Kan video niet lezen: {video}")
+    return frames
+
+
+def _timed_predict(model, frames: List[np.ndarray], imgsz: int) -> Tuple[List[Any], float]:
+    model.predict(frames[0], classes=[0], verbose=False, imgsz=imgsz)  # warm-up
+    results = []
+    t0 = time.perf_counter()
+    for frame in frames:
+        results.append(model.predict(frame, classes=[0], verbose=False, imgsz=imgsz)[0])
+    return results, (time.perf_counter() - t0) * 1000.0 / len(frames)
+
+
+def compare(video: Path, model_path: str, backend: Optional[str] = None, imgsz: int = 640, frames: int = 100,
+            int8: Optional[bool] = None, keypoint_conf: float = 0.5) -> Dict[str, Any]:
+    """
+    Speed and keypoint difference of the ``backend`` export against the .pt
+    model on ``frames`` frames of ``video``. Persons are paired by box IoU;
+    the keypoint difference is in pixels, over keypoints both models see
+    with at least ``keypoint_conf``.
+    """
+    from ultralytics import YOLO
+
+    backend = backend or _config["backend"]
+    if backend == "pytorch":
+        raise ValueError("compare needs an export backend (onnx or openvino)")
+    int8 = _config["int8"] if int8 is None else int8
+    images = _read_frames(Path(video), frames)
+    exported = exported_path(model_path, imgsz, backend, int8)
+    reference, reference_ms = _timed_predict(YOLO(str(model_path)), images, imgsz)
+    candidate, candidate_ms = _timed_predict(YOLO(str(exported), task="pose"), images, imgsz)
+
+    distances, box_iou = [], []
+    persons = {"pytorch": 0, "export": 0, "matched": 0}
+    for ref, cand in zip(reference, candidate):
+        ref_boxes = ref.boxes.xyxy.cpu().numpy() if ref.boxes is not None else np.zeros((0, 4))
+        cand_boxes = cand.boxes.xyxy.cpu().numpy() if cand.boxes is not None else np.zeros((0, 4))
+        persons["pytorch"] += len(ref_boxes)
+        persons["export"] += len(cand_boxes)
+        pairs = _match(ref_boxes, cand_boxes)
+        persons["matched"] += len(pairs)
+        if not pairs or ref.keypoints is None or cand.keypoints is None:
+            continue
+        ref_kps = ref.keypoints.data.cpu().numpy()
+        cand_kps = cand.keypoints.data.cpu().numpy()
+        for i, j in pairs:
+            box_iou.append(float(iou_matrix(ref_boxes[i:i + 1], cand_boxes[j:j + 1])[0, 0]))
+            visible = (ref_kps[i, :, 2] >= keypoint_conf) & (cand_kps[j, :, 2] >= keypoint_conf)
+            distances.extend(np.linalg.norm(ref_kps[i, visible, :2] - cand_kps[j, visible, :2], axis=-1).tolist())
+
+    distances = np.asarray(distances)
+    return {
+        "video": str(video),
+        "model": str(model_path),
+        "export": str(exported),
+        "backend": backend,
+        "int8": int8,
+        "imgsz": imgsz,
+        "frames": len(images),
+        "pytorch_ms": round(reference_ms, 2),
+        "export_ms": round(candidate_ms, 2),
+        "speedup": round(reference_ms / candidate_ms, 2) if candidate_ms else None,
+        "persons": persons,
+        "box_iou_mean": round(float(np.mean(box_iou)), 4) if box_iou else None,
+        "keypoints_compared": int(distances.size),
+        "keypoint_diff_mean_px": round(float(distances.mean()), 3) if distances.size else None,
+        "keypoint_diff_p95_px": round(float(np.percentile(distances, 95)), 3) if distances.size else None,
+        "keypoint_diff_max_px": round(float(distances.max()), 3) if distances.size else None,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the pose model for CPU inference and compare it with the .pt model.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("export", "export (or find the cached export) and print its path"),
+                            ("compare", "report speed and keypoint difference against the .pt model")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--model", default="yolo11n-pose.pt")
+        p.add_argument("--backend", choices=BACKENDS[1:], default="onnx")
+        p.add_argument("--imgsz", type=int, default=640)
+        p.add_argument("--int8", action="store_true", help="INT8 quantization, calibrated on --calibration-dir")
+        p.add_argument("--calibration-dir", help="videos/images to take calibration frames from")
+        p.add_argument("--calibration-frames", type=int, default=300)
+        p.add_argument("--cache-dir", default=_config["cache_dir"])
+        if name == "compare":
+            p.add_argument("video", help="video to run both models on")
+            p.add_argument("--frames", type=int, default=100)
+            p.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    configure(backend=args.backend, cache_dir=args.cache_dir, int8=args.int8,
+              calibration_dir=args.calibration_dir, calibration_frames=args.calibration_frames)
+    if args.command == "export":
+        print(exported_path(args.model, args.imgsz))
+        return 0
+    report = compare(Path(args.video), args.model, imgsz=args.imgsz, frames=args.frames)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,38 +1,334 @@
+import json
+import sqlite3
 import threading
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, Callable, List, Tuple
 
-_lock = threading.Lock()
-_jobs: Dict[str, Dict[str, Optional[Any]]] = {}
+TERMINAL_STATUSES = ("done", "error", "cancelled")
 
-def create_job() -> str:
+# In worker processes job updates are forwarded to the parent process instead
+# of being stored locally (see carepattern.core.workers).
+_forward: Optional[Callable[[str, Dict[str, Any]], None]] = None
+_cancel_check: Optional[Callable[[str], bool]] = None
+_evict_listeners: List[Callable[[str], None]] = []
+_finish_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+def set_forwarder(forward: Optional[Callable[[str, Dict[str, Any]], None]],
+                  cancel_check: Optional[Callable[[str], bool]] = None) -> None:
+    global _forward, _cancel_check
+    _forward = forward
+    _cancel_check = cancel_check
+
+def _listener_name(listener: Callable) -> Tuple[Optional[str], Any]:
+    return getattr(listener, "__module__", None), getattr(listener, "__qualname__", None) or id(listener)
+
+def _add_listener(listeners: List[Callable], listener: Callable) -> None:
+    # one listener per function: registering it again (create_app running more
+    # than once, which also makes a new closure each time) replaces the old one
+    name = _listener_name(listener)
+    listeners[:] = [l for l in listeners if _listener_name(l) != name]
+    listeners.append(listener)
+
+def add_evict_listener(listener: Callable[[str], None]) -> None:
+    """Call ``listener(job_id)`` when a finished job is evicted from the store."""
+    _add_listener(_evict_listeners, listener)
+
+class Subscription:
+    """
+    Job changes for one subscriber. Changes are coalesced per job, so a slow
+    reader only sees the latest state of each job instead of a growing backlog.
+    """
+
+    def __init__(self, job_ids: Optional[List[str]] = None):
+        self.job_ids = set(job_ids) if job_ids else None
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self.closed = False
+
+    def wants(self, job_id: str) -> bool:
+        return self.job_ids is None or job_id in self.job_ids
+
+    def _push(self, job_id: str, job: Dict[str, Any]) -> None:
+        with self._cond:
+            self._pending[job_id] = job
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Wait for changes; returns ``(job_id, job)`` pairs (empty on timeout)."""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def close(self) -> None:
+        unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+_subscribers_lock = threading.Lock()
+_subscribers: List[Subscription] = []
+
+def subscribe(job_ids: Optional[List[str]] = None) -> Subscription:
+    """Receive changes of ``job_ids`` (all jobs when None); close the subscription when done."""
+    sub = Subscription(job_ids)
+    with _subscribers_lock:
+        _subscribers.append(sub)
+    return sub
+
+def unsubscribe(sub: Subscription) -> None:
+    with _subscribers_lock:
+        if sub in _subscribers:
+            _subscribers.remove(sub)
+
+def _publish(job_id: str, job: Dict[str, Any]) -> None:
+    with _subscribers_lock:
+        targets = [sub for sub in _subscribers if sub.wants(job_id)]
+    if not targets:
+        return
+    public = _public(job)
+    for sub in targets:
+        sub._push(job_id, public)
+
+def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+    # underscore fields are internal (e.g. the arguments needed to re-run the job)
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+def add_finish_listener(listener: Callable[[str, Dict[str, Any]], None]) -> None:
+    """Call ``listener(job_id, job)`` when a job reaches a terminal status."""
+    _add_listener(_finish_listeners, listener)
+
+
+class MemoryJobStore:
+    """Jobs in a dict; finished jobs are evicted after ``ttl`` seconds or beyond ``max_finished``."""
+
+    def __init__(self, ttl: Optional[float] = None, max_finished: Optional[int] = None):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._finished: Dict[str, float] = {}  # job_id -> finished at, in finish order
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._jobs[job_id] = dict(record)
+        _publish(job_id, record)
+        self.evict()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        finished = None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            snapshot = dict(job)
+            if job.get("status") in TERMINAL_STATUSES:
+                if job_id not in self._finished:
+                    self._finished[job_id] = time.time()
+                    finished = dict(job)
+            else:
+                self._finished.pop(job_id, None)
+            self._on_update_locked(job_id, job)
+        _publish(job_id, snapshot)
+        if finished is not None:
+            for listener in _finish_listeners:
+                try:
+                    listener(job_id, finished)
+                except Exception as e:
+                    print(f"Error in job finish listener: {e}")
+
+    def _on_update_locked(self, job_id: str, job: Dict[str, Any]) -> None:
+        pass
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(k, dict(v)) for k, v in self._jobs.items()]
+
+    def _expired_locked(self) -> List[str]:
+        now = time.time()
+        expired = []
+        if self.ttl is not None:
+            expired = [k for k, t in self._finished.items() if now - t > self.ttl]
+        if self.max_finished is not None:
+            extra = len(self._finished) - len(expired) - self.max_finished
+            if extra > 0:
+                rest = [k for k in self._finished if k not in expired]
+                expired += rest[:extra]
+        return expired
+
+    def evict(self) -> List[str]:
+        with self._lock:
+            expired = self._expired_locked()
+            for job_id in expired:
+                self._jobs.pop(job_id, None)
+                self._finished.pop(job_id, None)
+            self._delete_locked(expired)
+        for job_id in expired:
+            for listener in _evict_listeners:
+                try:
+                    listener(job_id)
+                except Exception as e:
+                    print(f"Error in job evict listener: {e}")
+        return expired
+
+    def _delete_locked(self, job_ids: List[str]) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """
+    Write-behind SQLite (WAL) store. Reads are served from memory; updates are
+    collected and written in batches every ``flush_seconds``, except for new
+    jobs and terminal statuses, which are written immediately.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_finished: Optional[int] = None,
+                 flush_seconds: float = 2.0):
+        super().__init__(ttl=ttl, max_finished=max_finished)
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._db_lock = threading.Lock()
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, data TEXT NOT NULL, finished_at REAL)"
+        )
+        self._conn.commit()
+        self._load()
+        threading.Thread(target=self._flush_loop, name="job-store-flush", daemon=True).start()
+
+    def _load(self) -> None:
+        rows = self._conn.execute("SELECT job_id, data, finished_at FROM jobs ORDER BY finished_at").fetchall()
+        with self._lock:
+            for job_id, data, finished_at in rows:
+                self._jobs[job_id] = json.loads(data)
+                if finished_at is not None:
+                    self._finished[job_id] = finished_at
+
+    def create(self, job_id: str, record: Dict[str, Any]) -> None:
+        super().create(job_id, record)
+        with self._lock:
+            self._dirty[job_id] = dict(record)
+        self.flush()
+
+    def update(self, job_id: str, fields: Dict[str, Any]) -> None:
+        super().update(job_id, fields)
+        if fields.get("status") in TERMINAL_STATUSES:
+            # don't lose final states to a crash between flushes
+            self.flush()
+
+    def _on_update_locked(self, job_id: str, job: Dict[str, Any]) -> None:
+        self._dirty[job_id] = dict(job)
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            batch = [(k, json.dumps(job), self._finished.get(k)) for k, job in dirty.items()]
+        if not batch:
+            return
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO jobs (job_id, data, finished_at) VALUES (?, ?, ?)", batch
+            )
+            self._conn.commit()
+
+    def _delete_locked(self, job_ids: List[str]) -> None:
+        for job_id in job_ids:
+            self._dirty.pop(job_id, None)
+        if not job_ids:
+            return
+        with self._db_lock:
+            self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(k,) for k in job_ids])
+            self._conn.commit()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                self.evict()
+            except Exception as e:
+                print(f"Error flushing job store: {e}")
+
+
+_store: MemoryJobStore = MemoryJobStore()
+
+def configure(store: MemoryJobStore) -> None:
+    global _store
+    _store = store
+
+def get_store() -> MemoryJobStore:
+    return _store
+
+def _update(job_id: str, **fields: Any) -> None:
+    if _forward is not None:
+        _forward(job_id, fields)
+        return
+    _store.update(job_id, fields)
+
+def create_job(params: Optional[Dict[str, Any]] = None) -> str:
     import uuid
     job_id = uuid.uuid4().hex
-    with _lock:
-        _jobs[job_id] = {"status": "pending", "output": None, "error": None, "progress": 0}
+    _store.create(job_id, {"status": "pending", "output": None, "error": None, "progress": 0,
+                           "queue_position": None, "eta": None, "cancelled": False,
+                           "_params": params})
     return job_id
 
 def get_job(job_id: str) -> Optional[Dict[str, Optional[Any]]]:
-    with _lock:
-        job = _jobs.get(job_id)
-        return dict(job) if job else None
+    job = _store.get(job_id)
+    if job is None:
+        return None
+    return _public(job)
+
+def get_jobs(job_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Public state of several jobs (None for unknown ids)."""
+    return {job_id: get_job(job_id) for job_id in job_ids}
+
+def get_params(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _store.get(job_id)
+    return job.get("_params") if job else None
+
+def set_params(job_id: str, params: Dict[str, Any]) -> None:
+    _update(job_id, _params=params)
 
 def set_status(job_id: str, status: str) -> None:
-    with _lock:
-        if job_id in _jobs:
-            _jobs[job_id]["status"] = status
+    _update(job_id, status=status)
 
 def set_output(job_id: str, output_path: str) -> None:
-    with _lock:
-        if job_id in _jobs:
-            _jobs[job_id]["output"] = output_path
+    _update(job_id, output=output_path)
 
 def set_error(job_id: str, error_msg: str) -> None:
-    with _lock:
-        if job_id in _jobs:
-            _jobs[job_id]["status"] = "error"
-            _jobs[job_id]["error"] = error_msg
+    _update(job_id, status="error", error=error_msg)
 
 def set_progress(job_id: str, progress: int) -> None:
-    with _lock:
-        if job_id in _jobs:
-            _jobs[job_id]["progress"] = progress
\ No newline at end of file
+    _update(job_id, progress=progress)
+
+def set_fields(job_id: str, **fields: Any) -> None:
+    _update(job_id, **fields)
+
+def request_cancel(job_id: str) -> None:
+    _update(job_id, cancelled=True)
+
+def is_cancelled(job_id: str) -> bool:
+    if _cancel_check is not None:
+        return _cancel_check(job_id)
+    job = _store.get(job_id)
+    return bool(job and job.get("cancelled"))
+
+def interrupted_jobs() -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """Jobs that were queued or running when the previous process stopped."""
+    return [(job_id, job.get("_params")) for job_id, job in _store.items()
+            if job.get("status") not in TERMINAL_STATUSES]
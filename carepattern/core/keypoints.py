@@ -0,0 +1,143 @@
+import json
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Per-job keypoint archive: the tracked IDs, boxes and keypoints of every
+# frame, stored as plain .npy files in <upload>/keypoints/ so they can be
+# memory-mapped. Detections are stored back to back; index.npy holds the
+# offset of every frame (frame i is rows index[i]:index[i + 1]).
+#
+#   index.npy      (F + 1,)     int64
+#   ids.npy        (D,)         int64
+#   boxes.npy      (D, 6)       float32  x1, y1, x2, y2, conf, cls
+#   keypoints.npy  (D, 17, 3)   float32  x, y, conf
+#   meta.json      fps, width, height, frames, source video, class names
+
+ARCHIVE_DIRNAME = "keypoints"
+
+_HEADER_SIZE = 128  # fixed so the shape can be filled in after streaming the data
+
+
+def _npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": shape})
+    prefix = b"\x93NUMPY\x01\x00"
+    pad = _HEADER_SIZE - len(prefix) - 2 - len(header) - 1
+    if pad < 0:
+        raise ValueError("npy header too long")
+    return prefix + struct.pack("<H", _HEADER_SIZE - len(prefix) - 2) + (header + " " * pad + "\n").encode("latin1")
+
+
+class _NpyAppender:
+    """Append rows to a .npy file and write the final shape on close."""
+
+    def __init__(self, path: Path, dtype, row_shape: Tuple[int, ...]):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._f = open(path, "wb")
+        self._f.write(_npy_header(self.dtype, (0,) + row_shape))
+
+    def append(self, arr: np.ndarray) -> None:
+        arr = np.ascontiguousarray(arr, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._f.write(arr.tobytes())
+        self.rows += arr.shape[0]
+
+    def close(self) -> None:
+        self._f.seek(0)
+        self._f.write(_npy_header(self.dtype, (self.rows,) + self.row_shape))
+        self._f.close()
+
+
+def arrays_from_results(results) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ids, boxes, keypoints) of the tracked persons in ultralytics results."""
+    empty = (np.zeros((0,), dtype=np.int64), np.zeros((0, 6), dtype=np.float32), np.zeros((0, 17, 3), dtype=np.float32))
+    if not results:
+        return empty
+    r = results[0]
+    if r.keypoints is None or r.boxes is None or r.boxes.id is None:
+        return empty
+    boxes = np.concatenate([
+        r.boxes.xyxy.cpu().numpy(),
+        r.boxes.conf.cpu().numpy()[:, None],
+        r.boxes.cls.cpu().numpy()[:, None],
+    ], axis=1)
+    kps = r.keypoints.data.cpu().numpy()
+    if kps.shape[-1] == 2:
+        kps = np.concatenate([kps, np.ones(kps.shape[:-1] + (1,), dtype=kps.dtype)], axis=-1)
+    return r.boxes.id.cpu().numpy().astype(np.int64), boxes.astype(np.float32), kps.astype(np.float32)
+
+
+class KeypointArchiveWriter:
+    def __init__(self, folder: Path):
+        self.dir = Path(folder) / ARCHIVE_DIRNAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # remove a previous archive's meta first so a half-written archive is never read as complete
+        (self.dir / "meta.json").unlink(missing_ok=True)
+        self._ids = _NpyAppender(self.dir / "ids.npy", np.int64, ())
+        self._boxes = _NpyAppender(self.dir / "boxes.npy", np.float32, (6,))
+        self._kps = _NpyAppender(self.dir / "keypoints.npy", np.float32, (17, 3))
+        self._index = [0]
+
+    def add(self, frame_index: int, ids: np.ndarray, boxes: np.ndarray, keypoints: np.ndarray) -> None:
+        # frames without a record (e.g. skipped) are stored as empty
+        while len(self._index) - 1 < frame_index:
+            self._index.append(self._index[-1])
+        self._ids.append(ids)
+        self._boxes.append(boxes)
+        self._kps.append(keypoints)
+        self._index.append(self._index[-1] + len(ids))
+
+    def add_results(self, frame_index: int, results) -> None:
+        self.add(frame_index, *arrays_from_results(results))
+
+    def close(self, meta: Dict[str, Any]) -> None:
+        self._ids.close()
+        self._boxes.close()
+        self._kps.close()
+        np.save(self.dir / "index.npy", np.asarray(self._index, dtype=np.int64))
+        meta = dict(meta, frames=len(self._index) - 1)
+        with open(self.dir / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+    def abort(self) -> None:
+        for appender in (self._ids, self._boxes, self._kps):
+            try:
+                appender._f.close()
+            except Exception:
+                pass
+
+
+class KeypointArchive:
+    """Memory-mapped reader for a keypoint archive."""
+
+    def __init__(self, folder: Path):
+        self.dir = Path(folder) / ARCHIVE_DIRNAME
+        with open(self.dir / "meta.json") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.index = np.load(self.dir / "index.npy", mmap_mode="r")
+        self.ids = np.load(self.dir / "ids.npy", mmap_mode="r")
+        self.boxes = np.load(self.dir / "boxes.npy", mmap_mode="r")
+        self.keypoints = np.load(self.dir / "keypoints.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(folder: Path) -> bool:
+        return (Path(folder) / ARCHIVE_DIRNAME / "meta.json").exists()
+
+    def __len__(self) -> int:
+        return len(self.index) - 1
+
+    def frame(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        a, b = int(self.index[i]), int(self.index[i + 1])
+        return self.ids[a:b], self.boxes[a:b], self.keypoints[a:b]
+
+    def frames(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+        for i in range(len(self)):
+            yield (i,) + self.frame(i)
+
+
+def load_archive(folder: Path) -> Optional[KeypointArchive]:
+    return KeypointArchive(folder) if KeypointArchive.exists(folder) else None
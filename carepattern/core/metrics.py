@@ -0,0 +1,143 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Latency histograms and process-wide metrics. Pipeline stages record every
+# item in a fixed-bucket histogram (a bisect and an increment, no per-frame
+# logging); a job's histograms travel with its stage report and are merged
+# into the totals below when the job finishes, which also works for jobs
+# that ran in a worker process.
+
+# bucket upper bounds in seconds, roughly 1-2.5-5 per decade from 0.1 ms to 10 s
+BUCKETS: Tuple[float, ...] = tuple(
+    round(m * 10.0 ** e, 6) for e in range(-4, 1) for m in (1.0, 2.5, 5.0)
+) + (10.0,)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last bucket: > BUCKETS[-1]
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate by linear interpolation within the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * max(0.0, rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = {"count": self.count, "sum": round(self.sum, 6), "counts": list(self.counts)}
+        for q in QUANTILES:
+            v = self.quantile(q)
+            out[f"p{int(q * 100)}_ms"] = round(v * 1000, 3) if v is not None else None
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Histogram":
+        h = cls()
+        counts = data.get("counts") or []
+        if len(counts) == len(h.counts):
+            h.counts = [int(c) for c in counts]
+            h.sum = float(data.get("sum") or 0.0)
+            h.count = int(data.get("count") or 0)
+        return h
+
+
+_lock = threading.Lock()
+_stages: Dict[str, Histogram] = {}
+_job_seconds = Histogram()
+_totals = {"jobs": 0, "jobs_failed": 0, "frames": 0, "frames_skipped": 0}
+
+
+def record_job(job_id: str, job: Dict[str, Any]) -> None:
+    """Merge a finished job's stage histograms into the process totals (a jobs finish listener)."""
+    stages = job.get("stages") or {}
+    started = job.get("started_at")
+    with _lock:
+        _totals["jobs"] += 1
+        if job.get("status") == "error":
+            _totals["jobs_failed"] += 1
+        _totals["frames"] += int(job.get("frames") or 0)
+        _totals["frames_skipped"] += int((job.get("motion") or {}).get("skipped") or 0)
+        if started:
+            _job_seconds.observe(time.time() - started)
+        for name, report in stages.items():
+            data = report.get("histogram") if isinstance(report, dict) else None
+            if data:
+                _stages.setdefault(name, Histogram()).merge(Histogram.from_dict(data))
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "totals": dict(_totals),
+            "job_seconds": _job_seconds.as_dict(),
+            "stages": {name: h.as_dict() for name, h in _stages.items()},
+        }
+
+
+def _line(name: str, value: Any, labels: Optional[Dict[str, Any]] = None) -> str:
+    if labels:
+        name += "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+    return f"{name} {value if value is not None else 'NaN'}"
+
+
+def _summary(lines: List[str], name: str, help_text: str, items: Iterable[Tuple[Dict[str, Any], Histogram]]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} summary")
+    for labels, h in items:
+        for q in QUANTILES:
+            lines.append(_line(name, h.quantile(q), dict(labels, quantile=q)))
+        lines.append(_line(name + "_sum", round(h.sum, 6), labels))
+        lines.append(_line(name + "_count", h.count, labels))
+
+
+def render_prometheus(gauges: Dict[str, Tuple[str, Any]]) -> str:
+    """Prometheus text format: ``gauges`` (name -> (help, value)) plus the job/stage metrics."""
+    lines: List[str] = []
+    for name, (help_text, value) in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                lines.append(_line(name, v, dict(labels)))
+        else:
+            lines.append(_line(name, value))
+    with _lock:
+        totals = dict(_totals)
+        job_seconds = Histogram.from_dict(_job_seconds.as_dict())
+        stages = [({"stage": name}, Histogram.from_dict(h.as_dict())) for name, h in sorted(_stages.items())]
+    for key, help_text in (("jobs", "Finished jobs"), ("jobs_failed", "Failed jobs"), ("frames", "Frames analysed by finished jobs"),
+                           ("frames_skipped", "Frames the motion gate carried forward without inference")):
+        name = f"carepattern_{key}_total"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(_line(name, totals[key]))
+    _summary(lines, "carepattern_job_seconds", "Job duration from start of processing", [({}, job_seconds)])
+    _summary(lines, "carepattern_stage_seconds", "Time per frame in each pipeline stage", stages)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,245 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from ultralytics import YOLO
+
+from . import export
+
+# Process-wide registry of pre-warmed pose models. Models are pooled per
+# (model_path, inference settings) key so consecutive jobs skip loading and
+# the slow first inference. Models for plain ``predict`` calls (the batched
+# inference service) are pooled separately from tracking models, because
+# ``track`` registers tracker callbacks on the model. With an ONNX Runtime or
+# OpenVINO backend configured (carepattern.core.export) the pools load the
+# cached export of the weights instead of the .pt file.
+
+_lock = threading.Lock()
+_pools: "OrderedDict[Tuple, _ModelPool]" = OrderedDict()
+_owners: Dict[int, "_ModelPool"] = {}
+
+_config = {
+    "pool_size": 1,     # instances per key
+    "max_models": 2,    # distinct keys kept before LRU eviction
+}
+
+
+# Creates a model from a model path; replaceable (e.g. by the stub model of the benchmarks).
+_factory: Callable[[str], Any] = YOLO
+
+
+def set_factory(factory: Optional[Callable[[str], Any]]) -> None:
+    """Load models with ``factory(model_path)`` instead of YOLO (None restores YOLO); drops idle pools."""
+    global _factory
+    with _lock:
+        _factory = factory or YOLO
+        for key in [k for k, pool in _pools.items() if not pool.in_use]:
+            for model in _pools[key].idle:
+                _owners.pop(id(model), None)
+            del _pools[key]
+
+
+def configure(pool_size: Optional[int] = None, max_models: Optional[int] = None) -> None:
+    with _lock:
+        if pool_size is not None:
+            _config["pool_size"] = max(1, int(pool_size))
+        if max_models is not None:
+            _config["max_models"] = max(1, int(max_models))
+
+
+def _make_key(model_path: str, settings: Dict[str, Any], tracking: bool = True) -> Tuple:
+    return str(model_path), tuple(sorted(settings.items())), tracking
+
+
+def reset_tracker(model) -> None:
+    """Drop tracker state left behind by a previous job using ``track(persist=True)``."""
+    predictor = getattr(model, "predictor", None)
+    for tracker in getattr(predictor, "trackers", None) or []:
+        try:
+            tracker.reset()
+        except Exception:
+            pass
+
+
+class _ModelPool:
+    def __init__(self, model_path: str, settings: Dict[str, Any], tracking: bool = True):
+        self.model_path = model_path
+        self.settings = dict(settings)
+        self.tracking = tracking
+        self.cond = threading.Condition()
+        self.idle: List[Any] = []
+        self.created = 0
+        self.in_use = 0
+        self.hits = 0
+        self.misses = 0
+        self.source = str(model_path)  # what the instances were loaded from (an export or the weights)
+        self.load_seconds: List[float] = []
+        self.warmup_seconds: List[float] = []
+
+    def _load(self):
+        t0 = time.perf_counter()
+        # a stub factory (benchmarks) gets the path as is
+        path = export.resolve(self.model_path, self.settings.get("imgsz")) if _factory is YOLO else self.model_path
+        model = _factory(path)
+        self.source = path
+        t1 = time.perf_counter()
+
+        # The first inference initialises the predictor, fuses layers and
+        # registers the tracker; do it here instead of on the first job frame.
+        size = self.settings.get("imgsz") or 640
+        if isinstance(size, (tuple, list)):
+            h, w = int(size[0]), int(size[-1])
+        else:
+            h = w = int(size)
+        dummy = np.zeros((h, w, 3), dtype=np.uint8)
+        if self.tracking:
+            model.track(dummy, persist=True, classes=[0], verbose=False, **self.settings)
+            reset_tracker(model)
+        else:
+            model.predict(dummy, classes=[0], verbose=False, **self.settings)
+        t2 = time.perf_counter()
+
+        with self.cond:
+            self.load_seconds.append(t1 - t0)
+            self.warmup_seconds.append(t2 - t1)
+        return model
+
+    def acquire(self, timeout: Optional[float] = None):
+        with self.cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self.idle and self.created >= _config["pool_size"]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Geen model beschikbaar: {self.model_path}")
+                self.cond.wait(remaining)
+            if self.idle:
+                self.hits += 1
+                self.in_use += 1
+                return self.idle.pop()
+            self.misses += 1
+            self.created += 1
+            self.in_use += 1
+
+        try:
+            return self._load()
+        except Exception:
+            with self.cond:
+                self.created -= 1
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+
+    def add_idle(self, model) -> None:
+        with self.cond:
+            self.idle.append(model)
+            self.cond.notify()
+
+    def release(self, model) -> None:
+        reset_tracker(model)
+        with self.cond:
+            self.in_use -= 1
+            if self.created > _config["pool_size"]:
+                # pool was shrunk while this instance was checked out
+                self.created -= 1
+            else:
+                self.idle.append(model)
+            self.cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "model": self.model_path,
+                "settings": dict(self.settings),
+                "tracking": self.tracking,
+                "source": self.source,
+                "instances": self.created,
+                "idle": len(self.idle),
+                "in_use": self.in_use,
+                "hits": self.hits,
+                "misses": self.misses,
+                "load_seconds": list(self.load_seconds),
+                "warmup_seconds": list(self.warmup_seconds),
+            }
+
+
+def _get_pool(model_path: str, settings: Dict[str, Any], tracking: bool = True) -> _ModelPool:
+    key = _make_key(model_path, settings, tracking)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _ModelPool(str(model_path), settings, tracking)
+            _pools[key] = pool
+        _pools.move_to_end(key)
+        _evict_locked()
+        return pool
+
+
+def _evict_locked() -> None:
+    # Evict least recently used pools that have nothing checked out.
+    for key in list(_pools.keys()):
+        if len(_pools) <= _config["max_models"]:
+            break
+        pool = _pools[key]
+        with pool.cond:
+            if pool.in_use:
+                continue
+            for model in pool.idle:
+                _owners.pop(id(model), None)
+            pool.idle.clear()
+            pool.created = 0
+        del _pools[key]
+
+
+def acquire(model_path: str, timeout: Optional[float] = None, tracking: bool = True, **settings):
+    """
+    Check out a warm model for ``model_path``/``settings``; pair with :func:`release`.
+    ``tracking=False`` gives a model that is only used with ``predict``.
+    """
+    pool = _get_pool(model_path, settings, tracking)
+    model = pool.acquire(timeout=timeout)
+    with _lock:
+        _owners[id(model)] = pool
+    return model
+
+
+def release(model) -> None:
+    with _lock:
+        pool = _owners.get(id(model))
+    if pool is None:
+        return
+    pool.release(model)
+
+
+def preload(model_path: str, count: Optional[int] = None, tracking: bool = True, **settings) -> threading.Thread:
+    """Load and warm up models in a background thread so the first job finds them ready."""
+    def _run():
+        pool = _get_pool(model_path, settings, tracking)
+        target = _config["pool_size"] if count is None else min(int(count), _config["pool_size"])
+        while True:
+            with pool.cond:
+                if pool.created >= target:
+                    return
+                pool.created += 1
+                pool.misses += 1
+            try:
+                model = pool._load()
+            except Exception as e:
+                with pool.cond:
+                    pool.created -= 1
+                print(f"Error preloading model {model_path}: {e}")
+                return
+            with _lock:
+                _owners[id(model)] = pool
+            pool.add_idle(model)
+
+    t = threading.Thread(target=_run, name="model-preload", daemon=True)
+    t.start()
+    return t
+
+
+def get_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
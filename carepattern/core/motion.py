@@ -0,0 +1,55 @@
+from typing import Any, Dict
+
+import cv2
+import numpy as np
+
+# Motion gate: decides per frame whether the pose model has to run. Frames
+# are compared, downscaled and blurred, with the last frame inference ran on;
+# when hardly any pixels changed the previous keypoints (and tracker state)
+# are carried forward. Comparing with the last analysed frame instead of the
+# previous one makes slow movement add up until it opens the gate.
+
+
+class MotionGate:
+    def __init__(self, min_changed: float = 0.002, max_skip: int = 30, width: int = 160, pixel_threshold: int = 25):
+        self.min_changed = min_changed      # share of changed pixels that counts as motion
+        self.max_skip = max(0, int(max_skip))  # frames carried forward before inference runs anyway
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.reference = None
+        self.skipped_in_row = 0
+        self.analysed = 0
+        self.skipped = 0
+
+    def _small(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(h * self.width / max(w, 1))))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed(self, small: np.ndarray) -> float:
+        """Share of pixels that differ from the reference frame."""
+        diff = cv2.absdiff(small, self.reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_analyse(self, frame: np.ndarray) -> bool:
+        small = self._small(frame)
+        analyse = (self.reference is None or self.skipped_in_row >= self.max_skip
+                   or self.reference.shape != small.shape or self.changed(small) >= self.min_changed)
+        if analyse:
+            self.reference = small
+            self.skipped_in_row = 0
+            self.analysed += 1
+        else:
+            self.skipped_in_row += 1
+            self.skipped += 1
+        return analyse
+
+    def as_dict(self) -> Dict[str, Any]:
+        frames = self.analysed + self.skipped
+        return {
+            "frames": frames,
+            "analysed": self.analysed,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / frames, 4) if frames else None,
+        }
@@ -0,0 +1,160 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .metrics import Histogram
+
+# Small threaded pipeline: every stage runs in its own thread and hands items
+# to the next stage(s) through bounded queues. Each stage processes its items
+# in arrival order, so frame order is preserved end to end, and a full queue
+# blocks the producer (backpressure keeps memory bounded).
+
+_END = object()
+
+
+class StageStats:
+    __slots__ = ("name", "items", "busy_seconds", "started", "finished", "histogram")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.histogram = Histogram()
+
+    def add(self, seconds: float) -> None:
+        self.busy_seconds += seconds
+        self.items += 1
+        self.histogram.observe(seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            # throughput if this stage ran on its own
+            "fps": round(self.items / self.busy_seconds, 2) if self.busy_seconds > 0 else None,
+            # per-item latency distribution
+            "histogram": self.histogram.as_dict(),
+        }
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable, source: bool):
+        self.name = name
+        self.fn = fn
+        self.source = source
+        self.inbox: Optional[queue.Queue] = None
+        self.outboxes: List[queue.Queue] = []
+        self.stats = StageStats(name)
+
+
+class Pipeline:
+    def __init__(self, queue_size: int = 8):
+        self.queue_size = max(1, int(queue_size))
+        self._stages: Dict[str, _Stage] = {}
+        self._last: Optional[str] = None
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def source(self, name: str, fn: Callable[[], Iterable[Any]]) -> "Pipeline":
+        """Add the producing stage; ``fn()`` returns an iterable of items."""
+        self._stages[name] = _Stage(name, fn, source=True)
+        self._last = name
+        return self
+
+    def stage(self, name: str, fn: Callable[[Any], Any], after: Optional[str] = None) -> "Pipeline":
+        """Add a stage fed by ``after`` (default: the previously added stage).
+
+        ``fn(item)`` returns the item passed downstream; a stage without
+        consumers is a sink. Several stages may consume the same producer.
+        """
+        parent = self._stages[after or self._last]
+        st = _Stage(name, fn, source=False)
+        st.inbox = queue.Queue(maxsize=self.queue_size)
+        parent.outboxes.append(st.inbox)
+        self._stages[name] = st
+        self._last = name
+        return self
+
+    def _fail(self, e: BaseException) -> None:
+        with self._error_lock:
+            if self._error is None:
+                self._error = e
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _emit(self, st: _Stage, item: Any) -> bool:
+        for q in st.outboxes:
+            if not self._put(q, item):
+                return False
+        return True
+
+    def _run_stage(self, st: _Stage) -> None:
+        stats = st.stats
+        stats.started = time.perf_counter()
+        try:
+            if st.source:
+                it = iter(st.fn())
+                while not self._stop.is_set():
+                    t0 = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        break
+                    stats.add(time.perf_counter() - t0)
+                    if not self._emit(st, item):
+                        break
+            else:
+                while True:
+                    item = self._get(st.inbox)
+                    if item is _END:
+                        break
+                    t0 = time.perf_counter()
+                    out = st.fn(item)
+                    stats.add(time.perf_counter() - t0)
+                    if not self._emit(st, out):
+                        break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+            if not self._stop.is_set():
+                for q in st.outboxes:
+                    self._put(q, _END)
+
+    def run(self) -> None:
+        """Run all stages to completion; re-raises the first stage error."""
+        threads = [
+            threading.Thread(target=self._run_stage, args=(st,), name=f"stage-{st.name}", daemon=True)
+            for st in self._stages.values()
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: st.stats.as_dict() for name, st in self._stages.items()}
@@ -0,0 +1,113 @@
+from typing import Any, Dict, Optional
+
+from . import scheduler
+
+# Named performance profiles: inference size/precision, analysis frame
+# stride, output scale and encoder settings for a job. Profiles come from
+# the [profile:<name>] sections of config.ini (merged over the built-in ones
+# below); a profile may name a cheaper ``fallback`` that is used instead
+# while the queue is backed up.
+
+DEFAULTS: Dict[str, Any] = {
+    "model": None,          # None: YOLO_POSE_MODEL
+    "imgsz": 640,           # inference input size
+    "half": False,          # FP16 inference where the device supports it
+    "stride": 1,            # analyse every n-th frame
+    "analysis_fps": 0,      # analyse at (at least) this frame rate instead of a fixed stride; 0 = off
+    "reuse_overlay": True,  # draw the last analysed pose on the frames in between
+    "output_scale": 1.0,    # overlay/skeleton resolution relative to the input
+    "preset": "veryfast",   # libx264
+    "crf": 23,
+    "threads": 0,           # encoder threads, 0 = automatic
+    "skeleton": True,       # produce skeleton.mp4
+    "fallback": None,       # cheaper profile used when the queue backs up
+}
+
+BUILTIN: Dict[str, Dict[str, Any]] = {
+    "fast": {"imgsz": 480, "half": True, "analysis_fps": 10, "output_scale": 0.5, "preset": "ultrafast", "crf": 28,
+             "skeleton": False},
+    "balanced": {"fallback": "fast"},
+    "accurate": {"imgsz": 960, "preset": "medium", "crf": 20, "fallback": "balanced"},
+}
+
+_profiles: Dict[str, Dict[str, Any]] = {name: dict(DEFAULTS, **p) for name, p in BUILTIN.items()}
+_config = {
+    "default": "balanced",
+    "degrade_queue": 0,     # queued jobs per fallback step; 0 disables auto-degrade
+}
+
+
+def configure(profiles: Optional[Dict[str, Dict[str, Any]]] = None, default: Optional[str] = None,
+              degrade_queue: Optional[int] = None) -> None:
+    if profiles:
+        for name, settings in profiles.items():
+            base = _profiles.get(name, DEFAULTS)
+            _profiles[name] = dict(base, **{k: v for k, v in settings.items() if k in DEFAULTS})
+    if default is not None:
+        if default not in _profiles:
+            raise ValueError(f"Unknown profile: {default}")
+        _config["default"] = default
+    if degrade_queue is not None:
+        _config["degrade_queue"] = max(0, int(degrade_queue))
+
+
+def names():
+    return list(_profiles)
+
+
+def get(name: Optional[str] = None) -> Dict[str, Any]:
+    """Settings of profile ``name`` (the default profile when None or unknown)."""
+    profile = _profiles.get(name or "") or _profiles[_config["default"]]
+    return dict(profile)
+
+
+def select(name: Optional[str] = None) -> str:
+    """
+    The profile to run a new job with: ``name`` (or the default), followed
+    along its fallbacks one step per ``degrade_queue`` queued jobs.
+    """
+    name = name if name in _profiles else _config["default"]
+    per_step = _config["degrade_queue"]
+    if not per_step:
+        return name
+    steps = scheduler.get_stats()["queued"] // per_step
+    seen = {name}
+    while steps > 0:
+        fallback = _profiles[name].get("fallback")
+        if not fallback or fallback not in _profiles or fallback in seen:
+            break
+        name = fallback
+        seen.add(name)
+        steps -= 1
+    return name
+
+
+def inference_settings(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Keyword arguments for ``models.acquire`` and ``model.track``."""
+    settings = {"imgsz": int(profile.get("imgsz") or DEFAULTS["imgsz"])}
+    if profile.get("half"):
+        settings["half"] = True
+    return settings
+
+
+def frame_stride(profile: Dict[str, Any], fps: float) -> int:
+    """Analyse every n-th frame: ``analysis_fps`` (never below it) if set, else ``stride``."""
+    target = float(profile.get("analysis_fps") or 0)
+    if target > 0 and fps > 0:
+        return max(1, int(fps // target))
+    return max(1, int(profile.get("stride") or 1))
+
+
+def encoder_options(profile: Dict[str, Any]) -> Dict[str, str]:
+    options = {"preset": str(profile.get("preset") or DEFAULTS["preset"]), "crf": str(profile.get("crf", DEFAULTS["crf"]))}
+    if profile.get("threads"):
+        options["threads"] = str(int(profile["threads"]))
+    return options
+
+
+def output_size(width: int, height: int, profile: Dict[str, Any]):
+    """Output resolution for ``output_scale``; even, as libx264 with yuv420p requires."""
+    scale = float(profile.get("output_scale") or 1.0)
+    if scale >= 1.0:
+        return width, height
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
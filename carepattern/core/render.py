@@ -0,0 +1,167 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import av
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from . import profiles
+from .keypoints import ARCHIVE_DIRNAME, KeypointArchive
+from .video import _open_encoder, _ensure_frame
+
+# On-demand rendering of overlay.mp4/skeleton.mp4 from the raw video and the
+# keypoint archive, for jobs that ran in analysis-only mode. A render runs
+# once per upload folder; concurrent requests share it. A failed render is
+# not retried until the archive changes (a new analysis of the upload).
+# Only the outputs the job's profile asks for are made (no skeleton.mp4 when
+# it disabled the skeleton video), at its output scale, and only those that
+# are missing: an overlay the job already wrote is never replaced.
+
+OUTPUTS = ("overlay.mp4", "skeleton.mp4")
+
+_lock = threading.Lock()
+_renders: Dict[str, Dict[str, Optional[str]]] = {}
+
+
+def build_results(frame: np.ndarray, ids: np.ndarray, boxes: np.ndarray, keypoints: np.ndarray, names: Dict[int, str]) -> Results:
+    """Rebuild an ultralytics Results object (for plotting) from archived arrays."""
+    boxes_data = np.concatenate([boxes[:, :4], ids[:, None].astype(np.float32), boxes[:, 4:6]], axis=1) if len(ids) \
+        else np.zeros((0, 7), dtype=np.float32)
+    return Results(
+        orig_img=frame,
+        path="",
+        names=names,
+        boxes=torch.from_numpy(np.ascontiguousarray(boxes_data, dtype=np.float32)),
+        keypoints=torch.from_numpy(np.ascontiguousarray(keypoints, dtype=np.float32)),
+    )
+
+
+def _inputs(folder: Path):
+    """Identifies the keypoint archive a render starts from; rewritten by every analysis."""
+    try:
+        st = (Path(folder) / ARCHIVE_DIRNAME / "meta.json").stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _failed(state: Optional[Dict], folder: Path) -> bool:
+    return state is not None and state["state"] == "error" and state.get("inputs") == _inputs(folder)
+
+
+def outputs(skeleton: bool = True):
+    """The videos a job makes: the overlay, and the skeleton video unless its profile disabled it."""
+    return OUTPUTS if skeleton else OUTPUTS[:1]
+
+
+def _missing(folder: Path, skeleton: bool = True):
+    return [name for name in outputs(skeleton) if not (folder / name).exists()]
+
+
+def render_state(folder: Path, skeleton: bool = True) -> str:
+    """'ready', 'rendering', 'pending' (can be rendered), 'error' or 'missing' (nothing to render from)."""
+    folder = Path(folder)
+    if not _missing(folder, skeleton):
+        return "ready"
+    with _lock:
+        state = _renders.get(str(folder))
+    if state is not None and (state["state"] == "rendering" or _failed(state, folder)):
+        return state["state"]
+    return "pending" if KeypointArchive.exists(folder) else "missing"
+
+
+def ensure_rendered(folder: Path, output_scale: float = 1.0, skeleton: bool = True) -> str:
+    """
+    Start rendering the missing outputs of ``folder`` if needed and return
+    its state; ``output_scale`` and ``skeleton`` as in the job's profile.
+    """
+    folder = Path(folder)
+    key = str(folder)
+    with _lock:
+        state = _renders.get(key)
+        if state is not None and state["state"] == "rendering":
+            return "rendering"
+        missing = _missing(folder, skeleton)
+        if not missing:
+            return "ready"
+        if not KeypointArchive.exists(folder):
+            return "missing"
+        if _failed(state, folder):
+            return "error"
+        _renders[key] = {"state": "rendering", "error": None, "inputs": _inputs(folder)}
+    threading.Thread(target=_render, args=(folder, missing, output_scale), name="render", daemon=True).start()
+    return "rendering"
+
+
+def _render(folder: Path, names, output_scale: float = 1.0) -> None:
+    key = str(folder)
+    tmp = {name: folder / f".{Path(name).stem}.rendering.mp4" for name in names}
+    try:
+        render_archive(folder, tmp.get("overlay.mp4"), tmp.get("skeleton.mp4"), output_scale=output_scale)
+        for name, part in tmp.items():
+            os.replace(part, folder / name)
+        with _lock:
+            _renders.pop(key, None)
+    except Exception as e:
+        print(f"Error rendering {folder}: {e}")
+        for part in tmp.values():
+            part.unlink(missing_ok=True)
+        with _lock:
+            _renders[key] = dict(_renders.get(key) or {}, state="error", error=str(e))
+
+
+def render_archive(folder: Path, overlay_path: Optional[Path], skeleton_path: Optional[Path],
+                   output_scale: float = 1.0) -> None:
+    """Render the overlay and/or skeleton video (None skips it) at ``output_scale`` of the input."""
+    archive = KeypointArchive(folder)
+    meta = archive.meta
+    names = {int(k): v for k, v in (meta.get("names") or {0: "person"}).items()}
+    cap = cv2.VideoCapture(str(folder / meta["source"]))
+    if not cap.isOpened():
+        raise RuntimeError(f"Kan video niet openen: {meta['source']}")
+    fps = float(meta.get("fps") or cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    width = int(meta.get("width") or cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(meta.get("height") or cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    out_width, out_height = profiles.output_size(width, height, {"output_scale": output_scale})
+    stride = max(1, int(meta.get("stride") or 1))
+    reuse_overlay = bool(meta.get("reuse_overlay"))
+    # rendered to a temporary file and only served when complete
+    encoders = []
+    try:
+        for path, skeleton in ((overlay_path, False), (skeleton_path, True)):
+            if path is not None:
+                encoders.append((skeleton,) + _open_encoder(path, fps, out_width, out_height))
+        frame_idx = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            annotated = frame
+            skeleton_only = np.zeros_like(frame)
+            analysed = frame_idx // stride
+            if (frame_idx % stride == 0 or reuse_overlay) and analysed < len(archive):
+                ids, boxes, kps = archive.frame(analysed)
+                if len(ids):
+                    result = build_results(frame, np.asarray(ids), np.asarray(boxes), np.asarray(kps), names)
+                    if overlay_path is not None:
+                        annotated = result.plot()
+                    if skeleton_path is not None:
+                        skeleton_only = result.plot(img=skeleton_only)
+
+            for skeleton, container, stream in encoders:
+                img = _ensure_frame(skeleton_only if skeleton else annotated, out_width, out_height)
+                for packet in stream.encode(av.VideoFrame.from_ndarray(img, format="bgr24")):
+                    container.mux(packet)
+            frame_idx += 1
+
+        for _, container, stream in encoders:
+            for packet in stream.encode():
+                container.mux(packet)
+    finally:
+        for _, container, _ in encoders:
+            container.close()
+        cap.release()
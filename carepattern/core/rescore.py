@@ -0,0 +1,85 @@
+import argparse
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from . import events, zones
+from .detect import Thresholds, default_thresholds, forget_job, process_tracks, start_job
+from .keypoints import KeypointArchive
+
+# Re-scoring: replay the detection state machine over a job's keypoint archive
+# with different thresholds, without running the pose model again.
+
+RESCORE_DIRNAME = "rescore"
+
+
+def rescore(folder: Path, thresholds: Optional[Thresholds] = None, output_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """
+    Replay ``process_tracks`` over the keypoint archive of an upload folder and
+    return the resulting events. The legacy/structured outputs are written to
+    ``output_dir`` (default ``<folder>/rescore``), replacing earlier re-scores.
+    """
+    folder = Path(folder)
+    archive = KeypointArchive(folder)
+    # the archive holds every ``stride``-th frame of the video
+    stride = max(1, int(archive.meta.get("stride") or 1))
+    fps = float(archive.meta.get("fps") or 30.0)
+    output_dir = Path(output_dir) if output_dir is not None else folder / RESCORE_DIRNAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    prediction_path = output_dir / "prediction.txt"
+    for stale in (prediction_path, output_dir / events.EVENTS_FILENAME):
+        stale.unlink(missing_ok=True)
+
+    key = f"rescore-{uuid.uuid4().hex}"
+    start_job(key, thresholds or default_thresholds())
+    # zone events are replayed too, with the zones the job was analysed with
+    monitor = None
+    if archive.meta.get("zones"):
+        monitor = zones.ZoneMonitor(zones.ZoneIndex(archive.meta["zones"], int(archive.meta["width"]), int(archive.meta["height"])),
+                                    prediction_path, fps, stride,
+                                    confirm_seconds=float(archive.meta.get("zone_confirm_seconds") or 0.5))
+    try:
+        for i in range(len(archive)):
+            ids, boxes, kps = archive.frame(i)
+            if len(ids):
+                process_tracks(ids, kps, i * stride, prediction_path, fps, key, stride)
+            # like the live pipeline, empty frames still advance the zone monitor
+            if monitor is not None:
+                monitor.update(ids, boxes, kps, i * stride)
+    finally:
+        events.close_writer(prediction_path)
+        forget_job(key)
+    return events.read_events(output_dir) or []
+
+
+def thresholds_from_mapping(values: Dict[str, Any]) -> Thresholds:
+    """Thresholds from a mapping of field names to (string) values; missing fields keep their default."""
+    base = default_thresholds()
+    updates = {}
+    for field, default in base._asdict().items():
+        v = values.get(field)
+        if v is None or v == "":
+            continue
+        updates[field] = type(default)(v)
+    return base._replace(**updates)
+
+
+def main(argv=None) -> int:
+    base = default_thresholds()
+    parser = argparse.ArgumentParser(description="Re-score an analysed upload with new detection thresholds.")
+    parser.add_argument("folder", help="upload folder containing a keypoints/ archive")
+    parser.add_argument("--output-dir", help="where to write prediction.txt/events.jsonl (default: <folder>/rescore)")
+    for field, default in base._asdict().items():
+        parser.add_argument("--" + field.replace("_", "-"), type=type(default), default=None,
+                            help=f"default: {default}")
+    args = parser.parse_args(argv)
+
+    thresholds = thresholds_from_mapping({f: getattr(args, f) for f in base._fields})
+    found = rescore(Path(args.folder), thresholds, Path(args.output_dir) if args.output_dir else None)
+    for event in found:
+        print(events.format_event(event))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .jobs import set_status, set_fields, request_cancel
+
+# Bounded job scheduler: a fixed pool of worker threads pulls jobs from a
+# priority queue (lower value first, FIFO within a priority).
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+_cond = threading.Condition()
+_queue: List[Tuple[int, int, str]] = []
+_tasks: Dict[str, Tuple[Callable, tuple, dict]] = {}
+_running: Dict[str, float] = {}
+_workers: List[threading.Thread] = []
+_durations: deque = deque(maxlen=20)
+_seq = itertools.count()
+# queue positions are computed under ``_cond`` and written to the job store
+# after releasing it; a snapshot that arrives after a newer one is dropped
+_publish_lock = threading.Lock()
+_snapshots = itertools.count(1)
+_published = 0
+
+_config = {
+    "max_workers": 2,
+    "max_queue": 20,
+}
+
+
+def configure(max_workers: Optional[int] = None, max_queue: Optional[int] = None) -> None:
+    with _cond:
+        if max_workers is not None:
+            _config["max_workers"] = max(1, int(max_workers))
+        if max_queue is not None:
+            _config["max_queue"] = max(0, int(max_queue))
+        _ensure_workers_locked()
+
+
+def _ensure_workers_locked() -> None:
+    alive = [t for t in _workers if t.is_alive()]
+    _workers[:] = alive
+    while len(_workers) < _config["max_workers"]:
+        t = threading.Thread(target=_worker_loop, name=f"job-worker-{len(_workers)}", daemon=True)
+        _workers.append(t)
+        t.start()
+
+
+def is_full() -> bool:
+    with _cond:
+        return len(_tasks) >= _config["max_queue"]
+
+
+def submit(job_id: str, fn: Callable, *args: Any, priority: int = 0, **kwargs: Any) -> None:
+    """Queue ``fn(*args, **kwargs)`` for ``job_id``; raises QueueFullError when the queue is at capacity."""
+    with _cond:
+        if len(_tasks) >= _config["max_queue"]:
+            raise QueueFullError("Wachtrij is vol, probeer het later opnieuw")
+        _tasks[job_id] = (fn, args, kwargs)
+        heapq.heappush(_queue, (int(priority), next(_seq), job_id))
+        _ensure_workers_locked()
+        positions = _positions_locked()
+        _cond.notify()
+    _publish(positions)
+
+
+def cancel(job_id: str) -> bool:
+    """Cancel a queued job, or flag a running job so its frame loop stops."""
+    with _cond:
+        if job_id in _tasks:
+            del _tasks[job_id]
+            _queue[:] = [entry for entry in _queue if entry[2] != job_id]
+            heapq.heapify(_queue)
+            positions = _positions_locked()
+            queued = True
+        elif job_id in _running:
+            queued = False
+        else:
+            return False
+    if queued:
+        _publish(positions)
+    request_cancel(job_id)
+    if queued:
+        set_fields(job_id, queue_position=None, eta=None)
+        set_status(job_id, "cancelled")
+    return True
+
+
+def _average_duration() -> Optional[float]:
+    if not _durations:
+        return None
+    return sum(_durations) / len(_durations)
+
+
+def _positions_locked() -> Tuple[int, List[Tuple[str, int, Optional[int]]]]:
+    """Snapshot of (job_id, position, eta) for the queued jobs; publish it with ``_publish`` after releasing ``_cond``."""
+    avg = _average_duration()
+    workers = _config["max_workers"]
+    now = time.monotonic()
+    # time until the first worker frees up, based on the oldest running job
+    busy_for = 0.0
+    if avg is not None and len(_running) >= workers:
+        busy_for = max(0.0, avg - max(now - t for t in _running.values()))
+    positions = []
+    for position, (_, _, job_id) in enumerate(sorted(_queue), start=1):
+        eta = None
+        if avg is not None:
+            eta = int(busy_for + ((position - 1) // workers) * avg)
+        positions.append((job_id, position, eta))
+    return next(_snapshots), positions
+
+
+def _publish(snapshot: Tuple[int, List[Tuple[str, int, Optional[int]]]]) -> None:
+    # one job store write (and so one SSE message) per queued job
+    global _published
+    number, positions = snapshot
+    with _publish_lock:
+        if number < _published:
+            return
+        _published = number
+        for job_id, position, eta in positions:
+            set_fields(job_id, queue_position=position, eta=eta, status=f"In wachtrij (positie {position})")
+
+
+def _worker_loop() -> None:
+    while True:
+        with _cond:
+            while not _queue:
+                _cond.wait()
+            if len(_workers) > _config["max_workers"] and threading.current_thread() in _workers:
+                # pool was shrunk: leave without taking work
+                _workers.remove(threading.current_thread())
+                _cond.notify()
+                return
+            _, _, job_id = heapq.heappop(_queue)
+            task = _tasks.pop(job_id, None)
+            if task is None:
+                continue
+            _running[job_id] = time.monotonic()
+            positions = _positions_locked()
+
+        _publish(positions)
+        set_fields(job_id, queue_position=None, eta=None)
+        fn, args, kwargs = task
+        started = time.monotonic()
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+        finally:
+            with _cond:
+                _running.pop(job_id, None)
+                _durations.append(time.monotonic() - started)
+                positions = _positions_locked()
+            _publish(positions)
+
+
+def get_stats() -> Dict[str, Any]:
+    with _cond:
+        return {
+            "max_workers": _config["max_workers"],
+            "max_queue": _config["max_queue"],
+            "queued": len(_tasks),
+            "running": len(_running),
+            "average_duration": _average_duration(),
+        }
@@ -0,0 +1,343 @@
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import av
+import cv2
+import numpy as np
+
+from . import models, profiles, zones
+from .detect import process_tracks
+from .keypoints import KeypointArchiveWriter, arrays_from_results
+from .jobs import set_status, set_progress, is_cancelled
+from .video import FASTSTART_MOVFLAGS, JobCancelled, _open_encoder, _ensure_frame
+
+# Segment-parallel analysis of long videos. The input is split on keyframes,
+# every segment is tracked and rendered in parallel, and the results are
+# merged: track IDs are stitched across segment boundaries using a short
+# overlap, the detection state machine is replayed sequentially over the
+# stitched tracks (so prediction.txt matches a sequential run) and the
+# rendered segments are concatenated without re-encoding.
+
+# B-frames make per-segment DTS start below zero, which breaks packet-level
+# concatenation; segments are encoded without them.
+_SEGMENT_ENCODER_OPTIONS = {"bf": "0"}
+
+
+class _Progress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, n: int = 1) -> None:
+        with self._lock:
+            self.value += n
+
+
+class _FrameTracks:
+    __slots__ = ("index", "ids", "boxes", "keypoints")  # boxes: x1, y1, x2, y2, conf, cls
+
+    def __init__(self, index: int, ids: np.ndarray, boxes: np.ndarray, keypoints: np.ndarray):
+        self.index = index
+        self.ids = ids
+        self.boxes = boxes
+        self.keypoints = keypoints
+
+
+def _tracks_from_results(index: int, results) -> _FrameTracks:
+    return _FrameTracks(index, *arrays_from_results(results))
+
+
+def find_keyframes(input_path: Path) -> Tuple[List[int], float, int]:
+    """Return keyframe frame indices, fps and frame count by demuxing (no decoding)."""
+    with av.open(str(input_path)) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or 30.0)
+        time_base = float(stream.time_base)
+        start = stream.start_time or 0
+        keyframes = []
+        total = 0
+        for packet in container.demux(stream):
+            if packet.size == 0 or packet.pts is None:
+                continue
+            total += 1
+            if packet.is_keyframe:
+                keyframes.append(int(round((packet.pts - start) * time_base * fps)))
+    return sorted(set(keyframes)) or [0], fps, total
+
+
+def plan_segments(keyframes: List[int], total_frames: int, count: int) -> List[Tuple[int, int]]:
+    """Split [0, total_frames) into at most ``count`` segments starting on keyframes."""
+    if count <= 1 or total_frames <= 0:
+        return [(0, total_frames)]
+    target = total_frames / count
+    starts = [0]
+    for kf in keyframes:
+        if kf <= starts[-1] or kf >= total_frames:
+            continue
+        if kf >= target * len(starts):
+            starts.append(kf)
+            if len(starts) == count:
+                break
+    ends = starts[1:] + [total_frames]
+    return list(zip(starts, ends))
+
+
+def _analyse_segment(input_path: Path, start: int, end: int, overlap: int, model_path: str, tmp_dir: Path,
+                     seg_idx: int, fps: float, width: int, height: int, job_id: str, progress: _Progress,
+                     render: bool = True, inference: Optional[Dict[str, Any]] = None,
+                     encoder_options: Optional[Dict[str, str]] = None,
+                     roi: Optional[Tuple[int, int, int, int]] = None,
+                     abort: Optional[threading.Event] = None) -> List[_FrameTracks]:
+    inference = inference or {}
+    pose_model = models.acquire(model_path, **inference)
+    cap = cv2.VideoCapture(str(input_path))
+    container_overlay = container_skeleton = None
+    if render:
+        overlay_path = tmp_dir / f"overlay_{seg_idx:04d}.mp4"
+        skeleton_path = tmp_dir / f"skeleton_{seg_idx:04d}.mp4"
+        segment_options = dict(encoder_options or {}, **_SEGMENT_ENCODER_OPTIONS)
+        # the segments are remuxed into a faststart file afterwards
+        container_overlay, stream_overlay = _open_encoder(overlay_path, fps, width, height, segment_options,
+                                                          faststart=False)
+        container_skeleton, stream_skeleton = _open_encoder(skeleton_path, fps, width, height, segment_options,
+                                                            faststart=False)
+    tracks: List[_FrameTracks] = []
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for frame_idx in range(start, end + overlap):
+            if is_cancelled(job_id) or (abort is not None and abort.is_set()):
+                # cancelled, or a sibling segment failed and the job is lost anyway
+                raise JobCancelled()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            try:
+                results = pose_model.track(zones.crop(frame, roi), persist=True, classes=[0], verbose=False, **inference)
+                results = zones.shift_results(results, roi, frame)
+            except Exception:
+                results = None
+            tracks.append(_tracks_from_results(frame_idx, results))
+            if frame_idx >= end:
+                # overlap frames are only used for stitching
+                continue
+            progress.add()
+            if not render:
+                continue
+
+            annotated = frame
+            skeleton_only = np.zeros_like(frame)
+            if results and len(results) > 0:
+                try:
+                    plotted = results[0].plot()
+                    if isinstance(plotted, np.ndarray) and plotted.size:
+                        annotated = plotted
+                    skeleton_only = results[0].plot(img=skeleton_only)
+                except Exception:
+                    annotated = frame
+                    skeleton_only = np.zeros_like(frame)
+
+            for packet in stream_overlay.encode(av.VideoFrame.from_ndarray(_ensure_frame(annotated, width, height), format="bgr24")):
+                container_overlay.mux(packet)
+            for packet in stream_skeleton.encode(av.VideoFrame.from_ndarray(_ensure_frame(skeleton_only, width, height), format="bgr24")):
+                container_skeleton.mux(packet)
+
+        if render:
+            for packet in stream_overlay.encode():
+                container_overlay.mux(packet)
+            for packet in stream_skeleton.encode():
+                container_skeleton.mux(packet)
+    finally:
+        if container_overlay is not None:
+            container_overlay.close()
+        if container_skeleton is not None:
+            container_skeleton.close()
+        cap.release()
+        models.release(pose_model)
+    return tracks
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def stitch_tracks(segments: List[List[_FrameTracks]], bounds: List[Tuple[int, int]], min_iou: float = 0.5) -> List[_FrameTracks]:
+    """
+    Map segment-local track IDs onto global IDs and return the merged per-frame tracks.
+    Tracks of neighbouring segments are linked by majority IoU vote over the overlap frames.
+    """
+    merged: List[_FrameTracks] = []
+    next_id = 1
+    prev_by_frame: Dict[int, _FrameTracks] = {}
+
+    for seg_tracks, (start, end) in zip(segments, bounds):
+        votes: Dict[int, Dict[int, int]] = {}
+        for ft in seg_tracks:
+            prev = prev_by_frame.get(ft.index)
+            if prev is None:
+                continue
+            iou = _iou_matrix(ft.boxes[:, :4], prev.boxes[:, :4])
+            for i, local in enumerate(ft.ids):
+                if iou.shape[1] == 0:
+                    continue
+                j = int(np.argmax(iou[i]))
+                if iou[i, j] >= min_iou:
+                    v = votes.setdefault(int(local), {})
+                    v[int(prev.ids[j])] = v.get(int(prev.ids[j]), 0) + 1
+
+        mapping: Dict[int, int] = {}
+        taken = set()
+        # strongest links first so two local tracks can't claim the same global ID
+        for local, gid, _ in sorted(((l, g, n) for l, v in votes.items() for g, n in v.items()), key=lambda x: -x[2]):
+            if local in mapping or gid in taken:
+                continue
+            mapping[local] = gid
+            taken.add(gid)
+
+        prev_by_frame = {}
+        for ft in seg_tracks:
+            gids = []
+            for local in ft.ids:
+                local = int(local)
+                if local not in mapping:
+                    mapping[local] = next_id
+                    next_id += 1
+                gids.append(mapping[local])
+            mapped = _FrameTracks(ft.index, np.asarray(gids, dtype=np.int64), ft.boxes, ft.keypoints)
+            if ft.index < end:
+                merged.append(mapped)
+            else:
+                prev_by_frame[ft.index] = mapped
+        next_id = max([next_id] + [g + 1 for g in mapping.values()])
+    return merged
+
+
+def _add_stream_like(container, template):
+    add_from_template = getattr(container, "add_stream_from_template", None)
+    if add_from_template is not None:
+        return add_from_template(template)
+    return container.add_stream(template=template)
+
+
+def concat_videos(parts: List[Path], output_path: Path) -> None:
+    """Concatenate same-encoded MP4 parts by remuxing packets (no re-encoding)."""
+    with av.open(str(output_path), mode="w", format="mp4", container_options={"movflags": FASTSTART_MOVFLAGS}) as out:
+        out_stream = None
+        offset = 0
+        for part in parts:
+            with av.open(str(part)) as src:
+                in_stream = src.streams.video[0]
+                if out_stream is None:
+                    out_stream = _add_stream_like(out, in_stream)
+                end = offset
+                for packet in src.demux(in_stream):
+                    if packet.dts is None:
+                        continue
+                    packet.pts = (packet.pts or 0) + offset
+                    packet.dts = packet.dts + offset
+                    end = max(end, packet.pts + (packet.duration or 0))
+                    packet.stream = out_stream
+                    out.mux(packet)
+                offset = end
+
+
+def process_segmented(input_path: Path, output_path: Path, skeleton_output_path: Path, prediction_output_path: Path,
+                      job_id: str, model_path: str, options: Dict[str, Any]) -> bool:
+    """
+    Analyse ``input_path`` in parallel segments. Returns False when the video
+    is too short to be worth splitting, so the caller can fall back to the
+    sequential pipeline.
+    """
+    workers = int(options.get("segment_workers", 1))
+    overlap = int(options.get("segment_overlap", 15))
+    keyframes, fps, total_frames = find_keyframes(input_path)
+    if workers <= 1 or total_frames < fps * float(options.get("segment_min_seconds", 600)):
+        return False
+    bounds = plan_segments(keyframes, total_frames, workers)
+    if len(bounds) <= 1:
+        return False
+
+    cap = cv2.VideoCapture(str(input_path))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+    cap.release()
+    if width <= 0 or height <= 0:
+        raise RuntimeError("Invalid video dimensions from input.")
+
+    render = options.get("render_mode") != "lazy"
+    # segments use the profile's inference and encoder settings; every frame is analysed
+    profile = options.get("profile") or profiles.get()
+    inference = profiles.inference_settings(profile)
+    encoder_options = profiles.encoder_options(profile)
+    zone_map = options.get("zones") or {}
+    zone_confirm_seconds = float(options.get("zone_confirm_seconds") or 0.5)
+    roi = None
+    if zone_map and options.get("zone_roi_crop"):
+        roi = zones.roi_box(zone_map, width, height, float(options.get("zone_roi_padding", 0.05)))
+    set_status(job_id, f"Bewegingsanalyse wordt uitgevoerd in {len(bounds)} segmenten...")
+    tmp_dir = Path(tempfile.mkdtemp(prefix="segments_", dir=output_path.parent))
+    progress = _Progress()
+    abort = threading.Event()
+    try:
+        with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix="segment") as pool:
+            futures = [
+                pool.submit(_analyse_segment, input_path, start, end, overlap, model_path, tmp_dir,
+                            i, fps, width, height, job_id, progress, render, inference, encoder_options, roi, abort)
+                for i, (start, end) in enumerate(bounds)
+            ]
+            pending = set(futures)
+            try:
+                while pending:
+                    done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        f.result()  # re-raise segment errors
+                    percent = int(progress.value * 100 / max(1, total_frames))
+                    set_status(job_id, f"Verwerking: {percent}% ({len(bounds) - len(pending)}/{len(bounds)} segmenten klaar)")
+                    set_progress(job_id, percent)
+            except BaseException:
+                # stop the other segments at their next frame instead of letting
+                # the pool's shutdown wait for them to finish
+                abort.set()
+                for f in futures:
+                    f.cancel()
+                raise
+            segment_tracks = [f.result() for f in futures]
+
+        set_status(job_id, "Segmenten samenvoegen...")
+        archive = KeypointArchiveWriter(output_path.parent)
+        monitor = None
+        if zone_map:
+            monitor = zones.ZoneMonitor(zones.ZoneIndex(zone_map, width, height), prediction_output_path, fps,
+                                        confirm_seconds=zone_confirm_seconds)
+        for ft in stitch_tracks(segment_tracks, bounds):
+            archive.add(ft.index, ft.ids, ft.boxes, ft.keypoints)
+            if len(ft.ids):
+                process_tracks(ft.ids, ft.keypoints, ft.index, prediction_output_path, fps, job_id)
+            if monitor is not None:
+                monitor.update(ft.ids, ft.boxes, ft.keypoints, ft.index)
+        archive.close({"fps": fps, "width": width, "height": height, "source": input_path.name,
+                       "model": str(model_path), "names": {0: "person"}, "zones": zone_map,
+                       "zone_confirm_seconds": zone_confirm_seconds})
+
+        if render:
+            concat_videos([tmp_dir / f"overlay_{i:04d}.mp4" for i in range(len(bounds))], output_path)
+            concat_videos([tmp_dir / f"skeleton_{i:04d}.mp4" for i in range(len(bounds))], skeleton_output_path)
+        else:
+            for stale in (output_path, skeleton_output_path):
+                stale.unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
@@ -0,0 +1,198 @@
+import math
+from typing import Any, List, Optional
+
+import lap
+import numpy as np
+from filterpy.kalman import KalmanFilter
+
+# In-house multi-person tracker, independent of the pose model: a constant
+# velocity Kalman filter per track on the box (SORT state: centre, area,
+# aspect ratio) and a Hungarian assignment on a cost that mixes box IoU with
+# the distance between predicted and detected keypoints. Because it only
+# needs detections, inference can run as plain ``predict`` calls (batched,
+# out of order, in parallel); the tracker itself must see the frames of a
+# video in order. Track IDs start at 1 and are never reused.
+
+
+def _z_from_box(box) -> np.ndarray:
+    w = max(float(box[2] - box[0]), 1e-3)
+    h = max(float(box[3] - box[1]), 1e-3)
+    return np.array([[box[0] + w / 2.0], [box[1] + h / 2.0], [w * h], [w / h]])
+
+
+def _box_from_x(x) -> np.ndarray:
+    s, r = max(float(x[2]), 1e-6), max(float(x[3]), 1e-6)
+    w = math.sqrt(s * r)
+    h = s / w
+    cx, cy = float(x[0]), float(x[1])
+    return np.array([cx - w / 2.0, cy - h / 2.0, cx + w / 2.0, cy + h / 2.0])
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (T, 4) and (N, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class _Track:
+    __slots__ = ("track_id", "kf", "keypoints", "center", "misses", "hits")
+
+    def __init__(self, track_id: int, box: np.ndarray, keypoints: Optional[np.ndarray]):
+        kf = KalmanFilter(dim_x=7, dim_z=4)
+        kf.F = np.eye(7)
+        kf.F[0, 4] = kf.F[1, 5] = kf.F[2, 6] = 1.0
+        kf.H = np.eye(4, 7)
+        kf.R[2:, 2:] *= 10.0
+        kf.P[4:, 4:] *= 1000.0  # velocities are unknown at first
+        kf.P *= 10.0
+        kf.Q[-1, -1] *= 0.01
+        kf.Q[4:, 4:] *= 0.01
+        kf.x[:4] = _z_from_box(box)
+        self.track_id = track_id
+        self.kf = kf
+        self.keypoints = keypoints
+        self.center = kf.x[:2, 0].copy()
+        self.misses = 0
+        self.hits = 1
+
+    def predict(self) -> np.ndarray:
+        if self.kf.x[6] + self.kf.x[2] <= 0:
+            self.kf.x[6] = 0.0
+        self.kf.predict()
+        self.misses += 1
+        return _box_from_x(self.kf.x[:, 0])
+
+    def predicted_keypoints(self) -> Optional[np.ndarray]:
+        """Last keypoints moved along with the predicted box centre."""
+        if self.keypoints is None:
+            return None
+        shifted = self.keypoints.copy()
+        shifted[:, :2] += self.kf.x[:2, 0] - self.center
+        return shifted
+
+    def update(self, box: np.ndarray, keypoints: Optional[np.ndarray]) -> None:
+        self.kf.update(_z_from_box(box))
+        self.keypoints = keypoints
+        self.center = self.kf.x[:2, 0].copy()
+        self.misses = 0
+        self.hits += 1
+
+
+class KeypointTracker:
+    """
+    ``update`` takes one frame of detections and returns the tracked ones as
+    rows of ``x1, y1, x2, y2, track_id, score, cls, index`` (``index`` into the
+    detections), the layout the ultralytics trackers return.
+    """
+
+    def __init__(self, max_age: int = 30, min_score: float = 0.1, new_track_score: float = 0.25,
+                 max_cost: float = 0.8, iou_weight: float = 0.5, keypoint_conf: float = 0.3,
+                 keypoint_scale: float = 0.5):
+        self.max_age = max_age
+        self.min_score = min_score
+        self.new_track_score = new_track_score
+        self.max_cost = max_cost
+        self.iou_weight = iou_weight
+        self.keypoint_conf = keypoint_conf
+        self.keypoint_scale = keypoint_scale
+        self.tracks: List[_Track] = []
+        self._next_id = 1
+
+    def reset(self) -> None:
+        self.tracks = []
+        self._next_id = 1
+
+    def _keypoint_cost(self, predicted: List[Optional[np.ndarray]], keypoints: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        """Mean keypoint distance relative to the detection size, clipped to 1; 1 without common keypoints."""
+        cost = np.ones((len(predicted), len(keypoints)))
+        rows = [i for i, kp in enumerate(predicted) if kp is not None]
+        if not rows:
+            return cost
+        pred = np.stack([predicted[i] for i in rows])
+        has_conf = pred.shape[-1] > 2 and keypoints.shape[-1] > 2
+        vis_p = pred[..., 2] >= self.keypoint_conf if has_conf else np.ones(pred.shape[:2], dtype=bool)
+        vis_d = keypoints[..., 2] >= self.keypoint_conf if has_conf else np.ones(keypoints.shape[:2], dtype=bool)
+        dist = np.linalg.norm(pred[:, None, :, :2] - keypoints[None, :, :, :2], axis=-1)
+        scale = np.sqrt(np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1.0)) * self.keypoint_scale
+        norm = np.clip(dist / scale[None, :, None], 0.0, 1.0)
+        valid = vis_p[:, None, :] & vis_d[None, :, :]
+        count = valid.sum(axis=-1)
+        mean = np.where(count > 0, (norm * valid).sum(axis=-1) / np.maximum(count, 1), 1.0)
+        cost[rows] = mean
+        return cost
+
+    def update(self, boxes: np.ndarray, scores: np.ndarray, keypoints: Optional[np.ndarray] = None,
+               classes: Optional[np.ndarray] = None) -> np.ndarray:
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        classes = np.zeros(len(boxes)) if classes is None else np.asarray(classes, dtype=np.float64).reshape(-1)
+        if keypoints is not None:
+            keypoints = np.asarray(keypoints, dtype=np.float64)
+
+        predicted_boxes = np.array([t.predict() for t in self.tracks]).reshape(-1, 4)
+        keep = np.flatnonzero(scores >= self.min_score)
+
+        matches = []
+        unmatched = list(keep)
+        if len(self.tracks) and len(keep):
+            cost = 1.0 - iou_matrix(predicted_boxes, boxes[keep])
+            if keypoints is not None:
+                kp_cost = self._keypoint_cost([t.predicted_keypoints() for t in self.tracks], keypoints[keep], boxes[keep])
+                cost = self.iou_weight * cost + (1.0 - self.iou_weight) * kp_cost
+            _, x, _ = lap.lapjv(cost, extend_cost=True, cost_limit=self.max_cost)
+            matched = set()
+            for t, j in enumerate(x):
+                if j >= 0:
+                    matches.append((t, int(keep[j])))
+                    matched.add(int(keep[j]))
+            unmatched = [d for d in keep if d not in matched]
+
+        out = []
+        for t, d in matches:
+            track = self.tracks[t]
+            track.update(boxes[d], None if keypoints is None else keypoints[d])
+            out.append((d, track.track_id))
+        for d in unmatched:
+            if scores[d] < self.new_track_score:
+                continue
+            track = _Track(self._next_id, boxes[d], None if keypoints is None else keypoints[d])
+            self._next_id += 1
+            self.tracks.append(track)
+            out.append((d, track.track_id))
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_age]
+
+        out.sort()
+        rows = [[*boxes[d], tid, scores[d], classes[d], d] for d, tid in out]
+        return np.array(rows, dtype=np.float64).reshape(-1, 8)
+
+    def update_results(self, result: Any) -> np.ndarray:
+        """``update`` with the detections of an ultralytics Results object."""
+        boxes = result.boxes
+        if boxes is None or not len(boxes):
+            return self.update(np.zeros((0, 4)), np.zeros(0))
+        keypoints = result.keypoints.data.cpu().numpy() if result.keypoints is not None else None
+        return self.update(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), keypoints, boxes.cls.cpu().numpy())
+
+
+def track_results(tracker: Any, result: Any, frame=None) -> Any:
+    """
+    Give a detection-only ultralytics Results the track IDs of ``tracker``
+    (a KeypointTracker or an ultralytics tracker), as ``model.track`` does.
+    """
+    import torch
+
+    if isinstance(tracker, KeypointTracker):
+        tracks = tracker.update_results(result)
+    else:
+        tracks = tracker.update(result.boxes.cpu().numpy(), frame)
+    if len(tracks) == 0:
+        return result
+    result = result[tracks[:, -1].astype(int)]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result
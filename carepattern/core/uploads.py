@@ -0,0 +1,269 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+import av
+import cv2
+
+# Chunked, resumable uploads. The client declares the total size, then sends
+# the file in chunks at increasing offsets; the bytes are written straight to
+# <upload>/raw.<ext> and hashed as they arrive. A session is described by
+# <upload>/.upload.json, which is removed when the upload completes, so the
+# state survives restarts (the offset is the size of the file on disk).
+#
+# GrowingVideoCapture lets a job decode the raw file while it is still being
+# uploaded: reads past the received bytes wait for the next chunk.
+
+SESSION_FILENAME = ".upload.json"
+
+_CHUNK_SIZE = 1 << 20
+
+_lock = threading.Lock()
+_sessions: Dict[str, "UploadSession"] = {}
+
+
+class UploadError(Exception):
+    """Rejected chunk; ``offset`` is where the client should continue."""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadIncomplete(RuntimeError):
+    pass
+
+
+class UploadSession:
+    def __init__(self, upload_id: str, folder: Path, filename: str, size: int, job_id: Optional[str] = None):
+        self.upload_id = upload_id
+        self.folder = Path(folder)
+        self.filename = filename
+        self.size = size
+        self.job_id = job_id
+        self.path = self.folder / filename
+        self._lock = threading.Lock()
+        self._digest = None
+        self._hashed = 0
+
+    @property
+    def offset(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"upload_id": self.upload_id, "filename": self.filename, "size": self.size, "job_id": self.job_id}
+
+    def save(self) -> None:
+        tmp = self.folder / (SESSION_FILENAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, self.folder / SESSION_FILENAME)
+
+    def _sync_digest(self) -> None:
+        # after a restart (or a broken chunk) hash what is already on disk
+        if self._digest is None:
+            self._digest, self._hashed = hashlib.sha256(), 0
+        offset = self.offset
+        if self._hashed == offset:
+            return
+        if self._hashed > offset:
+            self._digest, self._hashed = hashlib.sha256(), 0
+        with open(self.path, "rb") as f:
+            f.seek(self._hashed)
+            while self._hashed < offset:
+                chunk = f.read(min(_CHUNK_SIZE, offset - self._hashed))
+                if not chunk:
+                    break
+                self._digest.update(chunk)
+                self._hashed += len(chunk)
+
+    def write(self, offset: int, stream: BinaryIO, length: int) -> int:
+        """Append ``length`` bytes from ``stream`` at ``offset``; returns the new offset."""
+        with self._lock:
+            current = self.offset
+            if offset != current:
+                raise UploadError("Verkeerde offset", current)
+            if current + length > self.size:
+                raise UploadError("Chunk is groter dan het aangekondigde bestand", current)
+            self._sync_digest()
+            with open(self.path, "ab") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    f.flush()
+                    self._digest.update(chunk)
+                    self._hashed += len(chunk)
+                    remaining -= len(chunk)
+            if self.complete:
+                (self.folder / SESSION_FILENAME).unlink(missing_ok=True)
+            return self.offset
+
+    def content_hash(self) -> str:
+        with self._lock:
+            self._sync_digest()
+            return self._digest.hexdigest()
+
+
+def create_session(folder: Path, filename: str, size: int) -> UploadSession:
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    session = UploadSession(uuid.uuid4().hex, folder, filename, size)
+    session.path.unlink(missing_ok=True)
+    session.path.touch()
+    session.save()
+    with _lock:
+        _sessions[session.upload_id] = session
+    return session
+
+
+def get_session(upload_id: str, root: Path) -> Optional[UploadSession]:
+    """The session ``upload_id``; looked up on disk under ``root`` after a restart."""
+    with _lock:
+        session = _sessions.get(upload_id)
+    if session is not None:
+        return session
+    for marker in Path(root).glob(f"*/{SESSION_FILENAME}"):
+        try:
+            with open(marker) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get("upload_id") == upload_id:
+            session = UploadSession(upload_id, marker.parent, data["filename"], int(data["size"]), data.get("job_id"))
+            with _lock:
+                _sessions[upload_id] = session
+            return session
+    return None
+
+
+def forget_session(upload_id: str) -> None:
+    with _lock:
+        _sessions.pop(upload_id, None)
+
+
+def abort_session(session: UploadSession) -> None:
+    (session.folder / SESSION_FILENAME).unlink(missing_ok=True)
+    forget_session(session.upload_id)
+
+
+class GrowingFile(io.RawIOBase):
+    """
+    Read-only view of a file that is still being uploaded to ``size`` bytes.
+    Reads beyond the bytes received so far wait for them; if the upload is
+    aborted or stalls for ``stall_seconds`` the read fails.
+    """
+
+    def __init__(self, path: Path, size: int, stall_seconds: float = 600.0, poll_seconds: float = 0.2,
+                 cancelled: Optional[Callable[[], bool]] = None):
+        super().__init__()
+        self.path = Path(path)
+        self.size = size
+        self.stall_seconds = stall_seconds
+        self.poll_seconds = poll_seconds
+        self.cancelled = cancelled
+        self._f = open(self.path, "rb")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _wait_for(self, end: int) -> None:
+        last_size, last_change = -1, time.monotonic()
+        while True:
+            available = os.fstat(self._f.fileno()).st_size
+            if available >= end or available >= self.size:
+                return
+            if available != last_size:
+                last_size, last_change = available, time.monotonic()
+            elif time.monotonic() - last_change > self.stall_seconds:
+                raise UploadIncomplete("Upload is gestopt")
+            if not (self.path.parent / SESSION_FILENAME).exists() and os.fstat(self._f.fileno()).st_size < self.size:
+                raise UploadIncomplete("Upload is afgebroken")
+            if self.cancelled is not None and self.cancelled():
+                raise UploadIncomplete("Geannuleerd")
+            time.sleep(self.poll_seconds)
+
+    def readinto(self, b) -> int:
+        n = min(len(b), max(0, self.size - self._pos))
+        if n == 0:
+            return 0
+        self._wait_for(self._pos + n)
+        self._f.seek(self._pos)
+        data = self._f.read(n)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+class GrowingVideoCapture:
+    """The parts of cv2.VideoCapture the pipeline uses, decoding a GrowingFile with PyAV."""
+
+    def __init__(self, path: Path, size: int, **kwargs: Any):
+        self._file = GrowingFile(path, size, **kwargs)
+        self._container = av.open(self._file, mode="r")
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self._frames = self._container.decode(self._stream)
+
+    def isOpened(self) -> bool:
+        return self._container is not None
+
+    def get(self, prop: int) -> float:
+        stream = self._stream
+        if prop == cv2.CAP_PROP_FPS:
+            rate = stream.average_rate or stream.guessed_rate
+            return float(rate) if rate else 0.0
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(stream.codec_context.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(stream.codec_context.height)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(stream.frames or 0)
+        return 0.0
+
+    def read(self):
+        try:
+            frame = next(self._frames)
+        except StopIteration:
+            return False, None
+        return True, frame.to_ndarray(format="bgr24")
+
+    def release(self) -> None:
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+        self._file.close()
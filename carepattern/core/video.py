@@ -1,31 +1,149 @@
 # python
-import threading
+import time
 from pathlib import Path
+from typing import Any, Dict, Optional
 import cv2
 import numpy as np
 import av
-from ultralytics import YOLO
 
-from .jobs import set_status, set_output, set_error, set_progress
-from .detect import process_datapoints
+from . import batching, cache, detect, events, models, profiles, scheduler, workers, zones
+from .motion import MotionGate
+from .tracker import KeypointTracker, track_results
+from .jobs import set_status, set_output, set_error, set_fields, set_params, is_cancelled, interrupted_jobs
+from .detect import process_datapoints, forget_job
+from .pipeline import Pipeline
+from .keypoints import KeypointArchiveWriter, arrays_from_results
+from .uploads import GrowingVideoCapture
 
-def _process_video_file(input_path: str, output_path: str, skeleton_output_path, job_id: str, model_path: str = "yolo11n-pose.pt"):
-    set_status(job_id, "processing")
+
+class JobCancelled(Exception):
+    pass
+
+
+class _FrameItem:
+    __slots__ = ("index", "frame", "carried", "pending", "results", "annotated", "skeleton")
+
+    def __init__(self, index: int, frame):
+        self.index = index
+        self.frame = frame
+        self.carried = False
+        self.pending = None
+        self.results = None
+        self.annotated = None
+        self.skeleton = None
+
+
+# Fragmented MP4: every keyframe starts a fragment that is complete on disk,
+# so the part written so far can be played while the job is still running.
+FRAGMENTED_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof"
+# Complete files: index (moov) at the front so players can seek right away.
+FASTSTART_MOVFLAGS = "+faststart"
+
+
+def _open_encoder(path: Path, fps: float, width: int, height: int, extra_options: Optional[Dict[str, str]] = None,
+                  fragment_seconds: Optional[float] = None, faststart: bool = True):
+    container_options = {}
+    if fragment_seconds:
+        container_options["movflags"] = FRAGMENTED_MOVFLAGS
+    elif faststart:
+        container_options["movflags"] = FASTSTART_MOVFLAGS
+    container = av.open(str(path), mode="w", format="mp4", container_options=container_options)
+    stream = container.add_stream("libx264", rate=int(round(fps)))
+    stream.width = width
+    stream.height = height
+    stream.pix_fmt = "yuv420p"
+    options = {"preset": "veryfast", "crf": "23"}
+    if fragment_seconds:
+        # a keyframe, and so a fragment, every fragment_seconds
+        options["g"] = str(max(1, int(round(fps * fragment_seconds))))
+    stream.options = {**options, **(extra_options or {})}
+    return container, stream
+
+
+def _ensure_frame(img, width: int, height: int):
+    # Ensure uint8 and correct size
+    if img.dtype != np.uint8:
+        img = (np.clip(img, 0, 1) * 255).astype(np.uint8) if getattr(img, "max", lambda: 255)() <= 1.0 else img.astype(np.uint8)
+    if (img.shape[1], img.shape[0]) != (width, height):
+        img = cv2.resize(img, (width, height))
+    return img
+
+
+def _store_in_cache(options: Dict[str, Any], folder: Path) -> None:
+    key = options.get("cache_key")
+    if not key:
+        return
+    try:
+        cache.configure(root=options.get("cache_dir"), max_bytes=options.get("cache_max_bytes"))
+        cache.store(key, folder)
+    except Exception as e:
+        print(f"Error storing results in cache: {e}")
+
+
+def _process_video_file(input_path: str, output_path: str, skeleton_output_path, job_id: str, model_path: str = "yolo11n-pose.pt", options: Optional[Dict[str, Any]] = None):
+    set_fields(job_id, status="processing", started_at=time.time())
+    options = options or {}
+    # worker processes don't run create_app; apply process-wide settings from the job options
+    events.configure(flush_events=options.get("event_flush_events"), flush_seconds=options.get("event_flush_seconds"))
+    detect.configure(track_idle_frames=options.get("track_idle_frames"))
     input_path = Path(input_path)
     output_path = Path(output_path)
     skeleton_output_path = Path(skeleton_output_path)
     prediction_output_path = Path(output_path.parent / "prediction.txt")
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    # analysis-only: save keypoints and render the videos when they are first requested
+    lazy_render = options.get("render_mode") == "lazy"
+
     cap = None
     pose_model = None
+    client = None
+    job_tracker = None
+    container_overlay = None
+    container_skeleton = None
+    archive = None
+
+    # chunked upload that may still be arriving (see carepattern.core.uploads)
+    growing_size = options.get("growing_size")
+
+    # performance profile (see carepattern.core.profiles)
+    profile = options.get("profile") or profiles.get()
+    inference = profiles.inference_settings(profile)
+    with_skeleton = bool(profile.get("skeleton", True))
 
     try:
+        if int(options.get("segment_workers", 1)) > 1 and not growing_size:
+            from .segments import process_segmented
+            if process_segmented(input_path, output_path, skeleton_output_path, prediction_output_path, job_id, model_path, options):
+                events.close_writer(prediction_output_path)
+                _store_in_cache(options, output_path.parent)
+                set_status(job_id, "Analyse voltooid")
+                set_output(job_id, str(output_path))
+                set_status(job_id, "done")
+                return
+
         set_status(job_id, "Model laden...")
-        pose_model = YOLO(model_path)
+        # "ultralytics": model.track keeps the tracker state; "keypoint": detection-only
+        # inference and the in-house tracker (carepattern.core.tracker)
+        tracker_kind = options.get("tracker") or "ultralytics"
+        if int(options.get("inference_batch") or 1) > 1:
+            # inference in batches shared with the other jobs; tracking stays in this job
+            batching.configure(max_batch=options["inference_batch"], max_wait_ms=options.get("inference_batch_wait_ms"))
+            client = batching.connect(model_path, tracker=tracker_kind, **inference)
+        elif tracker_kind == "keypoint":
+            pose_model = models.acquire(model_path, tracking=False, **inference)
+            job_tracker = KeypointTracker()
+        else:
+            pose_model = models.acquire(model_path, **inference)
 
         set_status(job_id, "Video voorbereiden...")
-        cap = cv2.VideoCapture(str(input_path))
+        if growing_size:
+            # decode from the growing file; reads wait for chunks that haven't arrived yet
+            cap = GrowingVideoCapture(input_path, int(growing_size),
+                                      stall_seconds=float(options.get("upload_stall_seconds") or 600),
+                                      cancelled=lambda: is_cancelled(job_id))
+        else:
+            cap = cv2.VideoCapture(str(input_path))
         if not cap.isOpened():
             raise RuntimeError(f"Kan video niet openen: {input_path}")
 
@@ -35,104 +153,227 @@ def _process_video_file(input_path: str, output_path: str, skeleton_output_path,
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
         if width <= 0 or height <= 0:
             raise RuntimeError("Invalid video dimensions from input.")
+        out_width, out_height = profiles.output_size(width, height, profile)
+        # frames in between are only decoded (and rendered); see detect.Thresholds for the effect on detection
+        stride = profiles.frame_stride(profile, fps)
+        reuse_overlay = stride > 1 and bool(profile.get("reuse_overlay", True))
+        gate = None
+        if options.get("motion_gate"):
+            # max_skip is counted in analysed frames
+            gate = MotionGate(min_changed=float(options.get("motion_min_changed") or 0.002),
+                              max_skip=int(float(options.get("motion_max_skip_seconds") or 2.0) * fps / stride))
+        # zones of the camera (see carepattern.core.zones): enter/exit events and optionally the region inference sees
+        zone_map = options.get("zones") or {}
+        monitor = None
+        if zone_map:
+            monitor = zones.ZoneMonitor(zones.ZoneIndex(zone_map, width, height), prediction_output_path, fps, stride,
+                                        confirm_seconds=float(options.get("zone_confirm_seconds") or 0.5))
+        roi = None
+        if zone_map and options.get("zone_roi_crop"):
+            roi = zones.roi_box(zone_map, width, height, float(options.get("zone_roi_padding", 0.05)))
 
-        container_overlay = av.open(str(output_path), mode="w")
-        stream_overlay = container_overlay.add_stream("libx264", rate=int(round(fps)))
-        stream_overlay.width = width
-        stream_overlay.height = height
-        stream_overlay.pix_fmt = "yuv420p"
-        stream_overlay.options = {"preset": "veryfast", "crf": "23"}
-
-        container_skeleton = av.open(str(skeleton_output_path), mode="w")
-        stream_skeleton = container_skeleton.add_stream("libx264", rate=int(round(fps)))
-        stream_skeleton.width = width
-        stream_skeleton.height = height
-        stream_skeleton.pix_fmt = "yuv420p"
-        stream_skeleton.options = {"preset": "veryfast", "crf": "23"}
-
-        frame_idx = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if frame_idx == 0:
-                set_status(job_id, "Bewegingsanalyse wordt uitgevoerd...")
+        # every job keeps its tracks so it can be re-scored (and rendered later) without re-inference
+        archive = KeypointArchiveWriter(output_path.parent)
+        if lazy_render:
+            # stale videos of a previous run of this upload would otherwise be served
+            for stale in (output_path, skeleton_output_path):
+                stale.unlink(missing_ok=True)
+        else:
+            fragment_seconds = float(options.get("fragment_seconds") or 0)
+            encoder_options = profiles.encoder_options(profile)
+            container_overlay, stream_overlay = _open_encoder(output_path, fps, out_width, out_height, encoder_options,
+                                                              fragment_seconds=fragment_seconds)
+            if with_skeleton:
+                container_skeleton, stream_skeleton = _open_encoder(skeleton_output_path, fps, out_width, out_height,
+                                                                    encoder_options, fragment_seconds=fragment_seconds)
+            else:
+                skeleton_output_path.unlink(missing_ok=True)
 
-            annotated = frame
-            skeleton_only = np.zeros_like(frame)
+        # Pipeline stages: decode -> track -> detect -> render -> {overlay, skeleton} encoders
+        def decode():
+            frame_idx = 0
+            while True:
+                if is_cancelled(job_id):
+                    raise JobCancelled()
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                if frame_idx == 0:
+                    set_status(job_id, "Bewegingsanalyse wordt uitgevoerd...")
+                yield _FrameItem(frame_idx, frame)
+                frame_idx += 1
+
+        def motion(item):
+            # with a region of interest, motion outside it doesn't count
+            if item.index % stride == 0 and not gate.should_analyse(zones.crop(item.frame, roi)):
+                item.carried = True
+            return item
 
+        def infer(item):
+            # submitted ahead of tracking, so frames of this job can share a batch too
+            if item.index % stride == 0 and not item.carried:
+                item.pending = client.submit(zones.crop(item.frame, roi))
+            return item
+
+        last_tracked = [None]
+
+        def track(item):
+            if item.index % stride:
+                # between analysed frames: decoded (and rendered) only
+                return item
+            if item.carried:
+                # no motion: the last keypoints stand for this frame, the tracker isn't updated
+                item.results = last_tracked[0]
+                return item
             try:
-                results = pose_model.track(frame, persist=True, classes=[0], verbose=False)
+                # inference (and tracking) on the region of interest, results in full-frame coordinates
+                frame = zones.crop(item.frame, roi)
+                if client is not None:
+                    item.results = client.track(frame, item.pending)
+                    item.pending = None
+                elif job_tracker is not None:
+                    result = pose_model.predict(frame, classes=[0], verbose=False, **inference)[0]
+                    item.results = [track_results(job_tracker, result, frame)]
+                else:
+                    item.results = pose_model.track(frame, persist=True, classes=[0], verbose=False, **inference)
+                item.results = zones.shift_results(item.results, roi, item.frame)
             except Exception:
-                results = None
+                item.results = None
+            last_tracked[0] = item.results
+            return item
 
-            # Do detection on skeleton data
-            process_datapoints(datapoints=results, frame_number=frame_idx, output_path=prediction_output_path, fps=fps, job_id=job_id)
+        def detect_frame(item):
+            if item.index % stride == 0:
+                if item.results:
+                    process_datapoints(datapoints=item.results, frame_number=item.index, output_path=prediction_output_path,
+                                       fps=fps, job_id=job_id, stride=stride)
+                if monitor is not None:
+                    ids, boxes, kps = arrays_from_results(item.results)
+                    monitor.update(ids, boxes, kps, item.index)
+                # the archive holds the analysed frames only
+                archive.add_results(item.index // stride, item.results)
 
+            done = item.index + 1
+            if total_frames:
+                percent = int(done * 100 / max(1, total_frames))
+                remaining_frames = total_frames - done
+                estimated_time = remaining_frames / fps
+                status_message = f"Verwerking: {percent}% - Nog {int(estimated_time)}s te gaan"
+                set_fields(job_id, status=status_message, progress=percent, frames=done)
+            else:
+                set_fields(job_id, frames=done)
+            return item
+
+        last_results = [None]
+
+        def render(item):
             # Render overlay and skeleton-only video frames
+            frame = item.frame
+            annotated = frame
+            skeleton_only = np.zeros_like(frame) if with_skeleton else None
+            results = item.results
+            reused = False
+            if item.carried:
+                # carried-forward results belong to an earlier frame
+                reused = True
+            elif item.index % stride == 0:
+                last_results[0] = results
+            elif reuse_overlay:
+                results, reused = last_results[0], True
             if results and len(results) > 0:
                 try:
-                    plotted = results[0].plot()
+                    plotted = results[0].plot(img=frame) if reused else results[0].plot()
                     if isinstance(plotted, np.ndarray) and plotted.size:
                         annotated = plotted
                     # Draw skeleton on blank frame
-                    skeleton_only = results[0].plot(img=skeleton_only)
+                    if with_skeleton:
+                        skeleton_only = results[0].plot(img=skeleton_only)
                 except Exception:
                     annotated = frame
-                    skeleton_only = np.zeros_like(frame)
-            else:
-                skeleton_only = np.zeros_like(frame)
+                    skeleton_only = np.zeros_like(frame) if with_skeleton else None
 
-            # Ensure uint8 and correct size
-            for img in [annotated, skeleton_only]:
-                if img.dtype != np.uint8:
-                    img = (np.clip(img, 0, 1) * 255).astype(np.uint8) if getattr(img, "max", lambda: 255)() <= 1.0 else img.astype(np.uint8)
-                if (img.shape[1], img.shape[0]) != (width, height):
-                    img = cv2.resize(img, (width, height))
+            item.annotated = _ensure_frame(annotated, out_width, out_height)
+            if with_skeleton:
+                item.skeleton = _ensure_frame(skeleton_only, out_width, out_height)
+            # release what later stages don't need
+            item.results = None
+            return item
 
-            # Encode and mux overlay video
-            video_frame_overlay = av.VideoFrame.from_ndarray(annotated, format="bgr24")
+        def encode_overlay(item):
+            video_frame_overlay = av.VideoFrame.from_ndarray(item.annotated, format="bgr24")
             for packet in stream_overlay.encode(video_frame_overlay):
                 container_overlay.mux(packet)
 
-            # Encode and mux skeleton-only video
-            video_frame_skeleton = av.VideoFrame.from_ndarray(skeleton_only, format="bgr24")
+        def encode_skeleton(item):
+            video_frame_skeleton = av.VideoFrame.from_ndarray(item.skeleton, format="bgr24")
             for packet in stream_skeleton.encode(video_frame_skeleton):
                 container_skeleton.mux(packet)
 
-            frame_idx += 1
-            if total_frames:
-                percent = int(frame_idx * 100 / max(1, total_frames))
-                remaining_frames = total_frames - frame_idx
-                estimated_time = remaining_frames / fps
-                status_message = f"Verwerking: {percent}% - Nog {int(estimated_time)}s te gaan"
-                set_status(job_id, status_message)
-                set_progress(job_id, percent)
+        pipe = Pipeline(queue_size=options.get("queue_size", 8))
+        pipe.source("decode", decode)
+        if gate is not None:
+            pipe.stage("motion", motion)
+        if client is not None:
+            pipe.stage("infer", infer)
+        pipe.stage("track", track)
+        pipe.stage("detect", detect_frame)
+        if not lazy_render:
+            pipe.stage("render", render)
+            pipe.stage("encode_overlay", encode_overlay, after="render")
+            if with_skeleton:
+                pipe.stage("encode_skeleton", encode_skeleton, after="render")
+        try:
+            pipe.run()
+        finally:
+            extra = {}
+            if gate is not None:
+                extra["motion"] = gate.as_dict()
+            if monitor is not None:
+                extra["zones"] = monitor.as_dict()
+            set_fields(job_id, stages=pipe.stats(), **extra)
 
-        set_status(job_id, "Video's genereren...")
-        # Flush encoders and close containers
-        for packet in stream_overlay.encode():
-            container_overlay.mux(packet)
-        container_overlay.close()
+        archive.close({"fps": fps, "width": width, "height": height, "source": input_path.name,
+                       "model": str(model_path), "names": {0: "person"}, "stride": stride,
+                       "reuse_overlay": reuse_overlay, "zones": zone_map,
+                       "zone_confirm_seconds": float(options.get("zone_confirm_seconds") or 0.5)})
+        archive = None
+        if not lazy_render:
+            set_status(job_id, "Video's genereren...")
+            # Flush encoders and close containers
+            for packet in stream_overlay.encode():
+                container_overlay.mux(packet)
+            container_overlay.close()
 
-        for packet in stream_skeleton.encode():
-            container_skeleton.mux(packet)
-        container_skeleton.close()
+            if container_skeleton is not None:
+                for packet in stream_skeleton.encode():
+                    container_skeleton.mux(packet)
+                container_skeleton.close()
 
+        events.close_writer(prediction_output_path)
+        _store_in_cache(options, output_path.parent)
         set_status(job_id, "Analyse voltooid")
         set_output(job_id, str(output_path))
         set_status(job_id, "done")
     except Exception as e:
-        set_error(job_id, str(e))
+        if isinstance(e, JobCancelled) or is_cancelled(job_id):
+            set_status(job_id, "cancelled")
+        else:
+            set_error(job_id, str(e))
         try:
             if container_overlay is not None:
                 container_overlay.close()
             if container_skeleton is not None:
                 container_skeleton.close()
+            if archive is not None:
+                archive.abort()
         except Exception:
             pass
     finally:
+        try:
+            events.close_writer(prediction_output_path)
+        except Exception as e:
+            print(f"Error writing events: {e}")
+        forget_job(job_id)
         try:
             if cap is not None:
                 cap.release()
@@ -140,11 +381,40 @@ def _process_video_file(input_path: str, output_path: str, skeleton_output_path,
             pass
         try:
             if pose_model is not None:
-                pose_model.close()
+                models.release(pose_model)
+            if client is not None:
+                client.close()
         except Exception:
             pass
 
-def start_processing(input_path: str, output_path: str, skeleton_output_path: str, job_id: str, model_path: str = "yolo11n-pose.pt"):
-    t = threading.Thread(target=_process_video_file, args=(input_path, output_path, skeleton_output_path, job_id, model_path), daemon=True)
-    t.start()
-    return t
\ No newline at end of file
+def start_processing(input_path: str, output_path: str, skeleton_output_path: str, job_id: str, model_path: str = "yolo11n-pose.pt", priority: int = 0, options: Optional[Dict[str, Any]] = None):
+    """Queue the job on the bounded scheduler; raises scheduler.QueueFullError when the queue is full."""
+    set_params(job_id, {
+        "input_path": input_path, "output_path": output_path, "skeleton_output_path": skeleton_output_path,
+        "model_path": model_path, "priority": priority, "options": options,
+    })
+    args = (input_path, output_path, skeleton_output_path, job_id, model_path, options)
+    if workers.enabled():
+        scheduler.submit(job_id, workers.run, job_id, *args, priority=priority)
+    else:
+        scheduler.submit(job_id, _process_video_file, *args, priority=priority)
+
+
+def recover_interrupted(requeue: bool = True) -> None:
+    """Re-queue (or fail) jobs that were pending or running when the server stopped."""
+    for job_id, params in interrupted_jobs():
+        if not requeue or not params or not Path(params["input_path"]).exists():
+            set_error(job_id, "Onderbroken door herstart")
+            continue
+        # the job starts over; drop the results of the interrupted run
+        folder = Path(params["output_path"]).parent
+        for name in ("prediction.txt", events.EVENTS_FILENAME):
+            try:
+                (folder / name).unlink()
+            except FileNotFoundError:
+                pass
+        set_fields(job_id, status="pending", progress=0, cancelled=False, error=None)
+        try:
+            start_processing(job_id=job_id, **params)
+        except scheduler.QueueFullError as e:
+            set_error(job_id, str(e))
@@ -0,0 +1,207 @@
+import multiprocessing as mp
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .jobs import set_fields, set_error, is_cancelled
+
+# Optional process-pool backend. Long-lived worker processes each keep their
+# own warm model (via carepattern.core.models) and run _process_video_file
+# outside the Flask process, so the GIL-bound parts of the analysis scale with
+# the number of cores. Job updates come back over an IPC queue and are applied
+# to the job registry of this process.
+#
+# Every worker has its own task queue and a job is assigned to a worker when
+# it is dispatched, not when the worker reports it started: a worker that dies
+# at any point fails the job it holds, so ``run`` never waits for a job that
+# no process is running.
+
+_ctx = mp.get_context("spawn")
+_lock = threading.Condition()
+_workers: List["_Worker"] = []
+_pending: Dict[str, threading.Event] = {}
+_events = None
+_started = False
+
+_POLL_SECONDS = 0.5
+
+_config = {
+    "workers": 2,
+    "model_path": None,
+    "model_settings": {},
+    "export_settings": {},
+    "pool_size": 1,
+}
+
+
+def _worker_main(index: int, tasks, events, cancel_flag, model_path: Optional[str],
+                 model_settings: Optional[Dict[str, Any]] = None, export_settings: Optional[Dict[str, Any]] = None,
+                 pool_size: int = 1) -> None:
+    from . import export, jobs, models
+    from .video import _process_video_file
+
+    jobs.set_forwarder(
+        lambda job_id, fields: events.put(("update", index, job_id, fields)),
+        lambda job_id: bool(cancel_flag.value),
+    )
+    # the inference backend; exports are shared with the other processes through the export cache
+    export.configure(**(export_settings or {}))
+    # a worker runs one job at a time; more instances only for the segments of a segmented job
+    models.configure(pool_size=pool_size)
+    if model_path:
+        models.preload(model_path, count=1, **(model_settings or {}))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, args = task
+        cancel_flag.value = 0
+        try:
+            _process_video_file(*args)
+        except Exception as e:
+            events.put(("update", index, job_id, {"status": "error", "error": str(e)}))
+        finally:
+            events.put(("finish", index, job_id, None))
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.cancel_flag = _ctx.Value("b", 0)
+        self.job_id: Optional[str] = None
+        self.tasks = None
+        self.process = None
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self) -> None:
+        self.job_id = None
+        self.cancel_flag.value = 0
+        # a fresh queue: whatever the previous process left in its queue is gone with it
+        self.tasks = _ctx.Queue()
+        self.process = _ctx.Process(
+            target=_worker_main,
+            args=(self.index, self.tasks, _events, self.cancel_flag, _config["model_path"], _config["model_settings"],
+                  _config["export_settings"], _config["pool_size"]),
+            name=f"carepattern-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+
+
+def configure(workers: Optional[int] = None, model_path: Optional[str] = None,
+              model_settings: Optional[Dict[str, Any]] = None, export_settings: Optional[Dict[str, Any]] = None,
+              pool_size: Optional[int] = None) -> None:
+    if workers is not None:
+        _config["workers"] = max(1, int(workers))
+    if model_path is not None:
+        _config["model_path"] = model_path
+    if model_settings is not None:
+        _config["model_settings"] = dict(model_settings)
+    if export_settings is not None:
+        _config["export_settings"] = dict(export_settings)
+    if pool_size is not None:
+        _config["pool_size"] = max(1, int(pool_size))
+
+
+def start() -> None:
+    global _events, _started
+    with _lock:
+        if _started:
+            return
+        _events = _ctx.Queue()
+        for i in range(_config["workers"]):
+            w = _Worker(i)
+            w.start()
+            _workers.append(w)
+        _started = True
+    threading.Thread(target=_listen, name="worker-events", daemon=True).start()
+    threading.Thread(target=_monitor, name="worker-monitor", daemon=True).start()
+
+
+def enabled() -> bool:
+    return _started
+
+
+def _listen() -> None:
+    while True:
+        try:
+            kind, index, job_id, fields = _events.get()
+        except (EOFError, OSError):
+            return
+        with _lock:
+            # late messages of a worker that was replaced meanwhile are dropped;
+            # its job has already been failed
+            current = _workers[index].job_id == job_id
+            if current and kind == "finish":
+                _workers[index].job_id = None
+                done = _pending.pop(job_id, None)
+                _lock.notify_all()
+        if not current:
+            continue
+        if kind == "update":
+            set_fields(job_id, **fields)
+        elif kind == "finish" and done is not None:
+            done.set()
+
+
+def _replace_dead() -> None:
+    """Fail the job of every crashed worker (segfault, OOM kill, ...) and start a new process."""
+    failed = []
+    with _lock:
+        for w in _workers:
+            if w.process is None or w.alive():
+                continue
+            exitcode = w.process.exitcode
+            job_id = w.job_id
+            w.start()
+            if job_id:
+                failed.append((job_id, exitcode, _pending.pop(job_id, None)))
+        if failed:
+            _lock.notify_all()
+    for job_id, exitcode, done in failed:
+        set_error(job_id, f"Worker proces gestopt (exitcode {exitcode})")
+        if done is not None:
+            done.set()
+
+
+def _monitor() -> None:
+    while True:
+        time.sleep(_POLL_SECONDS)
+        with _lock:
+            workers = list(_workers)
+        for w in workers:
+            job_id = w.job_id
+            if job_id and is_cancelled(job_id):
+                w.cancel_flag.value = 1
+        _replace_dead()
+
+
+def run(job_id: str, *args: Any) -> None:
+    """Run ``_process_video_file(*args)`` in a worker process and block until it finishes."""
+    done = threading.Event()
+    with _lock:
+        # the scheduler runs at most one job per worker; a worker being replaced is free shortly
+        while True:
+            worker = next((w for w in _workers if w.job_id is None and w.alive()), None)
+            if worker is not None:
+                break
+            _lock.wait(_POLL_SECONDS)
+        worker.job_id = job_id
+        _pending[job_id] = done
+        worker.tasks.put((job_id, args))
+    # bounded waits: the job ends with the worker's "finish" or with the
+    # worker's death, noticed here even if the monitor thread is stuck
+    while not done.wait(_POLL_SECONDS * 4):
+        _replace_dead()
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "workers": len(_workers),
+            "busy": sum(1 for w in _workers if w.job_id),
+            "alive": sum(1 for w in _workers if w.alive()),
+        }
@@ -0,0 +1,198 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+
+from . import detect, events
+
+# Zone-aware analysis. Every camera can have named regions (bed, chair, ...)
+# as polygons in coordinates relative to the frame (0..1, so they hold for
+# any resolution). Per analysed frame every tracked person is located with an
+# STRtree over the zones and prepared polygons; a person counts as in a zone
+# when the midpoint of the hips (the box centre when the hips aren't visible)
+# lies inside it. Entering and leaving a zone must hold for
+# ``confirm_seconds`` before it is logged, as an event next to the posture
+# transitions of detect.Person:
+#
+#   outside -> bed    (event "enter")
+#   bed -> outside    (event "exit")
+#
+# The union bounding box of the zones can also serve as region of interest:
+# inference then only sees that part of the frame (see ``roi_box``).
+
+OUTSIDE = "outside"
+
+LEFT_HIP, RIGHT_HIP = 11, 12
+
+
+def parse_polygon(text: str) -> List[Tuple[float, float]]:
+    """``"x1,y1 x2,y2 ..."`` (the config format) as a list of points."""
+    points = []
+    for pair in text.split():
+        x, y = pair.split(",")
+        points.append((float(x), float(y)))
+    if len(points) < 3:
+        raise ValueError(f"Een zone heeft minstens 3 punten nodig: {text!r}")
+    return points
+
+
+def anchor_points(boxes: np.ndarray, keypoints: Optional[np.ndarray], keypoint_conf: float = 0.3) -> np.ndarray:
+    """(N, 2) point per person: midpoint of the hips, else the centre of the box."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(len(boxes), -1)
+    points = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2.0, (boxes[:, 1] + boxes[:, 3]) / 2.0], axis=1)
+    if keypoints is None or not len(points):
+        return points
+    kps = np.asarray(keypoints, dtype=np.float64)
+    hips = kps[:, [LEFT_HIP, RIGHT_HIP]]
+    visible = (hips[..., 2] >= keypoint_conf).all(axis=1) if kps.shape[-1] > 2 else np.ones(len(kps), dtype=bool)
+    points[visible] = hips[visible, :, :2].mean(axis=1)
+    return points
+
+
+class ZoneIndex:
+    """The zones of one camera, scaled to a frame size, indexed for point queries."""
+
+    def __init__(self, zones: Dict[str, Sequence[Sequence[float]]], width: int, height: int):
+        self.names = list(zones)
+        scale = np.array([width, height], dtype=np.float64)
+        self.polygons = np.array([shapely.Polygon(np.asarray(zones[n], dtype=np.float64) * scale) for n in self.names])
+        shapely.prepare(self.polygons)
+        self.tree = shapely.STRtree(self.polygons)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def locate(self, points: np.ndarray) -> np.ndarray:
+        """(N, Z) bool: point n lies inside zone z."""
+        inside = np.zeros((len(points), len(self.names)), dtype=bool)
+        if not len(points) or not self.names:
+            return inside
+        geoms = shapely.points(np.asarray(points, dtype=np.float64))
+        # the tree narrows down to zones whose bounding box holds the point,
+        # the prepared polygons settle those candidates
+        point_idx, zone_idx = self.tree.query(geoms)
+        if len(point_idx):
+            hit = shapely.contains(self.polygons[zone_idx], geoms[point_idx])
+            inside[point_idx[hit], zone_idx[hit]] = True
+        return inside
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return tuple(shapely.total_bounds(self.polygons))
+
+
+def roi_box(zones: Dict[str, Sequence[Sequence[float]]], width: int, height: int,
+            padding: float = 0.05) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Pixel box ``(x1, y1, x2, y2)`` around all zones, widened by ``padding``
+    (relative to the frame) so persons on the edge of a zone are seen whole;
+    None without zones or when the box covers the whole frame anyway.
+    """
+    if not zones:
+        return None
+    x1, y1, x2, y2 = ZoneIndex(zones, width, height).bounds()
+    pad_x, pad_y = padding * width, padding * height
+    box = (max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+           min(width, int(np.ceil(x2 + pad_x))), min(height, int(np.ceil(y2 + pad_y))))
+    if box == (0, 0, width, height) or box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
+
+
+def crop(frame: np.ndarray, box: Optional[Tuple[int, int, int, int]]) -> np.ndarray:
+    if box is None:
+        return frame
+    x1, y1, x2, y2 = box
+    return np.ascontiguousarray(frame[y1:y2, x1:x2])
+
+
+def shift_results(results: Any, box: Optional[Tuple[int, int, int, int]], frame: np.ndarray) -> Any:
+    """Move ultralytics results of a ``crop`` back into the coordinates of the full ``frame``."""
+    if box is None or not results:
+        return results
+    from ultralytics.engine.results import Boxes, Keypoints
+
+    x1, y1 = box[0], box[1]
+    shape = frame.shape[:2]
+    for r in results:
+        r.orig_img = frame
+        r.orig_shape = shape
+        if r.boxes is not None:
+            data = r.boxes.data.clone()
+            data[:, :4] += data.new_tensor([x1, y1, x1, y1])
+            r.boxes = Boxes(data, shape)
+        if r.keypoints is not None:
+            data = r.keypoints.data.clone()
+            # undetected keypoints stay at 0, 0
+            found = (data[..., :2] != 0).any(dim=-1, keepdim=True)
+            data[..., :2] += data.new_tensor([x1, y1]) * found
+            r.keypoints = Keypoints(data, shape)
+    return results
+
+
+class ZoneMonitor:
+    """
+    Zone state of the persons in one job. Like detect.Person, a new track
+    starts in the zones it is first seen in without an event, and tracks not
+    seen for ``idle_frames`` frames are forgotten.
+    """
+
+    def __init__(self, index: ZoneIndex, output_path: Path, fps: float, stride: int = 1,
+                 confirm_seconds: float = 0.5, idle_frames: Optional[int] = None):
+        self.index = index
+        self.output_path = Path(output_path)
+        self.fps = fps
+        # in analysed frames, rounded up like detect.Thresholds
+        self.confirm_frames = -(-max(1, int(fps * confirm_seconds)) // max(1, stride))
+        self.idle_frames = detect.TRACK_IDLE_FRAMES if idle_frames is None else idle_frames
+        self.inside: Dict[int, np.ndarray] = {}    # confirmed zones per track
+        self.changing: Dict[int, np.ndarray] = {}  # analysed frames the zone has differed from ``inside``
+        self.last_seen: Dict[int, int] = {}
+        self.entered = 0
+        self.exited = 0
+
+    def _log(self, tid: int, zone: str, entered: bool, frame_number: int) -> None:
+        events.get_writer(self.output_path).write({
+            "frame": frame_number,
+            "time": detect.format_timestamp(frame_number, self.fps),
+            "track_id": tid,
+            "from": OUTSIDE if entered else zone,
+            "to": zone if entered else OUTSIDE,
+            "knee_angle": None,
+            "sitting_count": None,
+            "lying_count": None,
+            "note": f"{'Entered' if entered else 'Left'} zone {zone}",
+            "zone": zone,
+            "event": "enter" if entered else "exit",
+        })
+
+    def update(self, track_ids, boxes, keypoints, frame_number: int) -> None:
+        """One analysed frame of tracked persons; ``boxes`` as xyxy rows in frame pixels."""
+        ids = [int(t) for t in track_ids]
+        if ids:
+            located = self.index.locate(anchor_points(boxes, keypoints))
+            for tid, now in zip(ids, located):
+                self.last_seen[tid] = frame_number
+                inside = self.inside.get(tid)
+                if inside is None:
+                    self.inside[tid] = now.copy()
+                    self.changing[tid] = np.zeros(len(now), dtype=np.int32)
+                    continue
+                changing = self.changing[tid]
+                differs = now != inside
+                changing[differs] += 1
+                changing[~differs] = 0
+                for z in np.flatnonzero(changing >= self.confirm_frames):
+                    inside[z] = now[z]
+                    changing[z] = 0
+                    if now[z]:
+                        self.entered += 1
+                    else:
+                        self.exited += 1
+                    self._log(tid, self.index.names[z], bool(now[z]), frame_number)
+        if self.idle_frames:
+            for tid in [t for t, seen in self.last_seen.items() if frame_number - seen > self.idle_frames]:
+                del self.inside[tid], self.changing[tid], self.last_seen[tid]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"zones": self.index.names, "entered": self.entered, "exited": self.exited}
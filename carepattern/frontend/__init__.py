@@ -1,11 +1,16 @@
 import os
 import json
-from flask import Flask, flash, render_template, render_template_string, request, redirect, url_for, send_from_directory, jsonify
+import time
+from flask import Flask, Response, flash, render_template, render_template_string, request, redirect, url_for, send_from_directory, jsonify
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 
 from .config_loader import load_ini_config
-from carepattern.core.jobs import create_job, get_job
-from carepattern.core.video import start_processing
+from .upload_index import UploadIndex
+from carepattern.core.jobs import create_job, get_job, get_jobs, set_error
+from carepattern.core.video import start_processing, recover_interrupted
+from carepattern.core import batching, cache, detect, events, export, jobs, metrics, models, profiles, render, rescore, scheduler, uploads, workers, zones
+from carepattern.core.keypoints import KeypointArchive
 
 def create_app(config=None):
     app = Flask(__name__)
@@ -18,6 +23,50 @@ def create_app(config=None):
     # defaults
     app.config.setdefault('ALLOWED_EXTENSIONS', {'mp4'})
     app.config.setdefault('YOLO_POSE_MODEL', 'yolo11n-pose.pt')
+    app.config.setdefault('MODEL_POOL_SIZE', 1)
+    app.config.setdefault('MODEL_CACHE_SIZE', 2)
+    app.config.setdefault('MODEL_PRELOAD', True)
+    app.config.setdefault('MAX_CONCURRENT_JOBS', 2)
+    app.config.setdefault('MAX_QUEUED_JOBS', 20)
+    app.config.setdefault('EXECUTION_BACKEND', 'thread')
+    app.config.setdefault('PROCESS_WORKERS', 2)
+    app.config.setdefault('PIPELINE_QUEUE_SIZE', 8)
+    app.config.setdefault('SEGMENT_WORKERS', 1)
+    app.config.setdefault('SEGMENT_MIN_SECONDS', 600)
+    app.config.setdefault('SEGMENT_OVERLAP_FRAMES', 15)
+    app.config.setdefault('EVENT_FLUSH_EVENTS', 256)
+    app.config.setdefault('EVENT_FLUSH_SECONDS', 5.0)
+    app.config.setdefault('TRACK_IDLE_FRAMES', 300)
+    app.config.setdefault('RENDER_MODE', 'eager')
+    app.config.setdefault('JOB_STORE', 'memory')
+    app.config.setdefault('JOB_TTL_SECONDS', 86400)
+    app.config.setdefault('JOB_MAX_FINISHED', 1000)
+    app.config.setdefault('JOB_FLUSH_SECONDS', 2.0)
+    app.config.setdefault('JOB_RECOVERY', 'requeue')
+    app.config.setdefault('RESULT_CACHE', True)
+    app.config.setdefault('RESULT_CACHE_MAX_MB', 10240)
+    app.config.setdefault('UPLOADS_PER_PAGE', 25)
+    app.config.setdefault('VIDEO_FRAGMENT_SECONDS', 2.0)
+    app.config.setdefault('MAX_UPLOAD_MB', 8192)
+    app.config.setdefault('UPLOAD_CHUNK_MB', 16)
+    app.config.setdefault('UPLOAD_STALL_SECONDS', 600)
+    app.config.setdefault('UPLOAD_START_FRACTION', 0.5)
+    app.config.setdefault('DEFAULT_PROFILE', 'balanced')
+    app.config.setdefault('PROFILE_DEGRADE_QUEUE', 0)
+    app.config.setdefault('INFERENCE_BATCH_SIZE', 1)
+    app.config.setdefault('INFERENCE_BATCH_WAIT_MS', 5.0)
+    app.config.setdefault('TRACKER', 'ultralytics')
+    app.config.setdefault('MOTION_GATE', False)
+    app.config.setdefault('MOTION_MIN_CHANGED', 0.002)
+    app.config.setdefault('MOTION_MAX_SKIP_SECONDS', 2.0)
+    app.config.setdefault('ZONES', {})
+    app.config.setdefault('DEFAULT_CAMERA', '')
+    app.config.setdefault('ZONE_CONFIRM_SECONDS', 0.5)
+    app.config.setdefault('ZONE_ROI_CROP', False)
+    app.config.setdefault('ZONE_ROI_PADDING', 0.05)
+    app.config.setdefault('MODEL_BACKEND', 'pytorch')
+    app.config.setdefault('MODEL_EXPORT_INT8', False)
+    app.config.setdefault('MODEL_CALIBRATION_FRAMES', 300)
 
     try:
         os.makedirs(app.instance_path, exist_ok=True)
@@ -27,10 +76,244 @@ def create_app(config=None):
     except OSError:
         pass
 
+    store_kwargs = dict(ttl=app.config['JOB_TTL_SECONDS'], max_finished=app.config['JOB_MAX_FINISHED'])
+    if app.config['JOB_STORE'] == 'sqlite':
+        store_path = app.config.get('JOB_STORE_PATH') or os.path.join(app.instance_path, 'jobs.sqlite')
+        jobs.configure(jobs.SQLiteJobStore(store_path, flush_seconds=app.config['JOB_FLUSH_SECONDS'], **store_kwargs))
+    else:
+        jobs.configure(jobs.MemoryJobStore(**store_kwargs))
+    jobs.add_evict_listener(detect.forget_job)
+
+    index = UploadIndex(app.config['UPLOAD_FOLDER'], _load_upload_folder)
+    app.extensions['upload_index'] = index
+
+    def _job_finished(job_id, job):
+        params = job.get('_params')
+        if params:
+            index.invalidate_path(params['output_path'])
+            try:
+                _write_job_meta(os.path.dirname(params['output_path']), report=_job_report(job))
+            except Exception as e:
+                print(f"Error writing job report: {e}")
+            if job.get('status') == 'done' and (params.get('options') or {}).get('growing_size'):
+                # chunked uploads only know their content hash once complete; cache them here
+                _cache_finished_upload(os.path.dirname(params['output_path']))
+    jobs.add_finish_listener(_job_finished)
+    jobs.add_finish_listener(metrics.record_job)
+
+    if app.config['RESULT_CACHE']:
+        cache.configure(root=app.config.get('RESULT_CACHE_DIR') or os.path.join(app.instance_path, 'result_cache'),
+                        max_bytes=app.config['RESULT_CACHE_MAX_MB'] * 1024 * 1024)
+
+    # zone polygons as points; a malformed zone fails at startup instead of in a job
+    app.config['ZONES'] = {camera: {name: zones.parse_polygon(points) if isinstance(points, str) else points
+                                    for name, points in values.items()}
+                           for camera, values in app.config['ZONES'].items()}
+
+    profiles.configure(app.config.get('PROFILES'), default=app.config['DEFAULT_PROFILE'],
+                       degrade_queue=app.config['PROFILE_DEGRADE_QUEUE'])
+    # warm the model of the default profile with its inference settings
+    default_profile = profiles.get()
+    preload_model = default_profile['model'] or app.config['YOLO_POSE_MODEL']
+    preload_settings = profiles.inference_settings(default_profile)
+    # batched inference and the keypoint tracker use detection-only (predict) models
+    preload_settings['tracking'] = app.config['TRACKER'] != 'keypoint' and app.config['INFERENCE_BATCH_SIZE'] <= 1
+
+    events.configure(flush_events=app.config['EVENT_FLUSH_EVENTS'], flush_seconds=app.config['EVENT_FLUSH_SECONDS'])
+    # CPU backend: the pools load an ONNX/OpenVINO export of the weights, made once and cached on disk
+    export.configure(backend=app.config['MODEL_BACKEND'],
+                     cache_dir=app.config.get('MODEL_EXPORT_DIR') or os.path.join(app.instance_path, 'model_exports'),
+                     int8=app.config['MODEL_EXPORT_INT8'],
+                     calibration_dir=app.config.get('MODEL_CALIBRATION_DIR') or app.config.get('UPLOAD_FOLDER', ''),
+                     calibration_frames=app.config['MODEL_CALIBRATION_FRAMES'])
+    # every running job, and every segment of a segmented job, needs its own
+    # model instance, else jobs wait on each other's model; the pool may grow
+    # that far, MODEL_POOL_SIZE instances are warmed up in advance
+    pool_size = max(app.config['MODEL_POOL_SIZE'], app.config['SEGMENT_WORKERS'])
+    if app.config['EXECUTION_BACKEND'] != 'process':
+        # worker processes each run one job and have their own pool
+        pool_size = max(pool_size, app.config['MAX_CONCURRENT_JOBS'] * app.config['SEGMENT_WORKERS'])
+    models.configure(pool_size=pool_size, max_models=app.config['MODEL_CACHE_SIZE'])
+    batching.configure(max_batch=app.config['INFERENCE_BATCH_SIZE'], max_wait_ms=app.config['INFERENCE_BATCH_WAIT_MS'])
+    if app.config['EXECUTION_BACKEND'] == 'process':
+        # each worker process holds its own model; concurrency follows the worker count
+        workers.configure(workers=app.config['PROCESS_WORKERS'],
+                          model_path=preload_model if app.config['MODEL_PRELOAD'] else None,
+                          model_settings=preload_settings, export_settings=export.get_config(),
+                          pool_size=pool_size)
+        workers.start()
+        scheduler.configure(max_workers=app.config['PROCESS_WORKERS'], max_queue=app.config['MAX_QUEUED_JOBS'])
+    else:
+        scheduler.configure(max_workers=app.config['MAX_CONCURRENT_JOBS'], max_queue=app.config['MAX_QUEUED_JOBS'])
+        if app.config['MODEL_PRELOAD']:
+            models.preload(preload_model, count=app.config['MODEL_POOL_SIZE'], **preload_settings)
+
+    # with the debug reloader create_app also runs in the watcher process, which never serves requests
+    if not app.config.get('DEBUG') or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        recover_interrupted(requeue=app.config['JOB_RECOVERY'] == 'requeue')
+
     app = create_routes(app)
 
     return app
 
+def _camera(app, camera=None):
+    """The camera an upload was recorded with: the requested one when it has zones, else DEFAULT_CAMERA."""
+    if camera and camera in app.config['ZONES']:
+        return camera
+    return app.config['DEFAULT_CAMERA'] or None
+
+def _processing_options(app, profile_name=None, camera=None):
+    """Per-job processing options; plain values so they can be sent to worker processes."""
+    profile_name = profile_name or profiles.select()
+    camera = _camera(app, camera)
+    return {
+        "profile_name": profile_name,
+        "profile": profiles.get(profile_name),
+        "queue_size": app.config['PIPELINE_QUEUE_SIZE'],
+        "segment_workers": app.config['SEGMENT_WORKERS'],
+        "segment_min_seconds": app.config['SEGMENT_MIN_SECONDS'],
+        "segment_overlap": app.config['SEGMENT_OVERLAP_FRAMES'],
+        "event_flush_events": app.config['EVENT_FLUSH_EVENTS'],
+        "event_flush_seconds": app.config['EVENT_FLUSH_SECONDS'],
+        "track_idle_frames": app.config['TRACK_IDLE_FRAMES'],
+        "render_mode": app.config['RENDER_MODE'],
+        "fragment_seconds": app.config['VIDEO_FRAGMENT_SECONDS'],
+        "inference_batch": app.config['INFERENCE_BATCH_SIZE'],
+        "inference_batch_wait_ms": app.config['INFERENCE_BATCH_WAIT_MS'],
+        "tracker": app.config['TRACKER'],
+        "motion_gate": app.config['MOTION_GATE'],
+        "motion_min_changed": app.config['MOTION_MIN_CHANGED'],
+        "motion_max_skip_seconds": app.config['MOTION_MAX_SKIP_SECONDS'],
+        "camera": camera,
+        "zones": app.config['ZONES'].get(camera) or {},
+        "zone_confirm_seconds": app.config['ZONE_CONFIRM_SECONDS'],
+        "zone_roi_crop": app.config['ZONE_ROI_CROP'],
+        "zone_roi_padding": app.config['ZONE_ROI_PADDING'],
+    }
+
+def _model_path(app, options):
+    return options['profile']['model'] or app.config['YOLO_POSE_MODEL']
+
+def _cache_key(app, content_hash, profile_name=None, camera=None):
+    """Result cache key of an upload; None when the cache is disabled."""
+    if not cache.enabled():
+        return None
+    profile = profiles.get(profile_name)
+    settings = dict(track_idle_frames=app.config['TRACK_IDLE_FRAMES'], profile=profile, tracker=app.config['TRACKER'])
+    if app.config['MODEL_BACKEND'] != 'pytorch':
+        # exported (and quantized) models give slightly different keypoints
+        settings['backend'] = [app.config['MODEL_BACKEND'], app.config['MODEL_EXPORT_INT8']]
+    if app.config['MOTION_GATE']:
+        settings['motion'] = [app.config['MOTION_MIN_CHANGED'], app.config['MOTION_MAX_SKIP_SECONDS']]
+    camera_zones = app.config['ZONES'].get(_camera(app, camera))
+    if camera_zones:
+        settings['zones'] = [camera_zones, app.config['ZONE_CONFIRM_SECONDS'],
+                             app.config['ZONE_ROI_PADDING'] if app.config['ZONE_ROI_CROP'] else None]
+    return cache.cache_key(content_hash, profile['model'] or app.config.get('YOLO_POSE_MODEL'), detect.default_thresholds(),
+                           **settings)
+
+def _read_job_meta(folder):
+    job_meta = os.path.join(folder, 'job.json')
+    if not os.path.exists(job_meta):
+        return {}
+    with open(job_meta, 'r') as jf:
+        return json.load(jf)
+
+def _allowed_file(app, filename):
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() in app.config.get('ALLOWED_EXTENSIONS', set())
+
+def _write_job_meta(folder, **fields):
+    try:
+        meta = _read_job_meta(folder)
+    except Exception:
+        meta = {}
+    meta.update(fields)
+    with open(os.path.join(folder, 'job.json'), 'w') as jf:
+        json.dump(meta, jf)
+
+def _output_settings(profile):
+    """The profile's output settings, kept in job.json for rendering the videos later."""
+    return {"output_scale": float(profile.get('output_scale') or 1.0), "skeleton": bool(profile.get('skeleton', True))}
+
+def _render_options(folder):
+    """``output_scale``/``skeleton`` of an upload's job, for render.ensure_rendered."""
+    try:
+        meta = _read_job_meta(folder)
+    except Exception:
+        meta = {}
+    return dict(_output_settings(profiles.get(meta.get('profile'))),
+                **{k: meta[k] for k in ('output_scale', 'skeleton') if k in meta})
+
+def _cache_finished_upload(folder):
+    try:
+        key = _read_job_meta(folder).get('cache_key')
+        if key:
+            cache.store(key, folder)
+    except Exception as e:
+        print(f"Error storing results in cache: {e}")
+
+def _job_report(job):
+    """Timing report of a finished job, as saved in the upload's job.json"""
+    started = job.get('started_at')
+    stages = {}
+    for name, st in (job.get('stages') or {}).items():
+        hist = st.get('histogram') or {}
+        stages[name] = {k: v for k, v in st.items() if k != 'histogram'}
+        stages[name].update({k: v for k, v in hist.items() if k.endswith('_ms')})
+    return {
+        "status": job.get('status'),
+        "frames": job.get('frames'),
+        "seconds": round(time.time() - started, 3) if started else None,
+        "stages": stages,
+        "motion": job.get('motion'),
+        "zones": job.get('zones'),
+    }
+
+def _metric_gauges():
+    now = time.time()
+    fps = 0.0
+    for _, job in jobs.get_store().items():
+        started = job.get('started_at')
+        if job.get('status') not in jobs.TERMINAL_STATUSES and started and job.get('frames'):
+            fps += job['frames'] / max(1e-6, now - started)
+    sched = scheduler.get_stats()
+    load, warmup = {}, {}
+    for pool in models.get_stats():
+        labels = (("model", pool['model']), ("tracking", str(pool.get('tracking', True)).lower()))
+        if pool['load_seconds']:
+            load[labels] = round(pool['load_seconds'][-1], 3)
+        if pool['warmup_seconds']:
+            warmup[labels] = round(pool['warmup_seconds'][-1], 3)
+    batch_mean = {(("model", service['model']),): service['mean_batch'] for service in batching.get_stats()}
+    gauges = {
+        "carepattern_queue_depth": ("Jobs waiting in the queue", sched['queued']),
+        "carepattern_active_jobs": ("Jobs being processed", sched['running']),
+        "carepattern_max_workers": ("Jobs that can be processed at the same time", sched['max_workers']),
+        "carepattern_frames_per_second": ("Frames per second over all running jobs", round(fps, 2)),
+        "carepattern_model_load_seconds": ("Load time of the most recently loaded model instance", load),
+        "carepattern_model_warmup_seconds": ("Warm-up time of the most recently loaded model instance", warmup),
+        "carepattern_inference_batch_mean": ("Mean frames per batch of the shared inference service", batch_mean),
+    }
+    if workers.enabled():
+        gauges["carepattern_workers_alive"] = ("Live worker processes", workers.get_stats()['alive'])
+    return gauges
+
+def _upload_state(session):
+    return {"upload_id": session.upload_id, "offset": session.offset, "size": session.size,
+            "complete": session.complete, "job_id": session.job_id}
+
+def _is_active(job_id):
+    job = get_job(job_id) if job_id else None
+    return bool(job) and job.get('status') not in jobs.TERMINAL_STATUSES
+
+def _touch_cached(folder):
+    """Mark the cache entry behind an upload folder as viewed (for LRU eviction)."""
+    try:
+        cache.touch(_read_job_meta(folder).get('cache_key'))
+    except Exception:
+        pass
+
 def format_prediction_content(content):
     """Format prediction content for better readability"""
     if not content:
@@ -51,59 +334,93 @@ def format_prediction_content(content):
     # Join lines with simple newlines, no extra spacing
     return '\n'.join(lines) if lines else ""
 
+def format_events_content(event_list):
+    """Format structured events like format_prediction_content formats prediction.txt"""
+    return '\n'.join(events.format_event(e) for e in event_list)
+
+def _load_upload_folder(entry, entry_path):
+    """Root page data of one upload folder (cached by the upload index)."""
+    # Check alle mogelijke videobestanden
+    raw_video = None
+    uploaded = None
+    for ext in ['.mp4', '.MP4']:
+        raw_path = os.path.join(entry_path, f'raw{ext}')
+        if os.path.exists(raw_path):
+            raw_video = f"{entry}/raw{ext}"
+            uploaded = os.path.getmtime(raw_path)
+            break
+
+    folder_data = {
+        'name': entry,
+        'raw': raw_video,
+        'uploaded': uploaded,
+        'overlay': f"{entry}/overlay.mp4" if os.path.exists(os.path.join(entry_path, 'overlay.mp4')) else None,
+        'skeleton': f"{entry}/skeleton.mp4" if os.path.exists(os.path.join(entry_path, 'skeleton.mp4')) else None,
+        'prediction': f"{entry}/prediction.txt" if os.path.exists(os.path.join(entry_path, 'prediction.txt')) else None,
+        'prediction_content': None,
+        'keypoints': KeypointArchive.exists(entry_path),
+        'skeleton_enabled': True,
+        'job_id': None
+    }
+
+    # Lees prediction content, bij voorkeur uit de gestructureerde events
+    prediction_file = os.path.join(entry_path, 'prediction.txt')
+    event_list = None
+    try:
+        event_list = events.read_events(entry_path)
+    except Exception as e:
+        print(f"Error reading events file: {e}")
+    if event_list is not None:
+        folder_data['prediction_content'] = format_events_content(event_list)
+    elif os.path.exists(prediction_file):
+        try:
+            with open(prediction_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+                folder_data['prediction_content'] = format_prediction_content(content)
+        except Exception as e:
+            print(f"Error reading prediction file: {e}")
+            folder_data['prediction_content'] = "Fout bij laden van resultaten"
+
+    # Lees job id indien aanwezig
+    try:
+        folder_data['job_id'] = _read_job_meta(entry_path).get('job_id')
+    except Exception as e:
+        print(f"Error reading job meta: {e}")
+    folder_data['skeleton_enabled'] = _render_options(entry_path)['skeleton']
+
+    return folder_data
+
+def _job_ids_arg(limit=500):
+    """Job ids from a ``?ids=a,b`` query argument."""
+    ids = [i for i in request.args.get('ids', '').split(',') if i]
+    return ids[:limit]
+
+def _sse_message(job_id, job):
+    return f"data: {json.dumps(dict(job, job_id=job_id))}\n\n"
+
 def create_routes(app):
     @app.route('/')
     def render_root():
-        uploads_dir = app.config['UPLOAD_FOLDER']
+        index = app.extensions['upload_index']
         try:
-            folders = []
-            for entry in sorted(os.listdir(uploads_dir), reverse=True):  # Nieuwste eerst
-                entry_path = os.path.join(uploads_dir, entry)
-                if os.path.isdir(entry_path):
-                    # Check alle mogelijke videobestanden
-                    raw_video = None
-                    for ext in ['.mp4', '.MP4']:
-                        if os.path.exists(os.path.join(entry_path, f'raw{ext}')):
-                            raw_video = f"{entry}/raw{ext}"
-                            break
-
-                    folder_data = {
-                        'name': entry,
-                        'raw': raw_video,
-                        'overlay': f"{entry}/overlay.mp4" if os.path.exists(os.path.join(entry_path, 'overlay.mp4')) else None,
-                        'skeleton': f"{entry}/skeleton.mp4" if os.path.exists(os.path.join(entry_path, 'skeleton.mp4')) else None,
-                        'prediction': f"{entry}/prediction.txt" if os.path.exists(os.path.join(entry_path, 'prediction.txt')) else None,
-                        'prediction_content': None,
-                        'job_id': None
-                    }
-
-                    # Lees prediction content
-                    prediction_file = os.path.join(entry_path, 'prediction.txt')
-                    if os.path.exists(prediction_file):
-                        try:
-                            with open(prediction_file, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                folder_data['prediction_content'] = format_prediction_content(content)
-                        except Exception as e:
-                            print(f"Error reading prediction file: {e}")
-                            folder_data['prediction_content'] = "Fout bij laden van resultaten"
-
-                    # Lees job id indien aanwezig
-                    job_meta = os.path.join(entry_path, 'job.json')
-                    if os.path.exists(job_meta):
-                        try:
-                            with open(job_meta, 'r') as jf:
-                                j = json.load(jf)
-                                folder_data['job_id'] = j.get('job_id')
-                        except Exception as e:
-                            print(f"Error reading job meta: {e}")
-
-                    folders.append(folder_data)
+            listing = index.page(page=request.args.get('page', 1, type=int),
+                                 per_page=request.args.get('per_page', app.config['UPLOADS_PER_PAGE'], type=int),
+                                 sort=request.args.get('sort', 'name'),
+                                 order=request.args.get('order', 'desc'))
         except Exception as e:
             print(f"Error loading folders: {e}")
-            folders = []
+            listing = {"items": [], "page": 1, "pages": 1, "per_page": app.config['UPLOADS_PER_PAGE'],
+                       "total": 0, "sort": "name", "order": "desc"}
 
-        return render_template('root.html', folders=folders)
+        folders = listing["items"]
+        for folder_data in folders:
+            folder_data['job_active'] = _is_active(folder_data['job_id'])
+            if folder_data['keypoints'] and (not folder_data['overlay'] or
+                                             (folder_data['skeleton_enabled'] and not folder_data['skeleton'])):
+                folder_data['render_state'] = render.render_state(os.path.join(app.config['UPLOAD_FOLDER'], folder_data['name']),
+                                                                  skeleton=folder_data['skeleton_enabled'])
+
+        return render_template('root.html', folders=folders, listing=listing)
 
     @app.route('/config')
     def render_config():
@@ -111,10 +428,6 @@ def create_routes(app):
 
     @app.route('/upload', methods=['GET', 'POST'])
     def upload_file():
-        def allowed_file(filename):
-            return '.' in filename and \
-                filename.rsplit('.', 1)[1].lower() in app.config.get('ALLOWED_EXTENSIONS', set())
-
         if request.method == 'POST':
             if 'file' not in request.files:
                 flash('Geen bestand geselecteerd')
@@ -125,7 +438,13 @@ def create_routes(app):
                 flash('Geen bestand geselecteerd')
                 return redirect(request.url)
 
-            if file and allowed_file(file.filename):
+            if file and _allowed_file(app, file.filename):
+                if scheduler.is_full():
+                    # before the upload is written to disk; a result from the cache
+                    # is only possible once its content hash is known
+                    flash('Wachtrij is vol, probeer het later opnieuw', 'error')
+                    return _render_upload_form(), 429
+
                 filename = secure_filename(file.filename)
                 filename_no_ext = os.path.splitext(filename)[0]
                 file_ext = os.path.splitext(filename)[1]
@@ -133,27 +452,158 @@ def create_routes(app):
                 os.makedirs(file_folder, exist_ok=True)
 
                 save_path = os.path.join(file_folder, f'raw{file_ext}')
-                file.save(save_path)
-
-                job_id = create_job()
+                content_hash = cache.save_hashed(file.stream, save_path)
+                profile_name = profiles.select(request.form.get('profile'))
+                camera = _camera(app, request.form.get('camera'))
+                key = _cache_key(app, content_hash, profile_name, camera)
                 output_path = os.path.join(file_folder, 'overlay.mp4')
                 skeletons_path = os.path.join(file_folder, 'skeleton.mp4')
-                start_processing(save_path, output_path, skeletons_path, job_id, 
-                               model_path=app.config.get('YOLO_POSE_MODEL'))
+
+                if key and cache.lookup(key, file_folder):
+                    # same content analysed before with the same settings
+                    job_id = create_job()
+                    jobs.set_fields(job_id, status="done", progress=100, output=output_path, cached=True)
+                    message = 'Video succesvol geüpload. Resultaten zijn uit de cache geladen.'
+                else:
+                    cache.clear_artifacts(file_folder)
+                    options = _processing_options(app, profile_name, camera)
+                    if key:
+                        options.update(cache_key=key, cache_dir=str(cache.get_root()),
+                                       cache_max_bytes=app.config['RESULT_CACHE_MAX_MB'] * 1024 * 1024)
+                    job_id = create_job()
+                    try:
+                        start_processing(save_path, output_path, skeletons_path, job_id,
+                                         model_path=_model_path(app, options),
+                                         priority=request.form.get('priority', 0, type=int),
+                                         options=options)
+                    except scheduler.QueueFullError as e:
+                        set_error(job_id, str(e))
+                        flash(str(e), 'error')
+                        return _render_upload_form(), 429
+                    message = 'Video succesvol geüpload. Verwerking is gestart.'
 
                 try:
                     job_meta = os.path.join(file_folder, 'job.json')
                     with open(job_meta, 'w') as jf:
-                        json.dump({"job_id": job_id}, jf)
+                        json.dump(dict({"job_id": job_id, "content_hash": content_hash, "cache_key": key,
+                                        "profile": profile_name, "camera": camera},
+                                       **_output_settings(profiles.get(profile_name))), jf)
                 except Exception:
                     pass
 
-                flash('Video succesvol geüpload. Verwerking is gestart.', 'success')
+                app.extensions['upload_index'].invalidate(filename_no_ext)
+                flash(message, 'success')
                 return redirect(url_for('render_root'))
 
-        return render_template('uploads.html')
+        return _render_upload_form()
 
 
+    def _render_upload_form():
+        return render_template('uploads.html', profiles=profiles.names(), default_profile=app.config['DEFAULT_PROFILE'],
+                               cameras=sorted(app.config['ZONES']), default_camera=app.config['DEFAULT_CAMERA'])
+
+    @app.route('/upload/chunked', methods=['POST'])
+    def chunked_upload_create():
+        """Start a resumable upload; ``filename``, total ``size`` in bytes and optional ``profile``/``camera`` as JSON or form fields"""
+        data = request.get_json(silent=True) or request.form
+        filename = secure_filename(data.get('filename') or '')
+        try:
+            size = int(data.get('size') or 0)
+        except (TypeError, ValueError):
+            size = 0
+        if not filename or not _allowed_file(app, filename):
+            return jsonify({"error": "Bestandstype niet toegestaan"}), 400
+        if size <= 0:
+            return jsonify({"error": "Ongeldige bestandsgrootte"}), 400
+        if size > app.config['MAX_UPLOAD_MB'] * 1024 * 1024:
+            return jsonify({"error": "Bestand is te groot"}), 413
+        if scheduler.is_full():
+            return jsonify({"error": "Wachtrij is vol, probeer het later opnieuw"}), 429
+
+        filename_no_ext, file_ext = os.path.splitext(filename)
+        file_folder = os.path.join(app.config['UPLOAD_FOLDER'], filename_no_ext)
+        os.makedirs(file_folder, exist_ok=True)
+        cache.clear_artifacts(file_folder)
+        session = uploads.create_session(file_folder, f'raw{file_ext}', size)
+        with open(os.path.join(file_folder, 'job.json'), 'w') as jf:
+            json.dump({"upload_id": session.upload_id, "profile": data.get('profile'), "camera": data.get('camera')}, jf)
+        app.extensions['upload_index'].invalidate(filename_no_ext)
+        state = _upload_state(session)
+        state["chunk_size"] = app.config['UPLOAD_CHUNK_MB'] * 1024 * 1024
+        return jsonify(state), 201
+
+    @app.route('/upload/chunked/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+    def chunked_upload(upload_id):
+        """GET: offset to resume from; PUT: next chunk at ``?offset=``; DELETE: abort the upload"""
+        session = uploads.get_session(upload_id, app.config['UPLOAD_FOLDER'])
+        if session is None:
+            return jsonify({"error": "unknown upload"}), 404
+        if request.method == 'GET':
+            return jsonify(_upload_state(session))
+        if request.method == 'DELETE':
+            uploads.abort_session(session)
+            if session.job_id:
+                scheduler.cancel(session.job_id)
+            return jsonify(_upload_state(session))
+
+        length = request.content_length
+        if length is None:
+            return jsonify({"error": "Content-Length ontbreekt", "offset": session.offset}), 411
+        if length > app.config['UPLOAD_CHUNK_MB'] * 1024 * 1024:
+            return jsonify({"error": "Chunk is te groot", "offset": session.offset}), 413
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            offset = request.headers.get('Upload-Offset', type=int)
+        if offset != session.offset:
+            return jsonify({"error": "Verkeerde offset", "offset": session.offset}), 409
+
+        start_at = max(1, int(session.size * app.config['UPLOAD_START_FRACTION']))
+        if session.job_id is None and offset + length >= start_at:
+            # start analysing while the rest of the file is still arriving; only
+            # once enough has arrived, so a slow uploader doesn't hold a worker
+            # and a model for long. Started before the chunk is written: when the
+            # queue is full the chunk is refused and can be sent again later
+            error = _start_chunked_job(session)
+            if error:
+                return jsonify({"error": error, "offset": session.offset}), 429, {"Retry-After": "5"}
+        try:
+            session.write(offset, request.stream, length)
+        except uploads.UploadError as e:
+            return jsonify({"error": str(e), "offset": e.offset}), 409
+
+        if session.complete:
+            content_hash = session.content_hash()
+            meta = _read_job_meta(str(session.folder))
+            _write_job_meta(str(session.folder), content_hash=content_hash,
+                            cache_key=_cache_key(app, content_hash, meta.get('profile'), meta.get('camera')))
+            uploads.forget_session(upload_id)
+            job = get_job(session.job_id)
+            if job and job.get('status') == 'done':
+                # finished before the cache key was known
+                _cache_finished_upload(str(session.folder))
+        return jsonify(_upload_state(session))
+
+    def _start_chunked_job(session):
+        """Queue the analysis of a chunked upload; returns an error message when the queue is full."""
+        folder = str(session.folder)
+        meta = _read_job_meta(folder)
+        options = _processing_options(app, profiles.select(meta.get('profile')), meta.get('camera'))
+        options.update(growing_size=session.size, upload_stall_seconds=app.config['UPLOAD_STALL_SECONDS'])
+        job_id = create_job()
+        try:
+            start_processing(str(session.path), os.path.join(folder, 'overlay.mp4'), os.path.join(folder, 'skeleton.mp4'),
+                             job_id, model_path=_model_path(app, options), options=options)
+        except scheduler.QueueFullError as e:
+            set_error(job_id, str(e))
+            return str(e)
+        session.job_id = job_id
+        if not session.complete:
+            session.save()
+        _write_job_meta(folder, job_id=job_id, upload_id=session.upload_id, profile=options['profile_name'],
+                        camera=options['camera'], **_output_settings(options['profile']))
+        app.extensions['upload_index'].invalidate(session.folder.name)
+        return None
+
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
@@ -189,32 +639,57 @@ def create_routes(app):
           const statusUrl = `/yolo/status/${jobId}`;
           const resultUrl = `/yolo/result/${jobId}`;
 
+          let t = null;
+          let source = null;
+
+          function stop() {
+            if (t) clearInterval(t);
+            if (source) source.close();
+          }
+
+          function show(js) {
+            const p = js.progress || 0;
+            document.getElementById('fill').style.width = p + '%';
+            document.getElementById('percent').textContent = p + '%';
+
+            if (js.status === 'done') {
+              document.getElementById('spinner').textContent = 'Done';
+              document.getElementById('result').innerHTML = `<a href="${resultUrl}" target="_blank">Download overlay.mp4</a>`;
+              stop();
+            } else if (js.status === 'error') {
+              document.getElementById('spinner').textContent = 'Error';
+              document.getElementById('result').textContent = js.error || 'Processing error';
+              stop();
+            } else if (js.status === 'cancelled') {
+              document.getElementById('spinner').textContent = 'Cancelled';
+              stop();
+            }
+          }
+
           async function poll() {
             try {
               const r = await fetch(statusUrl);
               if (!r.ok) throw new Error('status fetch failed');
-              const js = await r.json();
-              const p = js.progress || 0;
-              document.getElementById('fill').style.width = p + '%';
-              document.getElementById('percent').textContent = p + '%';
-
-              if (js.status === 'done') {
-                document.getElementById('spinner').textContent = 'Done';
-                document.getElementById('result').innerHTML = `<a href="${resultUrl}" target="_blank">Download overlay.mp4</a>`;
-                clearInterval(t);
-              } else if (js.status === 'error') {
-                document.getElementById('spinner').textContent = 'Error';
-                document.getElementById('result').textContent = js.error || 'Processing error';
-                clearInterval(t);
-              }
+              show(await r.json());
             } catch (err) {
               console.error(err);
             }
           }
 
-          // Initial poll and regular polling
-          poll();
-          const t = setInterval(poll, 1500);
+          // Server push, with polling as fallback
+          if (window.EventSource) {
+            source = new EventSource(`/yolo/events?ids=${jobId}`);
+            source.onmessage = (e) => show(JSON.parse(e.data));
+            source.onerror = () => {
+              if (source.readyState === EventSource.CLOSED && !t) {
+                poll();
+                t = setInterval(poll, 1500);
+              }
+            };
+          } else {
+            poll();
+            t = setInterval(poll, 1500);
+          }
           </script>
         </body>
         </html>
@@ -229,6 +704,76 @@ def create_routes(app):
             return jsonify({"error": "unknown job"}), 404
         return jsonify(job)
 
+    @app.route('/yolo/status')
+    def yolo_status_batch():
+        """Status of several jobs (``?ids=a,b``); unknown jobs are null"""
+        return jsonify(get_jobs(_job_ids_arg()))
+
+    @app.route('/yolo/events')
+    def yolo_events():
+        """Server-Sent Events stream of job changes for ``?ids=a,b``, or for all jobs without ids"""
+        ids = _job_ids_arg()
+        # subscribe before taking the snapshot so no change falls in between
+        sub = jobs.subscribe(ids or None)
+        snapshot = {job_id: job for job_id, job in get_jobs(ids).items() if job is not None}
+        remaining = {job_id for job_id, job in snapshot.items() if job.get('status') not in jobs.TERMINAL_STATUSES}
+        if ids and not remaining:
+            # nothing left to follow: a 204 tells EventSource not to reconnect,
+            # the pages then read the final status once through /yolo/status
+            sub.close()
+            return Response(status=204)
+
+        def stream():
+            try:
+                yield "retry: 3000\n\n"
+                for job_id, job in snapshot.items():
+                    yield _sse_message(job_id, job)
+                while True:
+                    changes = sub.get(timeout=15)
+                    if not changes:
+                        # also notices clients that went away
+                        yield ": keep-alive\n\n"
+                        continue
+                    for job_id, job in changes:
+                        yield _sse_message(job_id, job)
+                        if job.get('status') in jobs.TERMINAL_STATUSES:
+                            remaining.discard(job_id)
+                    if ids and not remaining:
+                        return
+            finally:
+                sub.close()
+
+        return Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/yolo/cancel/<job_id>', methods=['POST'])
+    def yolo_cancel(job_id):
+        if not get_job(job_id):
+            return jsonify({"error": "unknown job"}), 404
+        if not scheduler.cancel(job_id):
+            return jsonify({"error": "job is not queued or running"}), 409
+        return jsonify(get_job(job_id))
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus metrics; ``?format=json`` for the same data as JSON"""
+        gauges = _metric_gauges()
+        if request.args.get('format') == 'json':
+            data = metrics.snapshot()
+            data['gauges'] = {}
+            for name, (_, value) in gauges.items():
+                if isinstance(value, dict):
+                    # labelled gauge: key by the label values
+                    value = {"/".join(str(v) for _, v in labels): v for labels, v in value.items()}
+                data['gauges'][name] = value
+            return jsonify(data)
+        return Response(metrics.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+    # loaded models with load/warm-up timings
+    @app.route('/yolo/models')
+    def yolo_models():
+        return jsonify(models.get_stats())
+
     # download endpoint for completed output
     @app.route('/yolo/result/<job_id>')
     def yolo_result(job_id):
@@ -242,6 +787,8 @@ def create_routes(app):
             return "file missing", 404
         p = os.path.abspath(output_path)
         if not os.path.exists(p):
+            if render.ensure_rendered(os.path.dirname(p), **_render_options(os.path.dirname(p))) == "rendering":
+                return jsonify({"status": "rendering"}), 202, {"Retry-After": "5"}
             return "file missing", 404
         return send_from_directory(directory=os.path.dirname(p), path=os.path.basename(p), as_attachment=True)
 
@@ -251,15 +798,64 @@ def create_routes(app):
         try:
             directory = os.path.dirname(path)
             filename = os.path.basename(path)
-            video_path = os.path.join(app.config['UPLOAD_FOLDER'], directory)
-            return send_from_directory(video_path, filename)
+            video_path = safe_join(app.config['UPLOAD_FOLDER'], directory)
+            if video_path is None:
+                return "Video niet gevonden", 404
+            _touch_cached(video_path)
+            if filename in render.OUTPUTS and not os.path.exists(os.path.join(video_path, filename)):
+                # analysis-only job: render on first request, shared with concurrent viewers
+                options = _render_options(video_path)
+                if filename not in render.outputs(options['skeleton']):
+                    return "Video niet gevonden", 404
+                state = render.ensure_rendered(video_path, **options)
+                if state in ("rendering", "error"):
+                    return jsonify({"status": state}), 202 if state == "rendering" else 500, {"Retry-After": "5"}
+            # Range requests and If-None-Match/If-Modified-Since are handled by send_file.
+            # Always revalidated: the output of a running job is still growing, and a
+            # re-upload or re-render under the same name replaces the file, which changes
+            # the ETag (mtime and size); an unchanged video costs a 304
+            response = send_from_directory(video_path, filename, conditional=True, etag=True, max_age=0)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Accept-Ranges'] = 'bytes'
+            return response
         except Exception as e:
             print(f"Error serving video: {e}")
             return "Video niet gevonden", 404
 
+    @app.route('/render/<path:name>', methods=['GET', 'POST'])
+    def render_video(name):
+        """Status of (POST: start) on-demand rendering of an upload's overlay and skeleton videos"""
+        folder = safe_join(app.config['UPLOAD_FOLDER'], name)
+        if folder is None or not os.path.isdir(folder):
+            return jsonify({"error": "unknown upload"}), 404
+        options = _render_options(folder)
+        if request.method == 'POST':
+            state = render.ensure_rendered(folder, **options)
+        else:
+            state = render.render_state(folder, skeleton=options['skeleton'])
+        return jsonify({"status": state})
+
+    @app.route('/rescore/<path:name>', methods=['POST'])
+    def rescore_upload(name):
+        """Re-score an upload's keypoint archive with other detection thresholds"""
+        folder = safe_join(app.config['UPLOAD_FOLDER'], name)
+        if folder is None or not KeypointArchive.exists(folder):
+            return jsonify({"error": "no keypoint archive"}), 404
+        try:
+            thresholds = rescore.thresholds_from_mapping(request.get_json(silent=True) or request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        found = rescore.rescore(folder, thresholds)
+        return jsonify({
+            "thresholds": thresholds._asdict(),
+            "events": found,
+            "content": format_events_content(found),
+        })
+
     @app.route('/prediction/<path:path>')
     def prediction(path):
         """Serve prediction text files from the upload folder"""
+        _touch_cached(os.path.join(app.config['UPLOAD_FOLDER'], os.path.dirname(path)))
         return send_from_directory(app.config['UPLOAD_FOLDER'], path)
 
     if app.config.get('DEBUG', False):
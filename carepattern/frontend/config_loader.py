@@ -31,4 +31,24 @@ def load_ini_config(app, path="config.ini"):
         return
 
     cfg = {key.upper(): _parse_value(value) for key, value in items}
+
+    # performance profiles: one [profile:<name>] section per profile
+    profiles = {}
+    for section in parser.sections():
+        if section.startswith("profile:"):
+            profiles[section.split(":", 1)[1].strip()] = {
+                key: _parse_value(value) for key, value in parser.items(section) if key not in parser.defaults()
+            }
+    if profiles:
+        cfg["PROFILES"] = profiles
+
+    # zones per camera: one [zones:<camera>] section with ``name = x1,y1 x2,y2 ...``
+    zones = {}
+    for section in parser.sections():
+        if section.startswith("zones:"):
+            zones[section.split(":", 1)[1].strip()] = {
+                key: value.strip() for key, value in parser.items(section) if key not in parser.defaults()
+            }
+    if zones:
+        cfg["ZONES"] = zones
     app.config.update(cfg)
@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# In-memory index of the upload folders for the root page. An entry is only
+# rebuilt (files checked, prediction summary formatted) when the folder's
+# mtime changed or it was invalidated, e.g. because its job finished; files
+# appended to in place (events of a running job) don't change the mtime.
+
+SORT_KEYS = {
+    "name": lambda e: e["name"],
+    "date": lambda e: e["uploaded"] or 0,
+}
+
+
+class UploadIndex:
+    def __init__(self, root: str, load_entry: Callable[[str, str], Dict[str, Any]]):
+        self.root = root
+        self.load_entry = load_entry
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # name -> (folder mtime, entry)
+        self._stale: set = set()
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Rebuild ``name`` (or every entry) on the next listing."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._stale.add(name)
+
+    def invalidate_path(self, path: str) -> None:
+        """Invalidate the upload folder containing ``path``."""
+        rel = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        if not rel.startswith(".."):
+            self.invalidate(rel.split(os.sep)[0])
+
+    def _refresh(self) -> List[Dict[str, Any]]:
+        seen = {}
+        with os.scandir(self.root) as it:
+            for d in it:
+                if d.is_dir():
+                    seen[d.name] = d.stat().st_mtime
+        with self._lock:
+            stale, self._stale = self._stale, set()
+            for name in list(self._entries):
+                if name not in seen:
+                    del self._entries[name]
+            todo = [name for name, mtime in seen.items()
+                    if name in stale or name not in self._entries or self._entries[name][0] != mtime]
+        for name in todo:
+            try:
+                entry = self.load_entry(name, os.path.join(self.root, name))
+            except Exception as e:
+                print(f"Error indexing upload {name}: {e}")
+                continue
+            with self._lock:
+                self._entries[name] = (seen[name], entry)
+        with self._lock:
+            return [entry for _, entry in self._entries.values()]
+
+    def page(self, page: int = 1, per_page: int = 25, sort: str = "name", order: str = "desc") -> Dict[str, Any]:
+        """One page of entries, sorted by ``sort`` (see SORT_KEYS)."""
+        entries = self._refresh()
+        if sort not in SORT_KEYS:
+            sort = "name"
+        entries.sort(key=SORT_KEYS[sort], reverse=order != "asc")
+        per_page = max(1, per_page)
+        pages = max(1, -(-len(entries) // per_page))
+        page = min(max(1, page), pages)
+        start = (page - 1) * per_page
+        return {
+            "items": [dict(e) for e in entries[start:start + per_page]],
+            "page": page,
+            "pages": pages,
+            "per_page": per_page,
+            "total": len(entries),
+            "sort": sort,
+            "order": "asc" if order == "asc" else "desc",
+        }